@@ -0,0 +1,65 @@
+"""Compare two results of benchmarks/e2e.py and report the regressions.
+
+A metric regresses when it gets worse by more than the threshold percent,
+throughputs should go up, latencies and memory should go down.
+Exits with 1 when any metric regresses, so it could gate a build.
+
+usage: python benchmarks/compare.py base.json head.json [--threshold 10]
+"""
+import argparse
+import json
+import sys
+
+HIGHER_IS_BETTER = ("requests_per_sec", "handshakes_per_sec")
+LOWER_IS_BETTER = ("p50_ms", "p99_ms", "rss_per_connection")
+
+
+def compare(base_results, head_results, threshold):
+    """Compare the metrics of the benchmarks in both results.
+
+    Returns:
+        (list): [(benchmark, metric, base, head, change percent, regressed)]
+    """
+    rows = []
+    for name in sorted(set(base_results) & set(head_results)):
+        for metric in HIGHER_IS_BETTER + LOWER_IS_BETTER:
+            base = base_results[name].get(metric)
+            head = head_results[name].get(metric)
+            if not base or head is None:
+                continue
+
+            change = (head - base) * 100.0 / base
+            if metric in HIGHER_IS_BETTER:
+                regressed = change < -threshold
+            else:
+                regressed = change > threshold
+            rows.append((name, metric, base, head, change, regressed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=10)
+    args = parser.parse_args()
+
+    with open(args.base) as fp:
+        base = json.load(fp)
+    with open(args.head) as fp:
+        head = json.load(fp)
+
+    print "base: {0}, head: {1}".format(base.get("commit"), head.get("commit"))
+    rows = compare(base["results"], head["results"], args.threshold)
+    for name, metric, base_value, head_value, change, regressed in rows:
+        print "{0:<24} {1:<20} {2:>12} {3:>12} {4:>+8.1f}%{5}".format(
+            name, metric, base_value, head_value, change,
+            "  REGRESSION" if regressed else "")
+
+    regressions = sum(1 for row in rows if row[-1])
+    print "{0} regressions in {1} metrics".format(regressions, len(rows))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
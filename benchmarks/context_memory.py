@@ -0,0 +1,67 @@
+"""Measure the memory used by the contexts of idle keep-alive connections.
+
+An idle http/1 connection keeps one LayerContext copy per layer
+and the last request and response with their headers.
+
+usage: python benchmarks/context_memory.py [--connections 100000]
+"""
+import argparse
+import gc
+import resource
+from copy import copy
+
+from microproxy.context import LayerContext, HttpRequest, HttpResponse
+
+LAYERS = 3
+
+
+def current_rss():
+    try:
+        with open("/proc/self/statm") as fp:
+            return int(fp.read().split()[1]) * resource.getpagesize()
+    except IOError:
+        # NOTE: not linux, the max rss is good enough when memory only grows.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def create_connection(index):
+    context = LayerContext(
+        mode="socks", scheme="http", host="host{0}.example.com".format(index), port=80)
+    contexts = [context]
+    for _ in range(LAYERS - 1):
+        contexts.append(copy(contexts[-1]))
+
+    request = HttpRequest(
+        version="HTTP/1.1", method="GET", path="/index",
+        headers=[("Host", context.host),
+                 ("User-Agent", "benchmark"),
+                 ("Accept", "*/*"),
+                 ("Connection", "keep-alive")])
+    response = HttpResponse(
+        version="HTTP/1.1", code="200", reason="OK",
+        headers=[("Content-Type", "text/html"),
+                 ("Content-Length", "0"),
+                 ("Connection", "keep-alive")])
+    # NOTE: lookups build the header index of the headers.
+    "connection" in request.headers
+    "connection" in response.headers
+    return (contexts, request, response)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--connections", type=int, default=100000)
+    args = parser.parse_args()
+
+    gc.collect()
+    before = current_rss()
+    connections = [create_connection(i) for i in range(args.connections)]
+    gc.collect()
+    after = current_rss()
+
+    print "connections: {0}, memory per idle connection: {1} bytes".format(
+        len(connections), (after - before) / len(connections))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,521 @@
+"""Measure mpserver end to end against local origin servers in every proxy mode.
+
+For every mode, mpserver is started in a subprocess next to the origins of
+benchmarks/origin.py and driven by a closed-loop load generator:
+- http1, https, h2: keep-alive exchanges, requests/sec and p50/p99 latency.
+- handshake: a new tls connection per exchange, handshakes/sec.
+- idle: idle tls connections, the rss of mpserver per connection.
+
+The transparent mode is simulated by resolving the original destination to the
+origin, so no iptables rules are needed. The replay mode sends replay events
+and waits for the replayed exchanges published on the viewer channel,
+so its latency includes the publish interval.
+
+The results are saved as json, compare two of them by benchmarks/compare.py.
+
+usage: python benchmarks/e2e.py [--modes socks,http,transparent,replay] [--duration 5]
+                                [--concurrency 10] [--connections 200] [--output e2e.json]
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import socket
+import ssl
+import struct
+import subprocess
+import sys
+import time
+from datetime import timedelta
+
+import zmq
+from h2.connection import H2Connection
+from h2.events import DataReceived, StreamEnded
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.iostream import IOStream
+from zmq.eventloop.zmqstream import ZMQStream
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+# NOTE: run from the checkout, microproxy does not have to be installed.
+sys.path.insert(0, ROOT_DIR)
+
+from microproxy.context import Event  # noqa: E402
+from microproxy.event import EventClient, REPLAY  # noqa: E402
+from microproxy.utils import curr_loop, monotonic  # noqa: E402
+
+CERTFILE = os.path.join(ROOT_DIR, "microproxy", "test", "test.crt")
+KEYFILE = os.path.join(ROOT_DIR, "microproxy", "test", "test.key")
+HOST = "127.0.0.1"
+# NOTE: seconds to wait for a connection or an exchange before counting it as an error
+TIMEOUT = 10
+
+MODES = ["socks", "http", "transparent", "replay"]
+SCENARIOS = ["http1", "https", "h2", "handshake", "idle"]
+REPLAY_SCENARIOS = ["http1", "https", "h2"]
+
+# NOTE: the original destination of the transparent mode is given by
+# BENCHMARK_ORIGINAL_DST instead of the SO_ORIGINAL_DST of iptables.
+PROXY_SCRIPT = """
+import os
+import sys
+
+if os.environ.get("BENCHMARK_ORIGINAL_DST"):
+    from microproxy.layer import TransparentLayer
+    host, port = os.environ["BENCHMARK_ORIGINAL_DST"].split(":")
+    TransparentLayer._get_dest_addr_resolver = lambda self: lambda: (host, int(port))
+
+from microproxy.command_line import mpserver
+sys.argv[0] = "mpserver"
+mpserver()
+"""
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind((HOST, 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def wait_port(port, process, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("process exited with {0}".format(process.returncode))
+        try:
+            socket.create_connection((HOST, port), 0.5).close()
+            return
+        except socket.error:
+            time.sleep(0.05)
+    raise RuntimeError("port {0} is not listening".format(port))
+
+
+def process_rss(pid):
+    with open("/proc/{0}/statm".format(pid)) as fp:
+        return int(fp.read().split()[1]) * resource.getpagesize()
+
+
+def percentile(sorted_values, ratio):
+    if not sorted_values:
+        return None
+    index = min(int(len(sorted_values) * ratio), len(sorted_values) - 1)
+    return round(sorted_values[index] * 1000, 3)
+
+
+def summarize(latencies, errors, duration, rate_name):
+    latencies = sorted(latencies)
+    return {
+        rate_name: round(len(latencies) / duration, 1),
+        "p50_ms": percentile(latencies, 0.5),
+        "p99_ms": percentile(latencies, 0.99),
+        "requests": len(latencies),
+        "errors": errors,
+    }
+
+
+def create_ssl_context(alpn):
+    ssl_context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+    ssl_context.verify_mode = ssl.CERT_NONE
+    ssl_context.set_alpn_protocols([alpn])
+    return ssl_context
+
+
+class Client(object):
+    """Client: One connection to an origin through the proxy.
+
+    protocol is http1, https or h2, the exchanges of a connection are sequential.
+    """
+    def __init__(self, mode, proxy_port, origin_port, protocol):
+        super(Client, self).__init__()
+        self.mode = mode
+        self.proxy_port = proxy_port
+        self.origin_port = origin_port
+        self.protocol = protocol
+        self.stream = None
+        self.h2_conn = None
+
+    def connect(self):
+        return gen.with_timeout(timedelta(seconds=TIMEOUT), self._connect())
+
+    def request(self):
+        return gen.with_timeout(timedelta(seconds=TIMEOUT), self._request())
+
+    @gen.coroutine
+    def _connect(self):
+        self.stream = IOStream(socket.socket())
+        yield self.stream.connect((HOST, self.proxy_port))
+        self.stream.set_nodelay(True)
+
+        if self.mode == "socks":
+            yield self.stream.write(b"\x05\x01\x00")
+            yield self.stream.read_bytes(2)
+            yield self.stream.write(b"\x05\x01\x00\x01" + socket.inet_aton(HOST) +
+                                    struct.pack("!H", self.origin_port))
+            reply = yield self.stream.read_bytes(10)
+            if reply[1] != b"\x00":
+                raise RuntimeError("socks connect failed")
+        elif self.mode == "http" and self.protocol != "http1":
+            yield self.stream.write(
+                b"CONNECT {0}:{1} HTTP/1.1\r\nHost: {0}:{1}\r\n\r\n".format(
+                    HOST, self.origin_port))
+            yield self.read_http1_response()
+
+        if self.protocol != "http1":
+            alpn = "h2" if self.protocol == "h2" else "http/1.1"
+            self.stream = yield self.stream.start_tls(
+                False, ssl_options=create_ssl_context(alpn), server_hostname="localhost")
+
+        if self.protocol == "h2":
+            self.h2_conn = H2Connection(client_side=True)
+            self.h2_conn.initiate_connection()
+            yield self.stream.write(self.h2_conn.data_to_send())
+
+    def close(self):
+        if self.stream:
+            self.stream.close()
+
+    @gen.coroutine
+    def _request(self):
+        if self.protocol == "h2":
+            yield self.request_http2()
+            return
+
+        if self.mode == "http" and self.protocol == "http1":
+            path = "http://{0}:{1}/".format(HOST, self.origin_port)
+        else:
+            path = "/"
+        yield self.stream.write(
+            b"GET {0} HTTP/1.1\r\nHost: {1}:{2}\r\n\r\n".format(path, HOST, self.origin_port))
+        yield self.read_http1_response()
+
+    @gen.coroutine
+    def read_http1_response(self):
+        headers = yield self.stream.read_until(b"\r\n\r\n")
+        if not headers.startswith((b"HTTP/1.1 200", b"HTTP/1.0 200")):
+            raise RuntimeError("unexpected response: {0}".format(headers.split(b"\r\n")[0]))
+        for line in headers.lower().split(b"\r\n"):
+            if line.startswith(b"content-length:"):
+                yield self.stream.read_bytes(int(line.split(b":", 1)[1]))
+
+    @gen.coroutine
+    def request_http2(self):
+        stream_id = self.h2_conn.get_next_available_stream_id()
+        self.h2_conn.send_headers(stream_id, [
+            (":method", "GET"), (":path", "/"), (":scheme", "https"),
+            (":authority", "{0}:{1}".format(HOST, self.origin_port))], end_stream=True)
+        yield self.stream.write(self.h2_conn.data_to_send())
+
+        ended = False
+        while not ended:
+            data = yield self.stream.read_bytes(65535, partial=True)
+            for event in self.h2_conn.receive_data(data):
+                if isinstance(event, DataReceived) and event.flow_controlled_length:
+                    self.h2_conn.increment_flow_control_window(event.flow_controlled_length)
+                    self.h2_conn.increment_flow_control_window(
+                        event.flow_controlled_length, event.stream_id)
+                elif isinstance(event, StreamEnded) and event.stream_id == stream_id:
+                    ended = True
+            data = self.h2_conn.data_to_send()
+            if data:
+                yield self.stream.write(data)
+
+
+class Benchmark(object):
+    def __init__(self, args):
+        super(Benchmark, self).__init__()
+        self.args = args
+        self.http_port = free_port()
+        self.https_port = free_port()
+        self.origin = None
+        self.proxy = None
+        self.proxy_port = None
+        self.viewer_channel = None
+        self.events_channel = None
+
+    def start_origin(self):
+        self.origin = subprocess.Popen([
+            sys.executable, os.path.join(ROOT_DIR, "benchmarks", "origin.py"),
+            "--http-port", str(self.http_port), "--https-port", str(self.https_port),
+            "--body-size", str(self.args.body_size)])
+        wait_port(self.http_port, self.origin)
+        wait_port(self.https_port, self.origin)
+
+    def start_proxy(self, mode, original_dst=None):
+        self.proxy_port = free_port()
+        admin_port = free_port()
+        self.viewer_channel = "tcp://{0}:{1}".format(HOST, free_port())
+        self.events_channel = "tcp://{0}:{1}".format(HOST, free_port())
+
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(
+            [os.path.abspath(ROOT_DIR)] + filter(None, [env.get("PYTHONPATH")]))
+        if original_dst:
+            env["BENCHMARK_ORIGINAL_DST"] = "{0}:{1}".format(HOST, original_dst)
+
+        self.proxy = subprocess.Popen([
+            sys.executable, "-c", PROXY_SCRIPT,
+            "--host", HOST, "--port", str(self.proxy_port),
+            "--mode", "socks" if mode == "replay" else mode,
+            "--cert-file", CERTFILE, "--key-file", KEYFILE, "--insecure",
+            "--http-port", str(self.http_port), "--https-port", str(self.https_port),
+            "--viewer-channel", self.viewer_channel,
+            "--events-channel", self.events_channel,
+            "--publish-interval", "1", "--log-level", "error",
+            "--admin-port", str(admin_port),
+        ] + self.args.proxy_args.split(), env=env)
+        # NOTE: the admin server starts after the proxy server,
+        # probing it does not leave a broken connection in the proxy log.
+        wait_port(admin_port, self.proxy)
+
+    def stop_proxy(self):
+        self.proxy.terminate()
+        self.proxy.wait()
+        self.proxy = None
+
+    def stop(self):
+        for process in (self.proxy, self.origin):
+            if process and process.poll() is None:
+                process.terminate()
+                process.wait()
+
+    def origin_port(self, scenario):
+        return self.http_port if scenario == "http1" else self.https_port
+
+    def create_client(self, mode, scenario):
+        protocol = "https" if scenario in ("handshake", "idle") else scenario
+        return Client(mode, self.proxy_port, self.origin_port(protocol), protocol)
+
+    @gen.coroutine
+    def run_exchanges(self, mode, scenario):
+        latencies = []
+        errors = [0]
+
+        @gen.coroutine
+        def worker():
+            client = None
+            while monotonic() < deadline:
+                if client is None:
+                    client = self.create_client(mode, scenario)
+                    # NOTE: warm up the connection and the dest pool of the proxy.
+                    connected = yield self.connect_and_request(client)
+                    if not connected:
+                        errors[0] += 1
+                        client = None
+                        continue
+
+                start = monotonic()
+                try:
+                    yield client.request()
+                except Exception:
+                    errors[0] += 1
+                    client.close()
+                    client = None
+                else:
+                    latencies.append(monotonic() - start)
+            if client:
+                client.close()
+
+        deadline = monotonic() + self.args.duration
+        yield [worker() for _ in range(self.args.concurrency)]
+        raise gen.Return(summarize(
+            latencies, errors[0], self.args.duration, "requests_per_sec"))
+
+    @gen.coroutine
+    def run_handshakes(self, mode, scenario):
+        latencies = []
+        errors = [0]
+        deadline = monotonic() + self.args.duration
+
+        @gen.coroutine
+        def worker():
+            while monotonic() < deadline:
+                client = self.create_client(mode, scenario)
+                start = monotonic()
+                try:
+                    yield client.connect()
+                    yield client.request()
+                except Exception:
+                    errors[0] += 1
+                else:
+                    latencies.append(monotonic() - start)
+                finally:
+                    client.close()
+
+        yield [worker() for _ in range(self.args.concurrency)]
+        raise gen.Return(summarize(
+            latencies, errors[0], self.args.duration, "handshakes_per_sec"))
+
+    @gen.coroutine
+    def run_idle(self, mode, scenario):
+        clients = [self.create_client(mode, scenario)
+                   for _ in range(self.args.connections)]
+        before = process_rss(self.proxy.pid)
+        errors = 0
+        for i in range(0, len(clients), self.args.concurrency):
+            batch = clients[i:i + self.args.concurrency]
+            results = yield [self.connect_and_request(client) for client in batch]
+            errors += results.count(False)
+        yield gen.sleep(0.5)
+        after = process_rss(self.proxy.pid)
+        for client in clients:
+            client.close()
+
+        connections = len(clients) - errors
+        raise gen.Return({
+            "rss_per_connection": (after - before) / max(connections, 1),
+            "connections": connections,
+            "errors": errors,
+        })
+
+    @gen.coroutine
+    def connect_and_request(self, client):
+        try:
+            yield client.connect()
+            yield client.request()
+        except Exception:
+            client.close()
+            raise gen.Return(False)
+        raise gen.Return(True)
+
+    @gen.coroutine
+    def run_replays(self, mode, scenario):
+        scheme = "http" if scenario == "http1" else scenario
+        port = self.origin_port(scenario)
+        event_client = EventClient(self.events_channel)
+        viewer_socket = zmq.Context.instance().socket(zmq.SUB)
+        viewer_socket.connect(self.viewer_channel)
+        viewer_socket.setsockopt(zmq.SUBSCRIBE, "message")
+        viewer_stream = ZMQStream(viewer_socket)
+        pending = {}
+
+        def on_published(msg_parts):
+            for message in msg_parts[1:]:
+                future = pending.pop(json.loads(message)["path"], None)
+                if future:
+                    future.set_result(None)
+
+        viewer_stream.on_recv(on_published)
+        # NOTE: give the subscription some time to reach the proxy.
+        yield gen.sleep(0.5)
+
+        latencies = []
+        errors = [0]
+        counter = [0]
+        deadline = monotonic() + self.args.duration
+
+        @gen.coroutine
+        def worker():
+            while monotonic() < deadline:
+                counter[0] += 1
+                path = "/replay/{0}".format(counter[0])
+                future = pending[path] = Future()
+                start = monotonic()
+                event_client.send_event(Event(REPLAY, self.replay_context(
+                    scheme, port, path)))
+                try:
+                    yield gen.with_timeout(timedelta(seconds=TIMEOUT), future)
+                except gen.TimeoutError:
+                    pending.pop(path, None)
+                    errors[0] += 1
+                else:
+                    latencies.append(monotonic() - start)
+
+        try:
+            yield [worker() for _ in range(self.args.concurrency)]
+        finally:
+            viewer_stream.close()
+            event_client.zmq_socket.close()
+        raise gen.Return(summarize(
+            latencies, errors[0], self.args.duration, "requests_per_sec"))
+
+    def replay_context(self, scheme, port, path):
+        if scheme == "h2":
+            request = dict(method="GET", path=path, version="HTTP/2", headers=[
+                (":method", "GET"), (":path", path), (":scheme", "https"),
+                (":authority", "{0}:{1}".format(HOST, port))])
+        else:
+            request = dict(method="GET", path=path, version="HTTP/1.1", headers=[
+                ("Host", "{0}:{1}".format(HOST, port))])
+        return dict(host=HOST, port=port, scheme=scheme, path=path,
+                    request=request, response=None)
+
+    @gen.coroutine
+    def run(self):
+        results = {}
+        for mode in self.args.modes:
+            for scenario in (REPLAY_SCENARIOS if mode == "replay" else SCENARIOS):
+                if scenario not in self.args.scenarios:
+                    continue
+                if mode == "replay":
+                    runner = self.run_replays
+                elif scenario == "handshake":
+                    runner = self.run_handshakes
+                elif scenario == "idle":
+                    runner = self.run_idle
+                else:
+                    runner = self.run_exchanges
+
+                original_dst = None
+                if mode == "transparent":
+                    original_dst = self.origin_port(
+                        "http1" if scenario == "http1" else "https")
+                self.start_proxy(mode, original_dst)
+                try:
+                    result = yield runner(mode, scenario)
+                finally:
+                    self.stop_proxy()
+
+                name = "{0}/{1}".format(mode, scenario)
+                results[name] = result
+                print name, " ".join("{0}={1}".format(k, v) for k, v in sorted(result.items()))
+                sys.stdout.flush()
+        raise gen.Return(results)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT_DIR,
+            stderr=open(os.devnull, "w")).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--body-size", type=int, default=1024)
+    parser.add_argument("--proxy-args", default="",
+                        help="extra mpserver arguments, e.g. \"--forward-relay direct\"")
+    parser.add_argument("--output", default="e2e.json")
+    args = parser.parse_args()
+    args.modes = [mode for mode in args.modes.split(",") if mode]
+    args.scenarios = [scenario for scenario in args.scenarios.split(",") if scenario]
+
+    # NOTE: connections closed in the middle of tls handshakes are expected.
+    logging.getLogger("tornado.general").setLevel(logging.ERROR)
+    benchmark = Benchmark(args)
+    benchmark.start_origin()
+    try:
+        results = curr_loop().run_sync(benchmark.run)
+    finally:
+        benchmark.stop()
+
+    with open(args.output, "w") as fp:
+        json.dump(dict(
+            commit=git_commit(), timestamp=int(time.time()),
+            python=platform.python_version(), settings=vars(args),
+            results=results), fp, indent=2, sort_keys=True)
+    print "results are saved to {0}".format(args.output)
+
+
+if __name__ == "__main__":
+    main()
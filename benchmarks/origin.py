@@ -0,0 +1,115 @@
+"""Local origin servers answering every request with a fixed body.
+
+The plain port serves http/1.1, the tls port serves http/1.1 and h2 selected by alpn.
+Both are kept minimal, so the origin costs little next to the proxy under test.
+
+usage: python benchmarks/origin.py --http-port 8080 --https-port 8443 [--body-size 1024]
+"""
+import argparse
+import logging
+import os
+import ssl
+
+from h2.connection import H2Connection
+from h2.events import DataReceived, StreamEnded
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.iostream import StreamClosedError
+from tornado.tcpserver import TCPServer
+
+CERT_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, "microproxy", "test")
+CERTFILE = os.path.join(CERT_DIR, "test.crt")
+KEYFILE = os.path.join(CERT_DIR, "test.key")
+
+
+def create_ssl_context():
+    ssl_context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+    ssl_context.load_cert_chain(CERTFILE, KEYFILE)
+    ssl_context.set_alpn_protocols(["h2", "http/1.1"])
+    return ssl_context
+
+
+class OriginServer(TCPServer):
+    def __init__(self, body_size, **kwargs):
+        super(OriginServer, self).__init__(**kwargs)
+        self.body = b"x" * body_size
+        self.http1_response = (
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/plain\r\n"
+            b"Content-Length: {0}\r\n\r\n".format(body_size) + self.body)
+
+    @gen.coroutine
+    def handle_stream(self, stream, address):
+        stream.set_nodelay(True)
+        try:
+            alpn = None
+            if self.ssl_options:
+                yield stream.wait_for_handshake()
+                alpn = stream.socket.selected_alpn_protocol()
+
+            if alpn == "h2":
+                yield self.serve_http2(stream)
+            else:
+                yield self.serve_http1(stream)
+        except (StreamClosedError, ssl.SSLError):
+            pass
+        finally:
+            stream.close()
+
+    @gen.coroutine
+    def serve_http1(self, stream):
+        while True:
+            headers = yield stream.read_until(b"\r\n\r\n")
+            content_length = 0
+            for line in headers.lower().split(b"\r\n"):
+                if line.startswith(b"content-length:"):
+                    content_length = int(line.split(b":", 1)[1])
+            if content_length:
+                yield stream.read_bytes(content_length)
+            yield stream.write(self.http1_response)
+
+    @gen.coroutine
+    def serve_http2(self, stream):
+        conn = H2Connection(client_side=False)
+        conn.initiate_connection()
+        yield stream.write(conn.data_to_send())
+        response_headers = [
+            (":status", "200"),
+            ("content-type", "text/plain"),
+            ("content-length", str(len(self.body)))]
+
+        while True:
+            data = yield stream.read_bytes(65535, partial=True)
+            for event in conn.receive_data(data):
+                if isinstance(event, DataReceived) and event.flow_controlled_length:
+                    conn.increment_flow_control_window(event.flow_controlled_length)
+                elif isinstance(event, StreamEnded):
+                    conn.send_headers(event.stream_id, response_headers)
+                    conn.send_data(event.stream_id, self.body, end_stream=True)
+            data = conn.data_to_send()
+            if data:
+                yield stream.write(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--http-port", type=int, required=True)
+    parser.add_argument("--https-port", type=int, required=True)
+    parser.add_argument("--body-size", type=int, default=1024)
+    args = parser.parse_args()
+
+    # NOTE: connections closed in the middle of tls handshakes are expected.
+    logging.getLogger("tornado.general").setLevel(logging.ERROR)
+    OriginServer(args.body_size).listen(args.http_port, args.host)
+    OriginServer(args.body_size, ssl_options=create_ssl_context()).listen(
+        args.https_port, args.host)
+    try:
+        IOLoop.current().start()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
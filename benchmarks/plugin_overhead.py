@@ -0,0 +1,68 @@
+"""Measure the plugin overhead per request of PluginManager.
+
+Half of the plugins define on_request only, the other half on_response only,
+which is common for plugins rewriting one side of the exchange.
+
+usage: python benchmarks/plugin_overhead.py [--plugins 10] [--requests 100000]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import timeit
+
+from microproxy.context import PluginContext, HttpRequest, HttpResponse
+from microproxy.interceptor import PluginManager
+
+REQUEST_PLUGIN = """
+def on_request(plugin_context):
+    return plugin_context
+"""
+
+RESPONSE_PLUGIN = """
+def on_response(plugin_context):
+    return plugin_context
+"""
+
+
+def create_plugins(plugin_dir, count):
+    paths = []
+    for i in range(count):
+        path = os.path.join(plugin_dir, "plugin{0}.py".format(i))
+        with open(path, "w") as fp:
+            fp.write(REQUEST_PLUGIN if i % 2 == 0 else RESPONSE_PLUGIN)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--plugins", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=100000)
+    args = parser.parse_args()
+
+    plugin_dir = tempfile.mkdtemp(prefix="microproxy-benchmark-")
+    plugin_manager = PluginManager(
+        {"plugins": create_plugins(plugin_dir, args.plugins)})
+    plugin_context = PluginContext(
+        scheme="http", host="example.com", port=80, path="/index",
+        request=HttpRequest(method="GET", path="/index"),
+        response=HttpResponse(code="200"))
+
+    def exchange():
+        plugin_manager.exec_request(plugin_context)
+        plugin_manager.exec_response(plugin_context)
+
+    try:
+        elapsed = min(timeit.repeat(exchange, number=args.requests, repeat=3))
+    finally:
+        for plugin in plugin_manager.plugins:
+            plugin.observer.stop()
+        shutil.rmtree(plugin_dir, ignore_errors=True)
+
+    print "plugins: {0}, overhead per request: {1:.2f} us".format(
+        args.plugins, elapsed / args.requests * 1000000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""This module serves the local admin endpoints of the proxy.
+
+GET /metrics returns the metrics registry in the Prometheus text format.
+"""
+from tornado.httpserver import HTTPServer
+from tornado.web import Application, RequestHandler
+
+from microproxy import metrics
+from microproxy.log import ProxyLogger
+logger = ProxyLogger.get_logger(__name__)
+
+
+class MetricsHandler(RequestHandler):
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def initialize(self, registry):
+        self.registry = registry
+
+    def get(self):
+        self.set_header("Content-Type", self.CONTENT_TYPE)
+        self.write(self.registry.expose())
+
+
+def create_admin_app(registry=None):
+    return Application([
+        (r"/metrics", MetricsHandler, dict(registry=registry or metrics.registry)),
+    ])
+
+
+def start_admin_server(config, worker_id=0):  # pragma: no cover
+    """Start the admin server when admin_port is given.
+
+    With several workers, worker N listens at admin_port + N,
+    since the metrics of each worker process are kept separately.
+    """
+    if not config.get("admin_port"):
+        return None
+
+    port = config["admin_port"] + worker_id
+    server = HTTPServer(create_admin_app())
+    server.listen(port, config.get("admin_host", "127.0.0.1"))
+    logger.info("admin server is listening at {0}:{1}".format(
+        config.get("admin_host", "127.0.0.1"), port))
+    return server
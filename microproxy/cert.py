@@ -1,15 +1,37 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from OpenSSL import crypto
-import time
+from tornado import gen
+import binascii
+import hashlib
+import os
+import tempfile
 
+from microproxy import metrics
+from microproxy.utils import monotonic
 from microproxy.log import ProxyLogger
 logger = ProxyLogger.get_logger(__name__)
 
+_cert_requests_total = metrics.registry.counter(
+    "microproxy_cert_requests_total", "Cert requests by where the cert came from",
+    ["source"])
+_cert_seconds = metrics.registry.histogram(
+    "microproxy_cert_seconds", "Seconds to load or sign a cert not in memory")
+
 
 class CertStore(object):
     def __init__(self, config):
         self.ca_root, self.private_key = self._get_root(
             config["certfile"], config["keyfile"])
-        self.certs_cache = dict()
+        self.certs_cache = OrderedDict()
+        self.cache_size = config.get("cert_cache_size", 1024)
+        self.cache_dir = self._get_cache_dir(config.get("cert_cache_dir", ""))
+
+        # NOTE: signing runs in threads, OpenSSL releases the GIL while signing.
+        self.executor = ThreadPoolExecutor(config.get("cert_workers", 4))
+        self.pending_certs = dict()
+
+        self.warm_up(config.get("cert_warmup_hosts", []))
 
     def _get_root(self, certfile, keyfile):
         root_ca_file = certfile
@@ -24,6 +46,17 @@ class CertStore(object):
 
         return (ca_root, private_key)
 
+    def _get_cache_dir(self, cache_dir):
+        if not cache_dir:
+            return None
+
+        # NOTE: certs signed by different root ca should not be mixed.
+        ca_fingerprint = self.ca_root.digest("sha1").replace(":", "").lower()
+        cache_dir = os.path.join(cache_dir, ca_fingerprint)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        return cache_dir
+
     def get_cert_and_pkey(self, common_name):
         cert = self.get_cert_from_cache(common_name)
         if cert:
@@ -36,11 +69,89 @@ class CertStore(object):
             cert = self.create_cert(common_name)
             return (cert, self.private_key)
 
+    @gen.coroutine
+    def get_cert_and_pkey_async(self, common_name):
+        """Get the cert and private key without blocking the io loop.
+
+        Concurrent calls with the same common name share one signing job.
+
+        Args:
+            common_name (str): The common name of the cert.
+
+        Returns:
+            (tuple): (cert, private key)
+        """
+        cert = self._get_cert_from_memory(common_name)
+        if cert:
+            _cert_requests_total.inc(labels=("memory",))
+            raise gen.Return((cert, self.private_key))
+
+        future = self.pending_certs.get(common_name)
+        if future:
+            logger.debug("wait for pending cert commonname:{0}".format(
+                common_name))
+            _cert_requests_total.inc(labels=("pending",))
+            cert, _, _ = yield future
+            raise gen.Return((cert, self.private_key))
+
+        _cert_requests_total.inc(labels=("executor",))
+        start = monotonic()
+        future = self.executor.submit(self._load_or_sign_cert, common_name)
+        self.pending_certs[common_name] = future
+        try:
+            cert, loaded, write_error = yield future
+        finally:
+            del self.pending_certs[common_name]
+
+        _cert_seconds.observe(monotonic() - start)
+        self._log_cert_file(common_name, loaded, write_error)
+        self._cache_cert(common_name, cert)
+        raise gen.Return((cert, self.private_key))
+
+    def warm_up(self, common_names):
+        results = self.executor.map(self._load_or_sign_cert, common_names)
+        for common_name, (cert, loaded, write_error) in zip(common_names, results):
+            self._log_cert_file(common_name, loaded, write_error)
+            self._cache_cert(common_name, cert)
+
     def create_cert(self, common_name):
+        cert = self._sign_cert(common_name)
+        self._log_cert_file(
+            common_name, False, self._write_cert_file(common_name, cert))
+        self._cache_cert(common_name, cert)
+        return cert
+
+    def _load_or_sign_cert(self, common_name):
+        """Load the cert from the cache dir, or sign and write it.
+
+        Run in the executor, so it does not log: the log handlers,
+        e.g. the zmq one publishing to the viewer, are not thread-safe.
+
+        Returns:
+            (tuple): (cert, whether it was loaded, the error writing it or None)
+        """
+        cert = self._read_cert_file(common_name)
+        if cert:
+            return (cert, True, None)
+
+        cert = self._sign_cert(common_name)
+        return (cert, False, self._write_cert_file(common_name, cert))
+
+    def _log_cert_file(self, common_name, loaded, write_error):
+        if loaded:
+            logger.debug("load cert commonname:{0} from {1}".format(
+                common_name, self.cache_dir))
+        if write_error:
+            logger.warning("write cert commonname:{0} failed: {1}".format(
+                common_name, write_error))
+
+    def _sign_cert(self, common_name):
         cert = crypto.X509()
 
+        # NOTE: certificates signed in parallel must not share a serial,
+        # keep it a positive number of at most 127 bits.
+        cert.set_serial_number(int(binascii.hexlify(os.urandom(16)), 16) >> 1)
         # NOTE: Expire time 3 yr
-        cert.set_serial_number(int(time.time() * 10000))
         cert.gmtime_adj_notBefore(-3600 * 48)
         cert.gmtime_adj_notAfter(94608000)
         cert.get_subject().CN = common_name
@@ -49,12 +160,63 @@ class CertStore(object):
         cert.set_pubkey(self.ca_root.get_pubkey())
         cert.set_version(2)
         cert.sign(self.private_key, "sha256")
-
-        self.certs_cache[common_name] = cert
         return cert
 
     def get_cert_from_cache(self, common_name):
+        cert = self._get_cert_from_memory(common_name)
+        if cert:
+            return cert
+
+        cert = self._read_cert_file(common_name)
+        if cert:
+            self._log_cert_file(common_name, True, None)
+            self._cache_cert(common_name, cert)
+        return cert
+
+    def _get_cert_from_memory(self, common_name):
         try:
-            return self.certs_cache[common_name]
+            cert = self.certs_cache.pop(common_name)
         except KeyError:
             return None
+
+        self.certs_cache[common_name] = cert
+        return cert
+
+    def _cache_cert(self, common_name, cert):
+        self.certs_cache[common_name] = cert
+        while len(self.certs_cache) > self.cache_size:
+            self.certs_cache.popitem(last=False)
+
+    def _cert_file_path(self, common_name):
+        filename = hashlib.sha1(common_name.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, filename + ".pem")
+
+    def _read_cert_file(self, common_name):
+        if not self.cache_dir:
+            return None
+
+        try:
+            with open(self._cert_file_path(common_name), "rb") as fp:
+                cert = crypto.load_certificate(crypto.FILETYPE_PEM, fp.read())
+        except (IOError, crypto.Error):
+            return None
+
+        if cert.has_expired() or cert.get_subject().CN != common_name:
+            return None
+        return cert
+
+    def _write_cert_file(self, common_name, cert):
+        """Returns the error writing the cert, None when written or not cached."""
+        if not self.cache_dir:
+            return None
+
+        # NOTE: write to a temporary file then rename,
+        # so other process sharing the directory never reads a partial file.
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(crypto.dump_certificate(crypto.FILETYPE_PEM, cert))
+            os.rename(tmp_path, self._cert_file_path(common_name))
+        except (IOError, OSError) as e:
+            return e
+        return None
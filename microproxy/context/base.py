@@ -2,9 +2,23 @@ import re
 
 
 class Serializable(object):
+    """Serializable: Base class of contexts serialized to the viewers and events.
+
+    Subclasses could define __slots__ to save memory,
+    the fields are then read from the slots instead of __dict__.
+    """
+    __slots__ = ()
+
+    def _items(self):
+        items = [(name, getattr(self, name))
+                 for name in _slot_names(type(self)) if hasattr(self, name)]
+        if hasattr(self, "__dict__"):
+            items.extend(self.__dict__.items())
+        return items
+
     def serialize(self):
         data = {}
-        for k, v in self.__dict__.items():
+        for k, v in self._items():
             if isinstance(v, Serializable):
                 data[k] = v.serialize()
             else:
@@ -24,18 +38,37 @@ class Serializable(object):
             return None
 
     def __str__(self):
-        return "{0}{1}".format(type(self).__name__, self.__dict__)
+        return "{0}{1}".format(type(self).__name__, dict(self._items()))
 
     def __repr__(self):
-        return "{0}{1}".format(type(self).__name__, self.__dict__)
+        return "{0}{1}".format(type(self).__name__, dict(self._items()))
 
     def __eq__(self, other):
-        return self.__dict__ == other.__dict__
+        return (isinstance(other, Serializable) and
+                dict(self._items()) == dict(other._items()))
 
     def __neq__(self, other):
         return not self.__eq__(other)
 
 
+_SLOT_NAMES = {}
+
+
+def _slot_names(cls):
+    try:
+        return _SLOT_NAMES[cls]
+    except KeyError:
+        pass
+
+    names = []
+    for klass in reversed(cls.__mro__):
+        for name in klass.__dict__.get("__slots__", ()):
+            if name not in names and name != "__weakref__":
+                names.append(name)
+    _SLOT_NAMES[cls] = names
+    return names
+
+
 def parse_version(version):
     versions = re.split(r"\.|-|\+", version)
     return (
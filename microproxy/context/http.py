@@ -5,6 +5,8 @@ from base import Serializable
 
 
 class HttpRequest(Serializable):
+    __slots__ = ("timestamp", "version", "method", "path", "body", "headers")
+
     def __init__(self,
                  version="",
                  method="",
@@ -47,6 +49,8 @@ class HttpRequest(Serializable):
 
 
 class HttpResponse(Serializable):
+    __slots__ = ("timestamp", "code", "reason", "version", "body", "headers")
+
     def __init__(self,
                  code="",
                  reason="",
@@ -89,6 +93,15 @@ class HttpResponse(Serializable):
 
 
 class HttpHeaders(Serializable):
+    """HttpHeaders: Ordered http headers with case insensitive lookups.
+
+    Lookups go through an index of lowercase name to positions,
+    which is built on the first lookup and kept up to date by the methods below.
+    The index is rebuilt when the headers list is replaced or its length changed,
+    other in place changes of the list should be done through the methods.
+    """
+    __slots__ = ("_headers", "_index", "_index_size")
+
     def __init__(self, headers=None):
         headers = headers or []
         if isinstance(headers, (dict, OrderedDict)):
@@ -102,29 +115,98 @@ class HttpHeaders(Serializable):
         else:
             raise ValueError("HttpHeaders not support with: " + str(type(headers)))
 
+    @property
+    def headers(self):
+        return self._headers
+
+    @headers.setter
+    def headers(self, headers):
+        self._headers = headers
+        self._index = None
+
+    def _get_index(self):
+        if self._index is None or self._index_size != len(self._headers):
+            index = dict()
+            for i, (k, _) in enumerate(self._headers):
+                index.setdefault(k.lower(), []).append(i)
+            self._index = index
+            self._index_size = len(self._headers)
+        return self._index
+
     def __len__(self):
         return len(self.headers)
 
     def __contains__(self, key):
-        for k, _ in self.headers:
-            if k.lower() == key.lower():
-                return True
-        return False
+        return key.lower() in self._get_index()
 
     def __getitem__(self, key):
-        return ", ".join([v for k, v in self.headers if k.lower() == key.lower()])
+        return ", ".join(self.getlist(key))
 
     def __setitem__(self, key, value):
-        self.headers.append((key, value))
+        index = self._get_index()
+        index.setdefault(key.lower(), []).append(len(self._headers))
+        self._headers.append((key, value))
+        self._index_size += 1
+
+    def get(self, key, default=None):
+        """Get the values of the header joined by ", ", or default if not found."""
+        if key not in self:
+            return default
+        return self[key]
+
+    def getlist(self, key):
+        """Get all values of the header in order."""
+        positions = self._get_index().get(key.lower(), [])
+        return [self._headers[i][1] for i in positions]
+
+    def remove(self, key):
+        """Remove all values of the header.
+
+        Returns:
+            (list): The removed values.
+        """
+        positions = self._get_index().get(key.lower())
+        if not positions:
+            return []
+
+        values = [self._headers[i][1] for i in positions]
+        removed = set(positions)
+        self._headers[:] = [h for i, h in enumerate(self._headers) if i not in removed]
+        self._index = None
+        return values
+
+    def replace(self, key, value):
+        """Set the header to a single value.
+
+        The first occurrence keeps its position, the others are removed.
+        The header is appended if not found.
+        """
+        positions = self._get_index().get(key.lower())
+        if not positions:
+            self[key] = value
+            return
+
+        first = positions[0]
+        self._headers[first] = (key, value)
+        if len(positions) > 1:
+            removed = set(positions[1:])
+            self._headers[:] = [h for i, h in enumerate(self._headers) if i not in removed]
+            self._index = None
 
     def __iter__(self):
         return self.headers.__iter__()
 
     def __eq__(self, other):
-        return self.__dict__ == other.__dict__
+        return isinstance(other, HttpHeaders) and self.headers == other.headers
 
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def __str__(self):
+        return "{0}{1}".format(type(self).__name__, {"headers": self.headers})
+
+    def __repr__(self):
+        return self.__str__()
+
     def serialize(self):
         return [h for h in self.headers]
@@ -1,7 +1,14 @@
 class LayerContext(object):
     """
     LayerContext: Context used to communicate with different layer.
+
+    timing keeps the monotonic timestamps of the connection phases,
+    e.g. accept, connect, dest_tls and src_tls. It is shared by the copies
+    of the context, so every layer sees the phases of the previous layers.
     """
+    __slots__ = ("mode", "src_stream", "dest_stream", "scheme", "host", "port",
+                 "client_tls", "server_tls", "done", "src_info", "timing")
+
     def __init__(self,
                  mode,
                  src_stream=None,
@@ -12,7 +19,8 @@ class LayerContext(object):
                  client_tls=None,
                  server_tls=None,
                  done=False,
-                 src_info=None):
+                 src_info=None,
+                 timing=None):
         if mode not in ("socks", "transparent", "replay", "http"):
             raise ValueError("incorrect mode value")
 
@@ -26,3 +34,4 @@ class LayerContext(object):
         self.server_tls = server_tls
         self.done = done
         self.src_info = src_info
+        self.timing = {} if timing is None else timing
@@ -3,6 +3,8 @@ class PluginContext(object):
     """
     PluinContext: Context used to communicate with plugin.
     """
+    __slots__ = ("scheme", "host", "port", "path", "request", "response")
+
     def __init__(self,
                  scheme,
                  host,
@@ -4,8 +4,10 @@ class ServerContext(object):
                  io_loop=None,
                  config=None,
                  interceptor=None,
-                 cert_store=None):
+                 cert_store=None,
+                 dest_pool=None):
         self.io_loop = io_loop
         self.config = config
         self.interceptor = interceptor
         self.cert_store = cert_store
+        self.dest_pool = dest_pool
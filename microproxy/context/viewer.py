@@ -1,3 +1,6 @@
+import json
+import struct
+
 from http import HttpRequest, HttpResponse
 from tls import TlsInfo
 from base import Serializable, parse_version
@@ -6,6 +9,15 @@ from microproxy.version import VERSION
 
 _DEFAULT_VERSION = "0.4.0"
 
+# NOTE: binary message layout, all lengths are in bytes:
+# header (magic, format version, meta length, request body length,
+# response body length) | meta json | raw request body | raw response body
+_BINARY_MAGIC = b"MPV"
+_BINARY_FORMAT_VERSION = 1
+_BINARY_HEADER = struct.Struct("!3sBIII")
+# NOTE: the publish topic telling viewers the messages are in the binary format.
+BINARY_TOPIC = "message.bin"
+
 
 class ViewerContext(Serializable):
     """
@@ -20,6 +32,10 @@ class ViewerContext(Serializable):
                  response=None,
                  client_tls=None,
                  server_tls=None,
+                 truncated=False,
+                 request_body_length=0,
+                 response_body_length=0,
+                 timing=None,
                  version=VERSION,
                  **kwargs):
 
@@ -29,6 +45,13 @@ class ViewerContext(Serializable):
         self.port = port
         self.path = path
         self.version = version
+        # NOTE: bodies might be truncated by the capture policy,
+        # the lengths are of the original bodies.
+        self.truncated = truncated
+        self.request_body_length = request_body_length
+        self.response_body_length = response_body_length
+        # NOTE: milliseconds since the connection was accepted, keyed by phase.
+        self.timing = timing or {}
 
         self.request = HttpRequest.deserialize(request)
         self.response = HttpResponse.deserialize(response)
@@ -40,6 +63,67 @@ class ViewerContext(Serializable):
         enrich_data(data)
         return ViewerContext(**data)
 
+    def serialize_binary(self):
+        """Serialize into the binary format which keeps bodies as raw bytes.
+
+        Returns:
+            (bytes): The binary message.
+        """
+        meta = {}
+        bodies = {"request": b"", "response": b""}
+        for k, v in self._items():
+            if isinstance(v, (HttpRequest, HttpResponse)):
+                # NOTE: skip the base64 encoding of HttpRequest.serialize
+                meta[k] = Serializable.serialize(v)
+                bodies[k] = meta[k].pop("body")
+            elif isinstance(v, Serializable):
+                meta[k] = v.serialize()
+            else:
+                meta[k] = v
+
+        meta = json.dumps(meta)
+        header = _BINARY_HEADER.pack(
+            _BINARY_MAGIC, _BINARY_FORMAT_VERSION, len(meta),
+            len(bodies["request"]), len(bodies["response"]))
+        return b"".join([header, meta, bodies["request"], bodies["response"]])
+
+    @classmethod
+    def deserialize_binary(cls, message):
+        """Deserialize the message created by serialize_binary.
+
+        Args:
+            message (bytes): The binary message.
+
+        Returns:
+            (ViewerContext): The viewer context.
+
+        Raises:
+            ValueError: If the message is not in a supported binary format.
+        """
+        try:
+            magic, format_version, meta_size, request_body_size, response_body_size = (
+                _BINARY_HEADER.unpack_from(message))
+        except struct.error:
+            raise ValueError("Incomplete binary viewer context")
+
+        if magic != _BINARY_MAGIC or format_version != _BINARY_FORMAT_VERSION:
+            raise ValueError("Unsupported binary viewer context: {0}, {1}".format(
+                repr(magic), format_version))
+
+        offset = _BINARY_HEADER.size
+        meta = json.loads(message[offset:offset + meta_size])
+        offset += meta_size
+        request_body = message[offset:offset + request_body_size]
+        offset += request_body_size
+        response_body = message[offset:offset + response_body_size]
+
+        enrich_data(meta)
+        if meta.get("request"):
+            meta["request"] = HttpRequest(body=request_body, **meta["request"])
+        if meta.get("response"):
+            meta["response"] = HttpResponse(body=response_body, **meta["response"])
+        return ViewerContext(**meta)
+
 
 def enrich_data(data):
     if "version" not in data:
@@ -1,4 +1,6 @@
 from manager import EventManager
 from client import EventClient
 from manager import start_events_server
-from types import REPLAY
+from types import (
+    REPLAY, PROFILE_START, PROFILE_STOP, MEMORY_SNAPSHOT, GC_STATS,
+    BROADCAST_EVENTS)
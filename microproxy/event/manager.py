@@ -3,7 +3,8 @@ import json
 from microproxy.context import Event
 from microproxy.log import ProxyLogger
 from replay import ReplayHandler
-from types import REPLAY
+from profiling import ProfileHandler
+from types import REPLAY, PROFILE_START, PROFILE_STOP, MEMORY_SNAPSHOT, GC_STATS
 
 logger = ProxyLogger.get_logger(__name__)
 
@@ -33,8 +34,13 @@ class EventManager(object):
 
 class EventHandler(object):
     def __init__(self, server_state):
+        profile_handler = ProfileHandler(server_state)
         self.handlers = {
-            REPLAY: ReplayHandler(server_state)
+            REPLAY: ReplayHandler(server_state),
+            PROFILE_START: profile_handler,
+            PROFILE_STOP: profile_handler,
+            MEMORY_SNAPSHOT: profile_handler,
+            GC_STATS: profile_handler,
         }
 
     def handle_event(self, event):
@@ -44,5 +50,9 @@ class EventHandler(object):
             logger.error("Unhandled event: {0}".format(event.name))
 
 
-def start_events_server(server_state, zmq_stream):
-    EventManager(server_state, zmq_stream).start()
+def start_events_server(server_state, zmq_stream, broadcast_stream=None):
+    handler = EventHandler(server_state)
+    EventManager(server_state, zmq_stream, handler=handler).start()
+    if broadcast_stream:
+        # NOTE: share the handler, a profiling session could be stopped by either stream.
+        EventManager(server_state, broadcast_stream, handler=handler).start()
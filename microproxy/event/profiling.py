@@ -0,0 +1,221 @@
+"""This module profiles the running proxy on demand.
+
+PROFILE_START starts a profiling session of the io loop thread, either
+cProfile ({"profiler": "cprofile"}) or a stack sampler
+({"profiler": "sampling", "interval": 0.005}), PROFILE_STOP ends it.
+MEMORY_SNAPSHOT diffs the memory against the previous snapshot,
+GC_STATS reports the garbage collector state.
+
+The report is written to context["output"] when given,
+otherwise it is published as json on the "profile" topic with the pid.
+With --workers, every worker handles these events, unless context["pid"]
+targets one of them, and the pid is appended to the output file names.
+"""
+import cProfile
+import gc
+import json
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+from StringIO import StringIO
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from microproxy.utils import curr_loop
+from types import PROFILE_START, PROFILE_STOP, MEMORY_SNAPSHOT, GC_STATS
+
+from microproxy.log import ProxyLogger
+logger = ProxyLogger.get_logger(__name__)
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return "{0}:{1}".format(os.path.basename(code.co_filename), code.co_name)
+
+
+class StackSampler(object):
+    """StackSampler: Count the stacks of a thread sampled from a helper thread.
+
+    The report is in the collapsed stack format of flamegraph.pl,
+    "outer;inner count" per line.
+    """
+    def __init__(self, thread_id, interval=0.005):
+        super(StackSampler, self).__init__()
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def enable(self):
+        self.thread = threading.Thread(target=self._sample, name="stack-sampler")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def disable(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _sample(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def report(self, output=None):
+        lines = ["{0} {1}".format(stack, count)
+                 for stack, count in self.stacks.most_common()]
+        return "\n".join(lines) + "\n"
+
+
+class CProfiler(object):
+    """CProfiler: cProfile of the io loop thread, reported by pstats."""
+    def __init__(self, limit=50):
+        super(CProfiler, self).__init__()
+        self.limit = limit
+        self.profile = cProfile.Profile()
+
+    def enable(self):
+        self.profile.enable()
+
+    def disable(self):
+        self.profile.disable()
+
+    def report(self, output=None):
+        if output:
+            # NOTE: keep the binary stats in the file, which is readable by pstats.
+            self.profile.dump_stats(output)
+            return None
+
+        stream = StringIO()
+        stats = pstats.Stats(self.profile, stream=stream)
+        stats.sort_stats("cumulative").print_stats(self.limit)
+        return stream.getvalue()
+
+
+def _object_counts():
+    return Counter(type(obj).__name__ for obj in gc.get_objects())
+
+
+def _tracemalloc_snapshot():  # pragma: no cover
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    return tracemalloc.take_snapshot()
+
+
+class ProfileHandler(object):
+    TOPIC = "profile"
+
+    def __init__(self, server_state, io_loop=None):
+        super(ProfileHandler, self).__init__()
+        self.server_state = server_state
+        self.io_loop = io_loop or curr_loop()
+        self.profiler = None
+        self.last_snapshot = None
+        self.actions = {
+            PROFILE_START: self.start_profile,
+            PROFILE_STOP: self.stop_profile,
+            MEMORY_SNAPSHOT: self.memory_snapshot,
+            GC_STATS: self.gc_stats,
+        }
+
+    def handle(self, event):
+        context = event.context or {}
+        pid = os.getpid()
+        if context.get("pid", pid) != pid:
+            return
+
+        config = self.server_state.config or {}
+        if context.get("output") and config.get("workers", 0) > 1:
+            context = dict(context, output="{0}.{1}".format(context["output"], pid))
+
+        report = self.actions[event.name](context)
+        if report is not None:
+            self.send_report(event.name, report, context.get("output"))
+
+    def send_report(self, name, report, output=None):
+        if output:
+            with open(output, "w") as fp:
+                fp.write(report)
+            logger.info("{0} report of {1} is written to {2}".format(
+                name, os.getpid(), output))
+            return
+
+        message = json.dumps(dict(event=name, pid=os.getpid(), report=report))
+        self.server_state.interceptor.msg_publisher.send(self.TOPIC, message)
+
+    def start_profile(self, context):
+        if self.profiler:
+            raise ValueError("profiling is already started")
+
+        profiler_name = context.get("profiler", "cprofile")
+        if profiler_name == "cprofile":
+            profiler = CProfiler(limit=context.get("limit", 50))
+        elif profiler_name == "sampling":
+            profiler = StackSampler(
+                threading.current_thread().ident, context.get("interval", 0.005))
+        else:
+            raise ValueError("not support profiler: {0}".format(profiler_name))
+
+        profiler.enable()
+        self.profiler = profiler
+        logger.info("start profiling with {0}".format(profiler_name))
+
+    def stop_profile(self, context):
+        if not self.profiler:
+            raise ValueError("profiling is not started")
+
+        profiler, self.profiler = self.profiler, None
+        profiler.disable()
+        output = context.get("output")
+        report = profiler.report(output)
+        if report is None:
+            logger.info("profile of {0} is written to {1}".format(os.getpid(), output))
+        return report
+
+    def memory_snapshot(self, context):
+        """Diff the memory against the previous snapshot.
+
+        With tracemalloc, allocations are diffed by the line of code,
+        otherwise the live objects tracked by gc are diffed by the type.
+        """
+        limit = context.get("limit", 30)
+        if tracemalloc:  # pragma: no cover
+            snapshot = _tracemalloc_snapshot()
+            if self.last_snapshot:
+                stats = snapshot.compare_to(self.last_snapshot, "lineno")
+            else:
+                stats = snapshot.statistics("lineno")
+            lines = [str(stat) for stat in stats[:limit]]
+        else:
+            snapshot = _object_counts()
+            diff = Counter(snapshot)
+            if self.last_snapshot:
+                diff.subtract(self.last_snapshot)
+            lines = ["{0} {1:+d} (total {2})".format(name, count, snapshot[name])
+                     for name, count in sorted(
+                         diff.items(), key=lambda item: -abs(item[1]))[:limit]
+                     if count]
+
+        self.last_snapshot = snapshot
+        return "\n".join(lines) + "\n"
+
+    def gc_stats(self, context):
+        stats = dict(
+            enabled=gc.isenabled(),
+            count=gc.get_count(),
+            threshold=gc.get_threshold(),
+            objects=len(gc.get_objects()),
+            garbage=len(gc.garbage))
+        if context.get("collect"):
+            stats["collected"] = gc.collect()
+        return json.dumps(stats, sort_keys=True)
@@ -5,7 +5,7 @@ from tornado import gen
 import h11
 from microproxy.protocol.http1 import Connection as Http1Connection
 from microproxy.protocol.http2 import Connection as Http2Connection
-from microproxy.utils import curr_loop
+from microproxy.utils import curr_loop, monotonic
 from microproxy.context import ViewerContext, LayerContext
 from microproxy.layer import manager as default_layer_manager
 
@@ -39,9 +39,11 @@ class ReplayHandler(object):
                 src_stream=read_stream,
                 host=viewer_context.host,
                 port=viewer_context.port,
-                scheme=viewer_context.scheme)
+                scheme=viewer_context.scheme,
+                timing={"accept": monotonic()})
 
-            initial_layer = self.layer_manager.get_first_layer(layer_context)
+            initial_layer = self.layer_manager.get_first_layer(
+                layer_context, config=self.server_state.config)
             yield self.layer_manager.run_layers(
                 self.server_state, initial_layer, layer_context)
         except Exception as e:
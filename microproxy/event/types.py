@@ -1 +1,8 @@
 REPLAY = "replay"
+PROFILE_START = "profile_start"
+PROFILE_STOP = "profile_stop"
+MEMORY_SNAPSHOT = "memory_snapshot"
+GC_STATS = "gc_stats"
+
+# NOTE: the profiling state is per process, so these are sent to every worker.
+BROADCAST_EVENTS = (PROFILE_START, PROFILE_STOP, MEMORY_SNAPSHOT, GC_STATS)
@@ -36,3 +36,9 @@ class Http2Error(Exception):
 
 class TlsError(Exception):
     pass
+
+
+class PluginError(Exception):
+    def __init__(self, plugin_name, error):
+        super(PluginError, self).__init__(
+            "Plugin {0} failed with {1}".format(plugin_name, repr(error)))
@@ -1,3 +1,4 @@
 from msg_publisher import MsgPublisher
 from plugin_manager import PluginManager
 from interceptor import Interceptor
+from capture import CapturePolicy
@@ -0,0 +1,80 @@
+import copy
+from fnmatch import fnmatch
+
+
+def parse_content_type_limits(limits):
+    """Parse the content type limits in the form of ["image/*=0", "text/html=1024"].
+
+    Returns:
+        (list): [(content type pattern, limit)]
+    """
+    results = []
+    for limit in limits:
+        content_type, sep, size = limit.rpartition("=")
+        if not sep or not content_type:
+            raise ValueError("Invalid capture content type limit: {0}".format(limit))
+        try:
+            results.append((content_type.strip().lower(), int(size)))
+        except ValueError:
+            raise ValueError("Invalid capture content type limit: {0}".format(limit))
+    return results
+
+
+class CapturePolicy(object):
+    """CapturePolicy: Decide which exchanges and how much of their bodies are published.
+
+    Patterns of include and exclude are matched against host + path, e.g. "*.example.com/api/*",
+    a pattern without "/" matches the host only.
+    A negative limit means the body is captured completely.
+    """
+    def __init__(self, config=None):
+        super(CapturePolicy, self).__init__()
+        config = config or {}
+        self.max_body = config.get("capture_max_body", -1)
+        self.headers_only = config.get("capture_headers_only", False)
+        self.content_type_limits = parse_content_type_limits(
+            config.get("capture_content_type_limits", []))
+        self.include = [self._normalize_pattern(p) for p in config.get("capture_include", [])]
+        self.exclude = [self._normalize_pattern(p) for p in config.get("capture_exclude", [])]
+
+    def _normalize_pattern(self, pattern):
+        if "/" not in pattern:
+            return pattern + "/*"
+        return pattern
+
+    def should_capture(self, host, path):
+        target = host + (path if path.startswith("/") else "/" + path)
+        if self.include and not any(fnmatch(target, p) for p in self.include):
+            return False
+        return not any(fnmatch(target, p) for p in self.exclude)
+
+    def body_limit(self, headers):
+        if self.headers_only:
+            return 0
+
+        content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+
+        for pattern, limit in self.content_type_limits:
+            if fnmatch(content_type, pattern):
+                return limit
+        return self.max_body
+
+    def truncate(self, message, body_length=None):
+        """Truncate the body of HttpRequest or HttpResponse by the limits.
+
+        The message is copied when truncated, the original one is left untouched.
+        body_length is the length of the original body when the message only
+        keeps a preview of it, e.g. a streamed body.
+
+        Returns:
+            (tuple): (message, original body length, truncated or not)
+        """
+        if message is None:
+            return (None, 0, False)
+
+        length = len(message.body) if body_length is None else body_length
+        limit = self.body_limit(message.headers)
+        if 0 <= limit < len(message.body):
+            message = copy.copy(message)
+            message.body = message.body[:limit]
+        return (message, length, len(message.body) < length)
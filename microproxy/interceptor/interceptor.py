@@ -1,12 +1,46 @@
+from tornado.concurrent import TracebackFuture
+
 from microproxy.context import ViewerContext, PluginContext
+from capture import CapturePolicy
+
+# NOTE: shared by every exchange no plugin is interested in.
+_NO_PLUGIN_RESULT = TracebackFuture()
+_NO_PLUGIN_RESULT.set_result(None)
+
+
+def relative_timing(*timings):
+    """Merge monotonic timestamps into milliseconds since accept, or since the first phase."""
+    merged = {}
+    for timing in timings:
+        merged.update(timing or {})
+    if not merged:
+        return {}
+
+    start = merged.get("accept", min(merged.values()))
+    return {phase: round((timestamp - start) * 1000, 3)
+            for phase, timestamp in merged.iteritems()}
 
 
 class Interceptor(object):
-    def __init__(self, plugin_manager=None, msg_publisher=None):
+    def __init__(self, plugin_manager=None, msg_publisher=None, capture_policy=None):
         self.msg_publisher = msg_publisher
         self.plugin_manager = plugin_manager
+        self.capture_policy = capture_policy or CapturePolicy()
 
     def request(self, layer_context, request):
+        """Run the request hooks of the plugins matching the request.
+
+        Returns:
+            (Future): Resolved with the context returned by the plugins,
+                or None if no plugin matches.
+        """
+        if self.plugin_manager is None:
+            return _NO_PLUGIN_RESULT
+
+        hooks = self.plugin_manager.request_hooks(layer_context.host, request)
+        if not hooks:
+            return _NO_PLUGIN_RESULT
+
         plugin_context = PluginContext(
             scheme=layer_context.scheme,
             host=layer_context.host,
@@ -14,14 +48,23 @@ class Interceptor(object):
             path=request.path,
             request=request,
             response=None)
+        return self.plugin_manager.exec_hooks(hooks, plugin_context)
+
+    def response(self, layer_context, request, response):
+        """Run the response hooks of the plugins matching the exchange.
 
+        Returns:
+            (Future): Resolved with the context returned by the plugins,
+                or None if no plugin matches.
+        """
         if self.plugin_manager is None:
-            return plugin_context
+            return _NO_PLUGIN_RESULT
 
-        new_plugin_context = self.plugin_manager.exec_request(plugin_context)
-        return new_plugin_context
+        hooks = self.plugin_manager.response_hooks(
+            layer_context.host, request, response)
+        if not hooks:
+            return _NO_PLUGIN_RESULT
 
-    def response(self, layer_context, request, response):
         plugin_context = PluginContext(
             scheme=layer_context.scheme,
             host=layer_context.host,
@@ -29,16 +72,26 @@ class Interceptor(object):
             path=request.path,
             request=request,
             response=response)
+        return self.plugin_manager.exec_hooks(hooks, plugin_context)
 
-        if self.plugin_manager is None:
-            return plugin_context
-
-        new_plugin_context = self.plugin_manager.exec_response(plugin_context)
-        return new_plugin_context
+    def publish(self, layer_context, request, response, timing=None,
+                request_body_length=None, response_body_length=None):
+        """Publish the exchange to the viewers.
 
-    def publish(self, layer_context, request, response):
+        timing is the monotonic timestamps of the exchange phases, they are published
+        with the connection phases of the layer context in milliseconds since accept.
+        request_body_length and response_body_length are the lengths of the
+        streamed bodies, of which the messages only keep a preview.
+        """
         if self.msg_publisher is None:
             return
+        if not self.capture_policy.should_capture(layer_context.host, request.path):
+            return
+
+        request, request_body_length, request_truncated = (
+            self.capture_policy.truncate(request, request_body_length))
+        response, response_body_length, response_truncated = (
+            self.capture_policy.truncate(response, response_body_length))
 
         viewer_context = ViewerContext(
             scheme=layer_context.scheme,
@@ -48,6 +101,10 @@ class Interceptor(object):
             request=request,
             response=response,
             client_tls=layer_context.client_tls,
-            server_tls=layer_context.server_tls)
+            server_tls=layer_context.server_tls,
+            truncated=request_truncated or response_truncated,
+            request_body_length=request_body_length,
+            response_body_length=response_body_length,
+            timing=relative_timing(layer_context.timing, timing))
 
         self.msg_publisher.publish(viewer_context)
@@ -1,14 +1,109 @@
 import json
+from collections import deque
+
+from microproxy import metrics
+from microproxy.context.viewer import BINARY_TOPIC
+from microproxy.utils import curr_loop
+from microproxy.log import ProxyLogger
+logger = ProxyLogger.get_logger(__name__)
+
+_published_total = metrics.registry.counter(
+    "microproxy_published_total", "Exchanges published to the viewers")
+_publish_dropped_total = metrics.registry.counter(
+    "microproxy_publish_dropped_total", "Exchanges dropped since the publish queue was full")
+_publish_queue_size = metrics.registry.gauge(
+    "microproxy_publish_queue_size", "Exchanges waiting to be published")
 
 
 class MsgPublisher(object):
+    """MsgPublisher: Publish viewer contexts in batches off the request path.
+
+    publish only queues the context, serializing and sending happen later on
+    the io loop, several contexts per multipart message: [TOPIC, msg, msg, ...].
+    Contexts are dropped when the queue is full.
+    The topic tells viewers the format, BINARY_TOPIC is for ViewerContext.serialize_binary.
+    """
     TOPIC = "message"
+    BINARY_TOPIC = BINARY_TOPIC
 
-    def __init__(self, config, zmq_socket):
+    def __init__(self, config, zmq_socket, io_loop=None):
         super(MsgPublisher, self).__init__()
+        config = config or {}
         self.zmq_socket = zmq_socket
+        self.io_loop = io_loop or curr_loop()
+        self.queue_size = config.get("publish_queue_size", 1000)
+        self.batch_size = config.get("publish_batch_size", 64)
+        self.interval = config.get("publish_interval", 50) / 1000.0
+        if config.get("viewer_format", "json") == "binary":
+            self.topic = self.BINARY_TOPIC
+            self.encode = self._encode_binary
+        else:
+            self.topic = self.TOPIC
+            self.encode = self._encode_json
+
+        self.queue = deque()
+        self.flush_scheduled = False
+        self.flush_timeout = None
+        self.published = 0
+        self.dropped = 0
 
     def publish(self, viewer_context):
-        message = json.dumps(viewer_context.serialize())
-        self.zmq_socket.send_multipart([
-            self.TOPIC, message])
+        if len(self.queue) >= self.queue_size:
+            self.dropped += 1
+            _publish_dropped_total.inc()
+            if self.dropped % 1000 == 1:
+                logger.warning("publish queue is full, {0} messages dropped".format(
+                    self.dropped))
+            return
+
+        self.queue.append(viewer_context)
+        _publish_queue_size.set(len(self.queue))
+        if len(self.queue) >= self.batch_size:
+            self._schedule_flush()
+        elif self.flush_timeout is None and not self.flush_scheduled:
+            self.flush_timeout = self.io_loop.call_later(
+                self.interval, self._on_flush_timeout)
+
+    def _on_flush_timeout(self):
+        self.flush_timeout = None
+        self.flush()
+
+    def _schedule_flush(self):
+        if self.flush_scheduled:
+            return
+        if self.flush_timeout is not None:
+            self.io_loop.remove_timeout(self.flush_timeout)
+            self.flush_timeout = None
+        self.flush_scheduled = True
+        self.io_loop.add_callback(self._run_scheduled_flush)
+
+    def _run_scheduled_flush(self):
+        self.flush_scheduled = False
+        self.flush()
+
+    def flush(self):
+        """Send one batch, the rest is sent on the next io loop iteration."""
+        if not self.queue:
+            return
+
+        messages = [self.topic]
+        while self.queue and len(messages) <= self.batch_size:
+            messages.append(self.encode(self.queue.popleft()))
+
+        self.zmq_socket.send_multipart(messages)
+        self.published += len(messages) - 1
+        _published_total.inc(len(messages) - 1)
+        _publish_queue_size.set(len(self.queue))
+
+        if self.queue:
+            self._schedule_flush()
+
+    def send(self, topic, message):
+        """Send a message of another topic right away, bypassing the queue."""
+        self.zmq_socket.send_multipart([topic, message])
+
+    def _encode_json(self, viewer_context):
+        return json.dumps(viewer_context.serialize())
+
+    def _encode_binary(self, viewer_context):
+        return viewer_context.serialize_binary()
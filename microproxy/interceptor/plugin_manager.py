@@ -1,6 +1,13 @@
+import ast
+import multiprocessing.util
 import os
 import sys
-from copy import copy
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from copy import copy, deepcopy
+from datetime import timedelta
+from functools import partial
+from tornado import gen
+from tornado.concurrent import FUTURES, TracebackFuture, chain_future, is_future
 from watchdog.events import RegexMatchingEventHandler
 
 if sys.platform == "darwin":
@@ -8,9 +15,74 @@ if sys.platform == "darwin":
 else:
     from watchdog.observers import Observer
 
+from microproxy import metrics
+from microproxy.exception import PluginError
 from microproxy.log import ProxyLogger
+from microproxy.utils import curr_loop
+from plugin_route import PluginMatcher, HookTable
+from plugin_worker import exec_plugin, run_hook
 logger = ProxyLogger.get_logger(__name__)
 
+_plugin_errors_total = metrics.registry.counter(
+    "microproxy_plugin_errors_total", "Failed or timed out plugin hooks",
+    ["plugin", "error"])
+
+# NOTE: the worker processes of RUN_IN_PROCESS plugins, see start_plugin_processes
+_process_executor = None
+
+
+def _run_in_process(plugin_path):
+    """Read RUN_IN_PROCESS from the module level assignments of the script.
+
+    The script is not executed, its top level code runs once when it is loaded
+    as a Plugin, and the threads it may start must not be forked.
+    """
+    try:
+        with open(plugin_path) as fp:
+            module = ast.parse(fp.read(), plugin_path)
+    except (IOError, SyntaxError):
+        # NOTE: the error is reported when the plugin is loaded.
+        return False
+
+    run_in_process = False
+    for node in module.body:
+        if not isinstance(node, ast.Assign):
+            continue
+        if any(isinstance(target, ast.Name) and target.id == "RUN_IN_PROCESS"
+               for target in node.targets):
+            try:
+                run_in_process = bool(ast.literal_eval(node.value))
+            except ValueError:
+                run_in_process = False
+    return run_in_process
+
+
+def _close_socket(sock):
+    sock.close()
+
+
+def start_plugin_processes(config, sockets=()):
+    """Fork the worker processes when a plugin runs with RUN_IN_PROCESS.
+
+    Call it before any thread, zmq context or socket is created, since the
+    worker processes are forked from the proxy and would inherit them.
+    sockets created before, e.g. the listening sockets of --workers,
+    are closed in the worker processes.
+
+    Returns:
+        (object): The ProcessPoolExecutor, or None if no plugin needs it.
+    """
+    global _process_executor
+    if _process_executor is None and any(
+            _run_in_process(path) for path in config["plugins"]):
+        for sock in sockets:
+            multiprocessing.util.register_after_fork(sock, _close_socket)
+        executor = ProcessPoolExecutor(config.get("plugin_processes", 0) or None)
+        # NOTE: all the processes are forked on the first submit.
+        executor.submit(os.getpid).result()
+        _process_executor = executor
+    return _process_executor
+
 
 class PluginEventHandler(RegexMatchingEventHandler):
     def __init__(self, filename, callback):
@@ -23,13 +95,41 @@ class PluginEventHandler(RegexMatchingEventHandler):
 
 
 class Plugin(object):
+    """Plugin: A python script with on_request and on_response hooks.
+
+    The script is reloaded when modified, on_load is called after every load.
+    A script could also define:
+        COPY_CONTEXT = True to get a copy of the context
+            instead of the one returned by the previous plugin.
+        MATCH to limit the exchanges it is called for, see PluginMatcher.
+        RUN_IN_EXECUTOR = True to run the hooks in the plugin thread pool,
+            the hooks get a deep copy of the context then.
+        RUN_IN_PROCESS = True to run the hooks in the plugin worker processes,
+            for CPU heavy plugins. The script is loaded in every worker,
+            the hooks get an unpickled context and have to return a picklable one.
+            The processes are started with the proxy, see start_plugin_processes,
+            which reads the flag without running the script, so assign it a literal.
+        TIMEOUT in seconds to wait for hooks returning a future
+            or running in the thread pool.
+        FAIL_POLICY, "open" to skip the plugin when its hook failed or timed out,
+            "closed" to fail the exchange.
+    Hooks could return a future of the context, e.g. a tornado coroutine.
+    """
     PLUGIN_METHODS = ["on_request", "on_response"]
+    FAIL_POLICIES = ["open", "closed"]
 
-    def __init__(self, plugin_path):
+    def __init__(self, plugin_path, on_load=None):
         self.plugin_path = os.path.abspath(plugin_path)
         self.plugin_name = os.path.basename(self.plugin_path)
         self.plugin_dir = os.path.dirname(self.plugin_path)
         self.namespace = None
+        self.matcher = None
+        self.copy_context = False
+        self.run_in_executor = False
+        self.run_in_process = False
+        self.timeout = None
+        self.fail_policy = None
+        self.on_load = on_load
         self._load_plugin()
         self._register_watcher()
 
@@ -42,23 +142,58 @@ class Plugin(object):
         self.observer.start()
 
     def _load_plugin(self):
-        sys.path.append(os.path.dirname(self.plugin_path))
+        self.namespace = {"__file__": self.plugin_path}
         try:
-            with open(self.plugin_path) as fp:
-                self.namespace = {"__file__": self.plugin_path}
-                code = compile(fp.read(), self.plugin_path, "exec")
-                exec (code, self.namespace, self.namespace)
-
+            exec_plugin(self.plugin_path, self.namespace)
         except Exception as e:
             logger.exception(e)
 
-        sys.path.pop()
+        try:
+            self._load_options()
+        except ValueError as e:
+            logger.error("Plugin {0} is disabled: {1}".format(self.plugin_name, e))
+            self.matcher = None
         logger.info("Load Plugin : {0}".format(self.plugin_name))
+        if self.on_load:
+            self.on_load(self)
+
+    def _load_options(self):
+        fail_policy = self.namespace.get("FAIL_POLICY")
+        if fail_policy is not None and fail_policy not in self.FAIL_POLICIES:
+            raise ValueError("FAIL_POLICY should be one of {0}".format(self.FAIL_POLICIES))
+        timeout = self.namespace.get("TIMEOUT")
+        if timeout is not None and not isinstance(timeout, (int, float)):
+            raise ValueError("TIMEOUT should be a number")
+
+        self.copy_context = bool(self.namespace.get("COPY_CONTEXT", False))
+        self.run_in_executor = bool(self.namespace.get("RUN_IN_EXECUTOR", False))
+        self.run_in_process = bool(self.namespace.get("RUN_IN_PROCESS", False))
+        self.timeout = timeout
+        self.fail_policy = fail_policy
+        self.matcher = PluginMatcher(self.namespace.get("MATCH"))
 
     def _reload_plugin(self):
         logger.info("Reload Plugin : {0}".format(self.plugin_name))
         self._load_plugin()
 
+    def get_hook(self, name):
+        """Get the hook defined in the script, or None if not defined or disabled."""
+        if name not in self.PLUGIN_METHODS:
+            raise ValueError("Unknown plugin hook: {0}".format(name))
+        if self.matcher is None:
+            return None
+        hook = self.namespace.get(name)
+        if not callable(hook):
+            return None
+        if self.run_in_process:
+            # NOTE: the worker processes load the script by path and call the hook by name
+            return partial(run_hook, self.plugin_path, name)
+        return hook
+
+    def close(self):
+        self.observer.stop()
+        self.observer.join()
+
     def __getattr__(self, attr):
         if attr not in self.PLUGIN_METHODS:
             raise AttributeError
@@ -69,41 +204,177 @@ class Plugin(object):
 
 
 class PluginManager(object):
+    """PluginManager: Run the hooks of the plugins in the loaded order.
+
+    The hooks are collected into one dispatch table per hook when plugins
+    are loaded or reloaded, plugins without the hook are not visited per request.
+    The tables select the hooks matching the exchange, see HookTable.
+    """
     def __init__(self, config):
+        self.timeout = config.get("plugin_timeout", 5)
+        self.fail_policy = config.get("plugin_fail_policy", "closed")
+        self.workers = config.get("plugin_workers", 4)
+        self.executor = None
+        self.process_executor = _process_executor
         self.plugins = []
+        self.hooks = {name: HookTable() for name in Plugin.PLUGIN_METHODS}
         self.load_plugins(config["plugins"])
 
     def load_plugins(self, plugin_paths):
         for plugin_path in plugin_paths:
-            plugin = Plugin(plugin_path)
+            plugin = Plugin(plugin_path, on_load=self._on_plugin_load)
             self.plugins.append(plugin)
+        self.build_hooks()
+
+    def _on_plugin_load(self, plugin):
+        # NOTE: called in the watcher thread on reload,
+        # the tables are replaced as a whole so running requests are not affected.
+        if plugin in self.plugins:
+            self.build_hooks()
+
+    def build_hooks(self):
+        hooks = {}
+        for name in Plugin.PLUGIN_METHODS:
+            entries = []
+            for plugin in self.plugins:
+                hook = plugin.get_hook(name)
+                if hook:
+                    entries.append((hook, plugin, plugin.matcher))
+            hooks[name] = HookTable(entries)
+        self.hooks = hooks
+
+    def request_hooks(self, host, request):
+        return self.hooks["on_request"].select(
+            host, request.path, request.method, request.headers)
+
+    def response_hooks(self, host, request, response):
+        return self.hooks["on_response"].select(
+            host, request.path, request.method, response.headers)
 
     def exec_request(self, plugin_context):
-        if len(self.plugins) == 0:
-            return plugin_context
+        hooks = self.request_hooks(plugin_context.host, plugin_context.request)
+        return self.exec_hooks(hooks, plugin_context)
+
+    def exec_response(self, plugin_context):
+        hooks = self.response_hooks(
+            plugin_context.host, plugin_context.request, plugin_context.response)
+        return self.exec_hooks(hooks, plugin_context)
+
+    def exec_hooks(self, hooks, plugin_context):
+        """Run the hooks in order, each gets the context returned by the previous one.
+
+        Synchronous hooks run inline, the hooks are continued in a coroutine
+        from the first one returning a future or running in a pool.
+
+        Returns:
+            (Future): Resolved with the context returned by the last hook.
+
+        Raises:
+            PluginError: If a hook of a fail closed plugin failed or timed out.
+        """
+        future = TracebackFuture()
+        index = 0
+        for hook, plugin in hooks:
+            if plugin.run_in_executor or plugin.run_in_process:
+                chain_future(self._exec_hooks_async(hooks[index:], plugin_context), future)
+                return future
+            if plugin.copy_context:
+                plugin_context = copy(plugin_context)
 
-        current_context = copy(plugin_context)
-        for plugin in self.plugins:
             try:
-                new_context = plugin.on_request(current_context)
-                current_context = copy(new_context)
-            except AttributeError:
-                logger.debug(
-                    "Plugin {0} does not have on_request".format(
-                        plugin.namespace["__file__"].split("/")[-1]))
-        return current_context
+                result = hook(plugin_context)
+            except Exception as e:
+                try:
+                    self._on_hook_error(plugin, e)
+                except PluginError:
+                    future.set_exc_info(sys.exc_info())
+                    return future
+                index += 1
+                continue
 
-    def exec_response(self, plugin_context):
-        if len(self.plugins) == 0:
-            return plugin_context
+            if result is not plugin_context and isinstance(result, FUTURES):
+                chain_future(self._exec_hooks_async(
+                    hooks[index:], plugin_context, result), future)
+                return future
+            plugin_context = result
+            index += 1
 
-        current_context = copy(plugin_context)
-        for plugin in self.plugins:
+        future.set_result(plugin_context)
+        return future
+
+    @gen.coroutine
+    def _exec_hooks_async(self, hooks, plugin_context, result=None):
+        """Continue exec_hooks, result is the future of the first hook if it was called."""
+        for hook, plugin in hooks:
+            timeout = timedelta(seconds=plugin.timeout or self.timeout)
             try:
-                new_context = plugin.on_response(current_context)
-                current_context = copy(new_context)
-            except AttributeError:
-                logger.debug(
-                    "Plugin {0} does not have on_response".format(
-                        plugin.namespace["__file__"].split("/")[-1]))
-        return current_context
+                if result is None:
+                    hook_context = plugin_context
+                    if plugin.run_in_executor:
+                        # NOTE: the hook may still run after its timeout,
+                        # so it must not share the messages with the io loop.
+                        hook_context = deepcopy(plugin_context)
+                    elif plugin.copy_context:
+                        hook_context = copy(plugin_context)
+                    result = self._call_hook(hook, plugin, hook_context, timeout)
+                if is_future(result):
+                    result = yield gen.with_timeout(timeout, result)
+            except Exception as e:
+                self._on_hook_error(plugin, e)
+                result = None
+                continue
+
+            plugin_context, result = result, None
+        raise gen.Return(plugin_context)
+
+    def _on_hook_error(self, plugin, error):
+        _plugin_errors_total.inc(labels=(plugin.plugin_name, type(error).__name__))
+        if (plugin.fail_policy or self.fail_policy) == "closed":
+            raise PluginError(plugin.plugin_name, error)
+        logger.warning("Plugin {0} failed and skipped: {1}".format(
+            plugin.plugin_name, repr(error)))
+
+    def _call_hook(self, hook, plugin, plugin_context, timeout=None):
+        if plugin.run_in_process:
+            if self.process_executor is None:
+                # NOTE: forking now would copy the threads and sockets of the proxy.
+                raise RuntimeError("plugin processes are not started, "
+                                   "restart the proxy to run the plugin in processes")
+            executor = self.process_executor
+        elif plugin.run_in_executor:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(self.workers)
+            executor = self.executor
+        else:
+            return hook(plugin_context)
+
+        # NOTE: the executor resolves its future in its own thread,
+        # copy the result into a tornado future on the io loop.
+        io_loop = curr_loop()
+        executor_future = executor.submit(hook, plugin_context)
+        future = TracebackFuture()
+
+        def on_done(f):
+            if not future.done():
+                chain_future(f, future)
+
+        def on_timeout():
+            if not future.done():
+                # NOTE: drop the result arriving after the timeout,
+                # the hook is not run at all when it is still queued.
+                executor_future.cancel()
+                future.set_exception(gen.TimeoutError("Timeout"))
+
+        io_loop.add_future(executor_future, on_done)
+        if timeout is not None:
+            handle = io_loop.call_later(timeout.total_seconds(), on_timeout)
+            future.add_done_callback(lambda _: io_loop.remove_timeout(handle))
+        return future
+
+    def close(self):
+        for plugin in self.plugins:
+            plugin.close()
+        if self.executor:
+            self.executor.shutdown(wait=False)
+        if self.process_executor:
+            self.process_executor.shutdown(wait=False)
@@ -0,0 +1,92 @@
+import re
+from fnmatch import fnmatch
+
+_MATCH_KEYS = ("host", "path", "method", "content_type")
+
+
+def _to_list(value):
+    if isinstance(value, basestring):
+        return [value]
+    return list(value or [])
+
+
+def _glob_to_regex(pattern):
+    return re.escape(pattern).replace(r"\*", ".*").replace(r"\?", ".")
+
+
+class PluginMatcher(object):
+    """PluginMatcher: The exchanges a plugin is interested in.
+
+    Compiled from the MATCH dict of a plugin script, e.g.
+    MATCH = {"host": "*.example.com", "path": "/api/", "method": ["GET", "POST"],
+             "content_type": "application/json"}
+    Every key is optional and takes a string or a list of strings,
+    host and content_type are globs, path is a prefix.
+    A plugin without MATCH matches every exchange.
+    """
+    def __init__(self, match=None):
+        match = match or {}
+        if not isinstance(match, dict):
+            raise ValueError("MATCH should be a dict")
+        unknown_keys = [k for k in match if k not in _MATCH_KEYS]
+        if unknown_keys:
+            raise ValueError("Unknown MATCH keys: {0}".format(", ".join(unknown_keys)))
+
+        hosts = _to_list(match.get("host"))
+        self.host_pattern = "|".join(_glob_to_regex(h) for h in hosts) or None
+        self.host_regex = (re.compile(r"(?:{0})\Z".format(self.host_pattern), re.I)
+                           if self.host_pattern else None)
+        self.path_prefixes = tuple(_to_list(match.get("path")))
+        self.methods = set(m.upper() for m in _to_list(match.get("method")))
+        self.content_types = [c.lower() for c in _to_list(match.get("content_type"))]
+        self.match_all = not (self.host_regex or self.path_prefixes or
+                              self.methods or self.content_types)
+
+    def match(self, host, path, method, headers):
+        if self.host_regex and not self.host_regex.match(host or ""):
+            return False
+        if self.path_prefixes and not (path or "").startswith(self.path_prefixes):
+            return False
+        if self.methods and (method or "").upper() not in self.methods:
+            return False
+        if self.content_types:
+            content_type = headers.get("content-type", "") if headers else ""
+            content_type = content_type.split(";")[0].strip().lower()
+            return any(fnmatch(content_type, c) for c in self.content_types)
+        return True
+
+
+class HookTable(object):
+    """HookTable: The hooks of one kind in the plugin order with their matchers.
+
+    When every plugin of the table is scoped to some hosts,
+    their host patterns are combined into one regex,
+    so exchanges of other hosts are rejected with a single match.
+    When no plugin is scoped, every exchange gets the same precomputed hooks.
+    """
+    def __init__(self, entries=None):
+        self.entries = entries or []
+        self.unscoped_hooks = None
+        if all(m.match_all for _, _, m in self.entries):
+            self.unscoped_hooks = [(hook, plugin) for hook, plugin, _ in self.entries]
+
+        self.host_regex = None
+        if self.entries and all(m.host_pattern for _, _, m in self.entries):
+            self.host_regex = re.compile(r"(?:{0})\Z".format(
+                "|".join(m.host_pattern for _, _, m in self.entries)), re.I)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def select(self, host, path, method, headers):
+        """Select the hooks matching the exchange.
+
+        Returns:
+            (list): [(hook, plugin)] in the plugin order.
+        """
+        if self.unscoped_hooks is not None:
+            return self.unscoped_hooks
+        if self.host_regex and not self.host_regex.match(host or ""):
+            return []
+        return [(hook, plugin) for hook, plugin, matcher in self.entries
+                if matcher.match(host, path, method, headers)]
@@ -0,0 +1,31 @@
+import os
+import sys
+
+# NOTE: plugins loaded in this worker process, {plugin_path: (mtime, namespace)}
+_plugins = {}
+
+
+def exec_plugin(plugin_path, namespace):
+    """Execute the plugin script into namespace."""
+    sys.path.append(os.path.dirname(plugin_path))
+    try:
+        with open(plugin_path) as fp:
+            code = compile(fp.read(), plugin_path, "exec")
+            exec (code, namespace, namespace)
+    finally:
+        sys.path.pop()
+
+
+def run_hook(plugin_path, hook_name, plugin_context):
+    """Run the hook of a plugin in a plugin worker process.
+
+    The context is pickled from the proxy process and the returned one is pickled back.
+    The plugin is loaded on its first hook and reloaded when the script is modified.
+    """
+    mtime = os.path.getmtime(plugin_path)
+    loaded = _plugins.get(plugin_path)
+    if loaded is None or loaded[0] != mtime:
+        namespace = {"__file__": plugin_path}
+        exec_plugin(plugin_path, namespace)
+        loaded = _plugins[plugin_path] = (mtime, namespace)
+    return loaded[1][hook_name](plugin_context)
@@ -0,0 +1,104 @@
+"""This module watches the io loop for callbacks blocking it.
+
+The io loop schedules a heartbeat every interval and records how late it runs.
+A helper thread checks the heartbeat, when the loop has not beaten for
+longer than the threshold, it samples the stack of the io loop thread,
+so the blocking code shows up in the log once the loop runs again.
+"""
+import sys
+import threading
+import traceback
+
+from microproxy import metrics
+from microproxy.utils import curr_loop, monotonic
+
+from microproxy.log import ProxyLogger
+logger = ProxyLogger.get_logger(__name__)
+
+_lag_seconds = metrics.registry.histogram(
+    "microproxy_ioloop_lag_seconds", "Seconds the io loop heartbeat ran late")
+_stalls_total = metrics.registry.counter(
+    "microproxy_ioloop_stalls_total", "Io loop stalls longer than the lag threshold")
+
+
+class LagMonitor(object):
+    """LagMonitor: Measure the io loop lag and sample the stack of stalls.
+
+    Args:
+        threshold (float): Seconds of lag reported as a stall.
+        interval (float): Seconds between the heartbeats.
+    """
+    def __init__(self, threshold, interval=0.1, io_loop=None):
+        super(LagMonitor, self).__init__()
+        self.threshold = threshold
+        self.interval = interval
+        self.io_loop = io_loop or curr_loop()
+        self.loop_thread_id = None
+        self.last_beat = None
+        self.beats = 0
+        self.stall_beat = None
+        self.stall_stack = None
+        self.stopped = threading.Event()
+        self.thread = None
+        self.timeout = None
+
+    def start(self):
+        self.loop_thread_id = threading.current_thread().ident
+        self.last_beat = monotonic()
+        self.timeout = self.io_loop.call_later(self.interval, self._beat)
+
+        self.thread = threading.Thread(target=self._watch, name="lag-monitor")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.timeout:
+            self.io_loop.remove_timeout(self.timeout)
+            self.timeout = None
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def _beat(self):
+        now = monotonic()
+        lag = max(now - self.last_beat - self.interval, 0)
+        _lag_seconds.observe(lag)
+
+        # NOTE: the stall is logged here instead of in the helper thread,
+        # since the zmq socket of the logger topic is used by the io loop thread.
+        stack = self.stall_stack
+        if stack is not None:
+            self.stall_stack = None
+            _stalls_total.inc()
+            logger.warning("io loop was blocked for {0:.3f} seconds at:\n{1}".format(
+                lag + self.interval, "".join(stack)))
+
+        self.last_beat = now
+        self.beats += 1
+        if not self.stopped.is_set():
+            self.timeout = self.io_loop.call_later(self.interval, self._beat)
+
+    def _watch(self):
+        while not self.stopped.wait(self.interval):
+            beats = self.beats
+            if beats == self.stall_beat:
+                continue
+            if monotonic() - self.last_beat - self.interval < self.threshold:
+                continue
+
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            # NOTE: sample each stall only once, at the moment it exceeds the threshold.
+            self.stall_beat = beats
+            self.stall_stack = traceback.format_stack(frame)
+
+
+def start_lag_monitor(config):  # pragma: no cover
+    if not config.get("lag_threshold"):
+        return None
+
+    monitor = LagMonitor(config["lag_threshold"] / 1000.0)
+    monitor.start()
+    return monitor
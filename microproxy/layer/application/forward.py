@@ -1,6 +1,13 @@
-from tornado import concurrent
+from tornado import concurrent, gen
+from tornado.iostream import StreamClosedError
 
 from microproxy.layer.base import ApplicationLayer
+from microproxy.tornado_ext.iostream import (
+    MicroProxyIOStream, bytes_received_total, bytes_sent_total)
+from microproxy.tornado_ext.relay import SocketRelay
+
+from microproxy.log import ProxyLogger
+logger = ProxyLogger.get_logger(__name__)
 
 
 class ForwardLayer(ApplicationLayer):
@@ -10,14 +17,66 @@ class ForwardLayer(ApplicationLayer):
     def __init__(self, server_state, context):
         super(ForwardLayer, self).__init__(server_state, context)
         self._future = concurrent.Future()
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+        # NOTE: stop reading one side while the other side has more than
+        # high_water bytes unsent, resume when it is down to low_water.
+        self.high_water = self.config.get("forward_high_water", 1048576)
+        self.low_water = self.config.get("forward_low_water", 262144)
 
     def process_and_return_context(self):
-        self.src_stream.read_until_close(streaming_callback=self.on_request)
+        if (self.config.get("forward_relay", "stream") == "direct" and
+                self.can_relay_directly()):
+            return self.relay_directly()
+
         self.src_stream.set_close_callback(self.on_src_close)
-        self.dest_stream.read_until_close(streaming_callback=self.on_response)
         self.dest_stream.set_close_callback(self.on_dest_close)
+        self.pump(self.src_stream, self.dest_stream, self.on_request)
+        self.pump(self.dest_stream, self.src_stream, self.on_response)
         return self._future
 
+    @gen.coroutine
+    def pump(self, from_stream, to_stream, on_data):
+        try:
+            while True:
+                data = yield from_stream.read_bytes(
+                    from_stream.read_chunk_size, partial=True)
+                on_data(data)
+                if to_stream.write_buffer_size() > self.high_water:
+                    logger.debug("{0} pause reading, {1} bytes unsent".format(
+                        self, to_stream.write_buffer_size()))
+                    yield to_stream.wait_for_drain(self.low_water)
+        except StreamClosedError:
+            pass
+
+    def can_relay_directly(self):
+        # NOTE: tls streams and streams with buffered data need the iostream.
+        for stream in (self.src_stream, self.dest_stream):
+            if (type(stream) is not MicroProxyIOStream or stream.closed() or
+                    stream.reading() or stream.writing() or
+                    stream._read_buffer_size):
+                return False
+        return True
+
+    @gen.coroutine
+    def relay_directly(self):
+        relay = SocketRelay(self.src_stream.detach(), self.dest_stream.detach(),
+                            chunk_size=self.src_stream.read_chunk_size)
+        try:
+            yield relay.run()
+        finally:
+            self.request_bytes = relay.request_bytes
+            self.response_bytes = relay.response_bytes
+            # NOTE: the relay bypasses the iostreams, count its bytes in the metrics here.
+            transferred = self.request_bytes + self.response_bytes
+            bytes_received_total.inc(transferred)
+            bytes_sent_total.inc(transferred)
+            relay.close()
+            self.log_transferred()
+
+        raise gen.Return(self.context)
+
     def on_src_close(self):
         self.dest_stream.close()
         self.on_finish()
@@ -28,12 +87,19 @@ class ForwardLayer(ApplicationLayer):
 
     def on_finish(self):
         if self._future.running():
+            self.log_transferred()
             self._future.set_result(self.context)
 
+    def log_transferred(self):
+        logger.debug("{0} forwarded {1} bytes to dest, {2} bytes to src".format(
+            self, self.request_bytes, self.response_bytes))
+
     def on_request(self, data):
+        self.request_bytes += len(data)
         if not self.dest_stream.closed():
             self.dest_stream.write(data)
 
     def on_response(self, data):
+        self.response_bytes += len(data)
         if not self.src_stream.closed():
             self.src_stream.write(data)
@@ -8,6 +8,8 @@ from microproxy.exception import SrcStreamClosedError, DestStreamClosedError
 from microproxy.layer.base import ApplicationLayer, DestStreamCreatorMixin
 from microproxy.log import ProxyLogger
 from microproxy.protocol.http1 import Connection
+from microproxy.protocol.tls import refresh_session
+from microproxy.utils import monotonic
 
 logger = ProxyLogger.get_logger(__name__)
 
@@ -34,7 +36,7 @@ def parse_proxy_path(path):
         return (scheme, host, port, path)
 
 
-def parse_tunnel_proxy_path(path):
+def parse_tunnel_proxy_path(path, https_ports=()):
     default_schemes = {
         80: "http",
         443: "https"
@@ -46,13 +48,15 @@ def parse_tunnel_proxy_path(path):
     else:
         host = groups[0]
         port = int(groups[2])
-        scheme = default_schemes.get(port, "http")
+        scheme = "https" if port in https_ports else default_schemes.get(port, "http")
         return (scheme, host, port)
 
 
 class Http1Layer(ApplicationLayer, DestStreamCreatorMixin):
     def __init__(self, server_state, context):
         super(Http1Layer, self).__init__(server_state, context)
+        self.stream_body = self.config.get("stream_body", False)
+        self.stream_preview_size = self.config.get("stream_preview_size", 65536)
         self.src_conn = Connection(
             h11.SERVER,
             self.src_stream,
@@ -64,25 +68,44 @@ class Http1Layer(ApplicationLayer, DestStreamCreatorMixin):
             self.dest_stream,
             conn_type="dest",
             on_response=self.on_response,
-            on_info_response=self.on_info_response)
+            on_info_response=self.on_info_response,
+            on_response_headers=(self.on_response_headers if self.stream_body else None),
+            on_data=self.on_response_data,
+            on_end_of_message=self.on_response_end)
         self.req = None
         self.resp = None
         self.switch_protocol = False
+        self.resp_streaming = False
+        self.resp_completed = False
+        self.resp_chunks = []
+        self.resp_preview = []
+        self.resp_preview_size = 0
+        self.resp_body_length = None
+        # NOTE: monotonic timestamps of the phases of the current exchange
+        self.timing = {}
 
     @gen.coroutine
     def process_and_return_context(self):
         while not self.finished():
             self.req = None
             self.resp = None
+            self.resp_streaming = False
+            self.resp_body_length = None
+            self.timing = {}
             try:
                 yield self.read_request()
+                yield self.intercept_request()
                 yield self.handle_http_proxy()
                 self.send_request()
                 yield self.read_response()
-                self.send_response()
+                yield self.intercept_response()
+                if self.resp_streaming:
+                    yield self.stream_response()
+                else:
+                    self.send_response()
             except SrcStreamClosedError:
                 if self.dest_stream:
-                    self.dest_stream.close()
+                    self.release_dest_stream()
                 self.context.done = True
                 if self.req:
                     raise
@@ -108,6 +131,7 @@ class Http1Layer(ApplicationLayer, DestStreamCreatorMixin):
                 raise SrcStreamClosedError(detail="read request failed")
             else:
                 self.src_conn.receive(data, raise_exception=True)
+        self.timing["request"] = monotonic()
         logger.debug("{0} received request: {1}".format(self, self.req))
 
     @gen.coroutine
@@ -123,14 +147,21 @@ class Http1Layer(ApplicationLayer, DestStreamCreatorMixin):
                 self.dest_conn.receive(b"", raise_exception=False)
                 break
             else:
+                if "response_start" not in self.timing:
+                    self.timing["response_start"] = monotonic()
                 self.dest_conn.receive(data, raise_exception=True)
         logger.debug("{0} received response: {1}".format(self, self.resp))
 
     def on_request(self, request):
-        plugin_result = self.interceptor.request(
-            layer_context=self.context, request=request)
+        self.req = request
 
-        self.req = plugin_result.request if plugin_result else request
+    @gen.coroutine
+    def intercept_request(self):
+        # NOTE: plugins could be asynchronous, so they run after h11 delivered the request.
+        plugin_result = yield self.interceptor.request(
+            layer_context=self.context, request=self.req)
+        if plugin_result:
+            self.req = plugin_result.request
 
     def send_request(self):
         try:
@@ -140,11 +171,17 @@ class Http1Layer(ApplicationLayer, DestStreamCreatorMixin):
                 _wrap_req_path(self.context, self.req)))
 
     def on_response(self, response):
-        plugin_result = self.interceptor.response(
-            layer_context=self.context,
-            request=self.req, response=response)
+        self.resp = response
 
-        self.resp = plugin_result.response if plugin_result else response
+    @gen.coroutine
+    def intercept_response(self):
+        if not self.resp:
+            return
+        plugin_result = yield self.interceptor.response(
+            layer_context=self.context,
+            request=self.req, response=self.resp)
+        if plugin_result:
+            self.resp = plugin_result.response
 
     def send_response(self):
         try:
@@ -158,11 +195,72 @@ class Http1Layer(ApplicationLayer, DestStreamCreatorMixin):
             raise SrcStreamClosedError(detail="send response failed {0}".format(
                 _wrap_req_path(self.context, self.req)))
 
+    def on_response_headers(self, response):
+        self.resp = response
+        self.resp_streaming = True
+        self.resp_completed = False
+        self.resp_chunks = []
+        self.resp_preview = []
+        self.resp_preview_size = 0
+        self.resp_body_length = 0
+
+    def on_response_data(self, data):
+        # NOTE: h11 may deliver headers and body in the same receive call,
+        # so chunks are queued until the response headers had been sent.
+        self.resp_chunks.append(data)
+        self.resp_body_length += len(data)
+        if self.resp_preview_size < self.stream_preview_size:
+            preview = data[:self.stream_preview_size - self.resp_preview_size]
+            self.resp_preview.append(preview)
+            self.resp_preview_size += len(preview)
+
+    def on_response_end(self):
+        self.resp_completed = True
+
+    @gen.coroutine
+    def stream_response(self):
+        try:
+            self.src_conn.send_response_headers(self.resp)
+            while True:
+                self.flush_response_chunks()
+                if self.resp_completed:
+                    break
+                yield self.wait_src_drained()
+                try:
+                    data = yield self.dest_stream.read_bytes(
+                        self.dest_stream.max_buffer_size, partial=True)
+                except StreamClosedError:
+                    # NOTE: response without length is finished by closing the connection
+                    self.dest_conn.receive(b"", raise_exception=False)
+                    if not self.resp_completed:
+                        self.flush_response_chunks()
+                        raise DestStreamClosedError(detail="read response body failed {0}".format(
+                            _wrap_req_path(self.context, self.req)))
+                else:
+                    self.dest_conn.receive(data, raise_exception=True)
+
+            self.src_conn.send_end_of_message()
+        except StreamClosedError:
+            raise SrcStreamClosedError(detail="send response failed {0}".format(
+                _wrap_req_path(self.context, self.req)))
+
+        self.resp.body = b"".join(self.resp_preview)
+        self.finish()
+
+    def flush_response_chunks(self):
+        chunks, self.resp_chunks = self.resp_chunks, []
+        for chunk in chunks:
+            self.src_conn.send_data(chunk)
+
+    @gen.coroutine
+    def wait_src_drained(self):
+        # NOTE: stop reading from dest until src consumed what we had written,
+        # so the memory used by one response is bounded by a single read.
+        if self.src_stream.writing():
+            yield self.src_stream.write(b"")
+
     def on_info_response(self, response):
-        plugin_result = self.interceptor.response(
-            layer_context=self.context,
-            request=self.req, response=response)
-        self.resp = plugin_result.response if plugin_result else response
+        self.resp = response
 
     def finished(self):
         return (self.switch_protocol or
@@ -170,14 +268,16 @@ class Http1Layer(ApplicationLayer, DestStreamCreatorMixin):
                 (self.dest_stream and self.dest_stream.closed()))
 
     def finish(self, switch_protocol=False):
+        self.timing["response"] = monotonic()
         self.interceptor.publish(
             layer_context=self.context,
-            request=self.req, response=self.resp)
+            request=self.req, response=self.resp, timing=self.timing,
+            response_body_length=self.resp_body_length)
         if (self.context.mode == "replay" or
                 self.src_conn.closed() or
                 self.dest_conn.closed()):
             self.src_stream.close()
-            self.dest_stream.close()
+            self.release_dest_stream()
             self.context.done = True
         elif switch_protocol:
             self.switch_protocol = True
@@ -189,8 +289,11 @@ class Http1Layer(ApplicationLayer, DestStreamCreatorMixin):
     def handle_http_proxy(self):
         if self.is_tunnel_http_proxy():
             logger.debug("{0} proxy tunnel to {1}".format(self, self.req.path))
-            scheme, host, port = parse_tunnel_proxy_path(self.req.path)
-            yield self.connect_to_dest(scheme, (host, port))
+            scheme, host, port = parse_tunnel_proxy_path(
+                self.req.path, self.config.get("https_port", []))
+            # NOTE: TlsLayer takes the idle stream from the pool without connecting here.
+            yield self.connect_to_dest(scheme, (host, port), connect=not (
+                scheme == "https" and self.has_idle_tls_stream(host, port)))
             self.src_conn.send_response(HttpResponse(
                 code="200",
                 reason="OK", version="HTTP/1.1"))
@@ -212,13 +315,15 @@ class Http1Layer(ApplicationLayer, DestStreamCreatorMixin):
                 self.req.path.startswith("https://"))
 
     @gen.coroutine
-    def connect_to_dest(self, scheme, addr):
+    def connect_to_dest(self, scheme, addr, connect=True):
         if addr != (self.context.host, self.context.port):
             logger.debug("{0} proxy to new connection {1}".format(self, addr))
             if self.dest_stream:
-                self.dest_stream.close()
+                self.release_dest_stream()
 
-            dest_stream = yield self.create_dest_stream(addr)
+            dest_stream = None
+            if connect:
+                dest_stream = yield self.create_dest_stream(addr)
             self.context.dest_stream = dest_stream
             self.context.scheme = scheme
             self.context.host = addr[0]
@@ -227,6 +332,29 @@ class Http1Layer(ApplicationLayer, DestStreamCreatorMixin):
         else:
             logger.debug("{0} proxy to same connection".format(self))
 
+    def release_dest_stream(self):
+        """Put the dest stream back to the pool if the connection could be reused, otherwise close it."""
+        reusable = (self.dest_pool and
+                    self.context.mode != "replay" and
+                    not self.dest_stream.closed() and
+                    self.dest_conn.our_state is self.dest_conn.their_state and
+                    self.dest_conn.our_state in (h11.IDLE, h11.DONE))
+        if not reusable:
+            self.dest_stream.close()
+            return
+
+        if self.dest_conn.our_state is h11.DONE:
+            self.dest_conn.start_next_cycle()
+        server_tls = self.context.server_tls
+        if server_tls:
+            refresh_session(self.dest_stream)
+            # NOTE: keyed by the sni, the same as TlsLayer looks up the pool.
+            key = self.dest_pool.key(server_tls.sni or self.context.host,
+                                     self.context.port, True, "http/1.1")
+        else:
+            key = self.dest_pool.key(self.context.host, self.context.port)
+        self.dest_pool.release(key, self.dest_stream)
+
 
 class SwitchToTunnelHttpProxy(Exception):
     pass
@@ -1,7 +1,14 @@
+from collections import deque
+from functools import partial
+
+from h2.errors import INTERNAL_ERROR
+from h2.exceptions import ProtocolError
 from tornado import concurrent, gen
 
+from microproxy.exception import Http2Error, PluginError
 from microproxy.layer.base import ApplicationLayer
 from microproxy.protocol.http2 import Connection
+from microproxy.utils import curr_loop, monotonic
 
 from microproxy.log import ProxyLogger
 logger = ProxyLogger.get_logger(__name__)
@@ -13,6 +20,10 @@ class Http2Layer(ApplicationLayer):
     '''
     def __init__(self, server_state, context):
         super(Http2Layer, self).__init__(server_state, context)
+        # NOTE: replay has no peer to return the flow control credit, so it is always buffered.
+        self.stream_body = (self.config.get("stream_body", False) and
+                            context.mode != "replay")
+        self.stream_preview_size = self.config.get("stream_preview_size", 65536)
         self.src_conn = Connection(
             self.src_stream, client_side=False,
             conn_type="source",
@@ -22,6 +33,9 @@ class Http2Layer(ApplicationLayer):
             on_priority_updates=self.on_src_priority_updates,
             on_reset=self.on_src_reset,
             on_terminate=self.on_src_terminate,
+            on_request_headers=self.on_request_headers,
+            on_data=(self.on_src_data if self.stream_body else None),
+            on_end_stream=self.on_src_end_stream,
             readonly=(context.mode == "replay"))
         self.dest_conn = Connection(
             self.dest_stream, client_side=True,
@@ -31,7 +45,10 @@ class Http2Layer(ApplicationLayer):
             on_settings=self.on_dest_settings,
             on_window_updates=self.on_dest_window_updates,
             on_terminate=self.on_dest_terminate,
-            on_reset=self.on_dest_reset)
+            on_reset=self.on_dest_reset,
+            on_response_headers=self.on_response_headers,
+            on_data=(self.on_dest_data if self.stream_body else None),
+            on_end_stream=self.on_dest_end_stream)
         self.streams = dict()
         self.src_to_dest_ids = dict([(0, 0)])
         self.dest_to_src_ids = dict([(0, 0)])
@@ -76,9 +93,14 @@ class Http2Layer(ApplicationLayer):
         self.dest_to_src_ids[dest_stream_id] = src_stream_id
 
     def on_request(self, stream_id, request, priority_updated):
-        dest_stream_id = self.dest_conn.get_next_available_stream_id()
-        self.update_ids(stream_id, dest_stream_id)
+        stream = self.create_stream(stream_id, priority_updated)
+        stream.on_request(request, **stream.priority)
+
+    def on_request_headers(self, stream_id, request, priority_updated, stream_ended):
+        stream = self.create_stream(stream_id, priority_updated)
+        stream.on_request_headers(request, stream_ended, **stream.priority)
 
+    def create_stream(self, stream_id, priority_updated):
         if priority_updated:
             priority_weight = priority_updated.weight
             priority_exclusive = priority_updated.exclusive
@@ -89,34 +111,77 @@ class Http2Layer(ApplicationLayer):
             priority_exclusive = None
             priority_depends_on = None
 
-        stream = Stream(self, self.context, stream_id, dest_stream_id)
-        stream.on_request(
-            request,
+        # NOTE: the dest stream id is taken when the request is forwarded,
+        # stream ids have to be opened in order and plugins could delay a request.
+        stream = Stream(self, self.context, stream_id, None)
+        stream.priority = dict(
             priority_weight=priority_weight,
             priority_exclusive=priority_exclusive,
             priority_depends_on=priority_depends_on)
         self.streams[stream_id] = stream
+        return stream
 
     def on_push(self, pushed_stream_id, parent_stream_id, request):
         self.update_ids(pushed_stream_id, pushed_stream_id)
         target_parent_stream_id = self.dest_to_src_ids[parent_stream_id]
 
         stream = Stream(self, self.context, pushed_stream_id, pushed_stream_id)
-        stream.on_push(request, target_parent_stream_id)
         self.streams[pushed_stream_id] = stream
+        stream.on_push(request, self.streams[target_parent_stream_id])
 
     def on_response(self, stream_id, response):
         src_stream_id = self.dest_to_src_ids[stream_id]
         self.streams[src_stream_id].on_response(response)
 
-        self.on_finish(src_stream_id)
+    def on_response_headers(self, stream_id, response, stream_ended):
+        src_stream_id = self.dest_to_src_ids[stream_id]
+        self.streams[src_stream_id].on_response_headers(response, stream_ended)
+
+    def on_src_data(self, stream_id, data, flow_controlled_length):
+        stream = self.streams.get(stream_id)
+        if stream and stream.request_forwarder:
+            stream.request_forwarder.on_data(data, flow_controlled_length)
+        else:
+            self.src_conn.acknowledge_data(stream_id, flow_controlled_length)
+
+    def on_dest_data(self, stream_id, data, flow_controlled_length):
+        stream = self.streams.get(self.safe_mapping_id(self.dest_to_src_ids, stream_id))
+        if stream and stream.response_forwarder:
+            stream.response_forwarder.on_data(data, flow_controlled_length)
+        else:
+            self.dest_conn.acknowledge_data(stream_id, flow_controlled_length)
+
+    def on_src_end_stream(self, stream_id):
+        if stream_id in self.streams:
+            self.streams[stream_id].on_request_end()
+
+    def on_dest_end_stream(self, stream_id):
+        src_stream_id = self.safe_mapping_id(self.dest_to_src_ids, stream_id)
+        if src_stream_id in self.streams:
+            self.streams[src_stream_id].on_response_end()
+
+    def forward_pending_data(self, forwarder_name, stream_id=0):
+        if stream_id:
+            streams = [self.streams[stream_id]] if stream_id in self.streams else []
+        else:
+            streams = self.streams.values()
+
+        for stream in streams:
+            forwarder = getattr(stream, forwarder_name)
+            if forwarder:
+                forwarder.forward()
 
     def on_finish(self, src_stream_id):
-        stream = self.streams[src_stream_id]
+        stream = self.streams.get(src_stream_id)
+        if not stream:
+            return
 
+        stream.timing["response"] = monotonic()
         self.interceptor.publish(
             layer_context=self.context, request=stream.request,
-            response=stream.response)
+            response=stream.response, timing=stream.timing,
+            request_body_length=_body_length(stream.request_forwarder),
+            response_body_length=_body_length(stream.response_forwarder))
         del self.streams[src_stream_id]
 
         if self.context.mode == "replay":
@@ -128,18 +193,35 @@ class Http2Layer(ApplicationLayer):
             id: cs.new_value for (id, cs) in changed_settings.iteritems()
         }
         self.dest_conn.send_update_settings(new_settings)
+        if self.stream_body:
+            self.forward_pending_data("response_forwarder")
 
     def on_dest_settings(self, changed_settings):
         new_settings = {
             id: cs.new_value for (id, cs) in changed_settings.iteritems()
         }
         self.src_conn.send_update_settings(new_settings)
+        if self.stream_body:
+            self.forward_pending_data("request_forwarder")
 
     def on_src_window_updates(self, stream_id, delta):
+        if self.stream_body:
+            # NOTE: the credit for dest is returned by DataForwarder,
+            # window updates from src only resume the pending response data.
+            self.forward_pending_data("response_forwarder", stream_id)
+            return
         target_stream_id = self.safe_mapping_id(self.src_to_dest_ids, stream_id)
+        if stream_id and not target_stream_id:
+            # NOTE: the request is not forwarded yet
+            return
         self.dest_conn.send_window_updates(target_stream_id, delta)
 
     def on_dest_window_updates(self, stream_id, delta):
+        if self.stream_body:
+            self.forward_pending_data(
+                "request_forwarder",
+                self.safe_mapping_id(self.dest_to_src_ids, stream_id))
+            return
         target_stream_id = self.safe_mapping_id(self.dest_to_src_ids, stream_id)
         self.src_conn.send_window_updates(target_stream_id, delta)
 
@@ -159,8 +241,12 @@ class Http2Layer(ApplicationLayer):
         return 0
 
     def on_src_reset(self, stream_id, error_code):
-        target_stream_id = self.src_to_dest_ids[stream_id]
-        self.dest_conn.send_reset(target_stream_id, error_code)
+        target_stream_id = self.safe_mapping_id(self.src_to_dest_ids, stream_id)
+        if target_stream_id:
+            self.dest_conn.send_reset(target_stream_id, error_code)
+        elif stream_id in self.streams:
+            # NOTE: the request is still intercepted, never forward it
+            self.streams.pop(stream_id).reset = True
 
     def on_dest_reset(self, stream_id, error_code):
         target_stream_id = self.dest_to_src_ids[stream_id]
@@ -180,6 +266,14 @@ class Http2Layer(ApplicationLayer):
 
 
 class Stream(object):
+    """Stream: One exchange of the http2 layer.
+
+    The request and response are intercepted by plugins which could be asynchronous,
+    so the steps of a stream are queued and forwarded in order.
+    A push promise is queued on its parent stream, which has to be open to send it,
+    and the pushed response waits for the promise.
+    DATA frames are held by a paused forwarder until the headers are forwarded.
+    """
     def __init__(self, layer, context, src_stream_id, dest_stream_id):
         self.layer = layer
         self.context = context
@@ -187,29 +281,273 @@ class Stream(object):
         self.dest_stream_id = dest_stream_id
         self.request = None
         self.response = None
+        self.priority = dict()
+        self.request_forwarder = None
+        self.response_forwarder = None
+        self.pending_steps = deque()
+        self.pushed_streams = []
+        self.promised = None
+        self.reset = False
+        # NOTE: monotonic timestamps of the phases of the exchange
+        self.timing = {}
+
+    def when_intercepted(self, future, callback):
+        """Run callback with the plugin result when it is ready and the previous steps are done."""
+        self.pending_steps.append((future, callback))
+        if len(self.pending_steps) == 1:
+            self.run_steps()
+
+    def run_steps(self, _=None):
+        while self.pending_steps:
+            future, callback = self.pending_steps[0]
+            if not future.done():
+                curr_loop().add_future(future, self.run_steps)
+                return
+            self.pending_steps.popleft()
+            self._run_step(future, callback)
+
+    def _run_step(self, future, callback):
+        if self.reset:
+            return
+        try:
+            plugin_result = future.result()
+        except PluginError as e:
+            logger.error("{0}: stream {1} failed with {2}".format(
+                self.layer, self.src_stream_id, e))
+            self.fail()
+            return
+        callback(plugin_result)
+
+    def fail(self):
+        self.reset = True
+        self.pending_steps.clear()
+        self.layer.streams.pop(self.src_stream_id, None)
+        self.layer.src_conn.send_reset(self.src_stream_id, INTERNAL_ERROR)
+        if self.dest_stream_id:
+            self.layer.dest_conn.send_reset(self.dest_stream_id, INTERNAL_ERROR)
+
+        for stream in self.pushed_streams:
+            if stream.reset or stream.promised.done():
+                continue
+            # NOTE: the promise is never sent to src, only the dest stream is opened
+            stream.reset = True
+            stream.pending_steps.clear()
+            self.layer.streams.pop(stream.src_stream_id, None)
+            self.layer.dest_conn.send_reset(stream.dest_stream_id, INTERNAL_ERROR)
+
+    def open_dest_stream(self):
+        self.dest_stream_id = self.layer.dest_conn.get_next_available_stream_id()
+        self.layer.update_ids(self.src_stream_id, self.dest_stream_id)
 
     def on_request(self, request, **kwargs):
-        plugin_ressult = self.layer.interceptor.request(
-            layer_context=self.context, request=request)
-
-        self.request = plugin_ressult.request if plugin_ressult else request
+        self.request = request
+        self.timing["request"] = monotonic()
+        self.when_intercepted(
+            self.layer.interceptor.request(
+                layer_context=self.context, request=request),
+            partial(self.send_request, **kwargs))
+
+    def send_request(self, plugin_result, **kwargs):
+        if plugin_result:
+            self.request = plugin_result.request
+        self.open_dest_stream()
         self.layer.dest_conn.send_request(
             self.dest_stream_id, self.request, **kwargs)
 
-    def on_push(self, request, parent_stream_id):
-        plugin_ressult = self.layer.interceptor.request(
-            layer_context=self.context, request=request)
-
-        self.request = plugin_ressult.request if plugin_ressult else request
+    def on_push(self, request, parent_stream):
+        self.request = request
+        self.timing["request"] = monotonic()
+        self.promised = concurrent.TracebackFuture()
+        self.when_intercepted(self.promised, lambda _: None)
+        parent_stream.pushed_streams.append(self)
+        parent_stream.when_intercepted(
+            self.layer.interceptor.request(
+                layer_context=self.context, request=request),
+            partial(self.send_push, parent_stream_id=parent_stream.src_stream_id))
+
+    def send_push(self, plugin_result, parent_stream_id):
+        if plugin_result:
+            self.request = plugin_result.request
         self.layer.src_conn.send_pushed_stream(
             parent_stream_id, self.src_stream_id, self.request)
+        self.promised.set_result(None)
+        self.run_steps()
 
     def on_response(self, response):
-        plugin_result = self.layer.interceptor.response(
-            layer_context=self.context,
-            request=self.request, response=response
-        )
-
-        self.response = plugin_result.response if plugin_result else response
+        self.response = response
+        self.timing["response_start"] = monotonic()
+        self.when_intercepted(
+            self.layer.interceptor.response(
+                layer_context=self.context,
+                request=self.request, response=response),
+            self.send_response)
+
+    def send_response(self, plugin_result):
+        if plugin_result:
+            self.response = plugin_result.response
         self.layer.src_conn.send_response(
             self.src_stream_id, self.response)
+        self.layer.on_finish(self.src_stream_id)
+
+    def on_request_headers(self, request, stream_ended, **kwargs):
+        self.request = request
+        if stream_ended:
+            self.timing["request"] = monotonic()
+        if not stream_ended:
+            self.request_forwarder = DataForwarder(
+                self.layer.src_conn, self.src_stream_id,
+                self.layer.dest_conn, None,
+                self.layer.stream_preview_size, paused=True)
+        self.when_intercepted(
+            self.layer.interceptor.request(
+                layer_context=self.context, request=request),
+            partial(self.send_request_headers, stream_ended=stream_ended, **kwargs))
+
+    def send_request_headers(self, plugin_result, stream_ended, **kwargs):
+        if plugin_result:
+            self.request = plugin_result.request
+        self.open_dest_stream()
+        self.layer.dest_conn.send_request_headers(
+            self.dest_stream_id, self.request, stream_ended, **kwargs)
+        if self.request_forwarder:
+            if self.request_forwarder.ended:
+                self.request.body = self.request_forwarder.preview()
+            self.request_forwarder.resume(self.dest_stream_id)
+
+    def on_request_end(self):
+        self.timing["request"] = monotonic()
+        if self.request_forwarder:
+            self.request_forwarder.on_end_stream()
+            self.request.body = self.request_forwarder.preview()
+
+    def on_response_headers(self, response, stream_ended):
+        self.response = response
+        self.timing["response_start"] = monotonic()
+        if not stream_ended:
+            self.response_forwarder = DataForwarder(
+                self.layer.dest_conn, self.dest_stream_id,
+                self.layer.src_conn, self.src_stream_id,
+                self.layer.stream_preview_size,
+                on_finish=self.on_response_forwarded, paused=True)
+        self.when_intercepted(
+            self.layer.interceptor.response(
+                layer_context=self.context,
+                request=self.request, response=response),
+            partial(self.send_response_headers, stream_ended=stream_ended))
+
+    def send_response_headers(self, plugin_result, stream_ended):
+        if plugin_result:
+            self.response = plugin_result.response
+        self.layer.src_conn.send_response_headers(
+            self.src_stream_id, self.response, stream_ended)
+        if self.response_forwarder:
+            self.response_forwarder.resume(self.src_stream_id)
+
+    def on_response_end(self):
+        if self.response_forwarder:
+            self.response_forwarder.on_end_stream()
+        else:
+            self.when_intercepted(
+                _DONE_STEP, lambda _: self.layer.on_finish(self.src_stream_id))
+
+    def on_response_forwarded(self):
+        self.response.body = self.response_forwarder.preview()
+        self.layer.on_finish(self.src_stream_id)
+
+
+_DONE_STEP = concurrent.TracebackFuture()
+_DONE_STEP.set_result(None)
+
+
+def _body_length(forwarder):
+    return forwarder.length if forwarder else None
+
+
+class DataForwarder(object):
+    '''
+    DataForwarder: Forward the DATA frames of a stream from one connection to another.
+    The flow control credit is returned to the sender only after the data
+    had been written to the receiver, so the buffered data is bounded by the window.
+    '''
+    def __init__(self, from_conn, from_stream_id, to_conn, to_stream_id,
+                 preview_size, on_finish=None, paused=False):
+        self.from_conn = from_conn
+        self.from_stream_id = from_stream_id
+        self.to_conn = to_conn
+        self.to_stream_id = to_stream_id
+        self.preview_size = preview_size
+        self.on_finish = on_finish
+        self.chunks = deque()
+        self.preview_chunks = []
+        self.preview_length = 0
+        self.length = 0
+        self.ended = False
+        self.finished = False
+        self.paused = paused
+
+    def on_data(self, data, flow_controlled_length):
+        if not data and not flow_controlled_length:
+            # NOTE: empty DATA frame which carried END_STREAM, nothing to forward
+            return
+
+        self.length += len(data)
+        if self.preview_length < self.preview_size:
+            preview = data[:self.preview_size - self.preview_length]
+            self.preview_chunks.append(preview)
+            self.preview_length += len(preview)
+
+        self.chunks.append([data, flow_controlled_length])
+        self.forward()
+
+    def on_end_stream(self):
+        self.ended = True
+        self.forward()
+
+    def preview(self):
+        return b"".join(self.preview_chunks)
+
+    def resume(self, to_stream_id):
+        self.to_stream_id = to_stream_id
+        self.paused = False
+        self.forward()
+
+    def forward(self):
+        if self.paused:
+            return
+        try:
+            self._forward()
+        except (ProtocolError, Http2Error) as e:
+            # NOTE: the receiving stream was reset or closed, drop the pending data
+            logger.debug("{0}: drop data of stream {1}: {2}".format(
+                self, self.to_stream_id, e))
+            credit = sum(length for _, length in self.chunks)
+            self.chunks.clear()
+            self.from_conn.acknowledge_data(self.from_stream_id, credit)
+
+    def _forward(self):
+        while self.chunks:
+            data, credit = self.chunks[0]
+            window = min(self.to_conn.local_flow_control_window(self.to_stream_id),
+                         self.to_conn.max_outbound_frame_size)
+            if data and window <= 0:
+                return
+
+            if len(data) > window:
+                frame = data[:window]
+                sent_credit = min(len(frame), credit)
+                self.chunks[0] = [data[window:], credit - sent_credit]
+            else:
+                frame = data
+                sent_credit = credit
+                self.chunks.popleft()
+
+            self.to_conn.send_data_frame(self.to_stream_id, frame)
+            if sent_credit:
+                self.to_conn.on_flushed(partial(
+                    self.from_conn.acknowledge_data, self.from_stream_id, sent_credit))
+
+        if self.ended and not self.finished:
+            self.finished = True
+            self.to_conn.send_end_stream(self.to_stream_id)
+            if self.on_finish:
+                self.on_finish()
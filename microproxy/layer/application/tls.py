@@ -6,35 +6,53 @@ import certifi
 from service_identity import VerificationError
 from tornado import gen
 
-from microproxy.layer.base import ApplicationLayer
+from microproxy.layer.base import ApplicationLayer, DestStreamCreatorMixin
 from microproxy.context import LayerContext, TlsInfo
 from microproxy.protocol.tls import TlsClientHello, ServerConnection, ClientConnection
+from microproxy import metrics
+from microproxy.utils import monotonic
 from microproxy.exception import (
     DestStreamClosedError, TlsError, ProtocolError)
 
 from microproxy.log import ProxyLogger
 logger = ProxyLogger.get_logger(__name__)
 
+_handshake_seconds = metrics.registry.histogram(
+    "microproxy_tls_handshake_seconds", "Seconds of the TLS handshakes by side", ["side"])
 
-class TlsLayer(ApplicationLayer):
+
+class TlsLayer(ApplicationLayer, DestStreamCreatorMixin):
     def __init__(self, server_state, context):
         super(TlsLayer, self).__init__(server_state, context)
         self.cert_store = self.server_state.cert_store
         self.src_conn = ServerConnection(self.src_stream)
         self.dest_conn = ClientConnection(self.dest_stream)
 
+    @gen.coroutine
     def peek_client_hello(self):
+        # NOTE: one deadline for the whole client hello, a client sending
+        # it byte by byte should not extend the wait.
+        deadline = self.src_stream.io_loop.time() + self.config.get(
+            "client_hello_timeout", 10)
+
+        def remaining():
+            return max(deadline - self.src_stream.io_loop.time(), 0)
+
         client_hello = b""
         client_hello_size = 1
         offset = 0
         while len(client_hello) < client_hello_size:
-            record_header = self.src_stream.peek(offset + 5)[offset:]
-            if len(record_header) != 5:
+            record_header = yield self.src_stream.peek(
+                offset + 5, timeout=remaining())
+            record_header = record_header[offset:]
+            if len(record_header) != 5 or record_header[0] != b"\x16":
                 raise ProtocolError(
                     'Expected TLS record, got "{}" instead.'.format(record_header))
 
             record_size = struct.unpack("!H", record_header[3:])[0] + 5
-            record_body = self.src_stream.peek(offset + record_size)[offset + 5:]
+            record_body = yield self.src_stream.peek(
+                offset + record_size, timeout=remaining())
+            record_body = record_body[offset + 5:]
             if len(record_body) != record_size - 5:
                 raise ProtocolError(
                     "Unexpected EOF in TLS handshake: {}".format(record_body))
@@ -43,11 +61,12 @@ class TlsLayer(ApplicationLayer):
             offset += record_size
             client_hello_size = struct.unpack("!I", b'\x00' + client_hello[1:4])[0] + 4
 
-        return client_hello
+        raise gen.Return(client_hello)
 
     @gen.coroutine
     def start_dest_tls(self, hostname, client_alpns):
         trusted_ca_certs = self.config["client_certs"] or certifi.where()
+        start = monotonic()
 
         try:
             logger.debug("start dest tls handshaking: {0}".format(hostname))
@@ -72,15 +91,33 @@ class TlsLayer(ApplicationLayer):
             logger.debug("{0}:{1} -> Choose {2} as application protocol".format(
                 self.context.host, self.context.port, select_alpn))
             logger.debug("finish dest tls handshake")
+            self.context.timing["dest_tls"] = monotonic()
+            _handshake_seconds.observe(
+                self.context.timing["dest_tls"] - start, labels=("dest",))
             raise gen.Return((dest_stream, select_alpn))
 
+    def reuse_dest_tls(self, hostname, client_alpns):
+        # NOTE: only http/1.1 streams are kept in the pool,
+        # client offering h2 should have the chance to negotiate it.
+        if not self.dest_pool or b"h2" in (client_alpns or []):
+            return None
+
+        dest_stream = self.dest_pool.acquire(
+            self.dest_pool.key(hostname, self.context.port, True, "http/1.1"))
+        if dest_stream:
+            logger.debug("reuse dest tls connection: {0}".format(hostname))
+            if self.dest_stream:
+                self.dest_stream.close()
+        return dest_stream
+
     @gen.coroutine
     def start_src_tls(self, hostname, select_alpn):
         try:
+            cert, pkey = yield self.cert_store.get_cert_and_pkey_async(hostname)
             logger.debug("start src tls handshaking: {0}".format(hostname))
+            start = monotonic()
             src_stream = yield self.src_conn.start_tls(
-                *self.cert_store.get_cert_and_pkey(hostname),
-                select_alpn=select_alpn)
+                cert, pkey, select_alpn=select_alpn)
 
         except SSL.Error as e:
             raise TlsError("Tls Handshaking Failed on source with: ({0}) {1}".format(
@@ -88,6 +125,9 @@ class TlsLayer(ApplicationLayer):
 
         else:
             logger.debug("finish src tls handshake")
+            self.context.timing["src_tls"] = monotonic()
+            _handshake_seconds.observe(
+                self.context.timing["src_tls"] - start, labels=("src",))
             raise gen.Return(src_stream)
 
     def alpn_to_scheme(self, alpn):
@@ -101,17 +141,26 @@ class TlsLayer(ApplicationLayer):
     @gen.coroutine
     def process_and_return_context(self):
         # NOTE: peeking src stream client hello.
-        raw_client_hello = self.peek_client_hello()
+        raw_client_hello = yield self.peek_client_hello()
         client_hello = TlsClientHello(raw_client_hello[4:])
 
         hostname = client_hello.sni or self.context.host
-        try:
-            dest_stream, select_alpn = yield self.start_dest_tls(
-                hostname, client_hello.alpn_protocols)
-        except:
-            if not self.src_stream.closed():
-                self.src_stream.close()
-            raise
+        dest_stream = self.reuse_dest_tls(hostname, client_hello.alpn_protocols)
+        if dest_stream:
+            select_alpn = b"http/1.1"
+        else:
+            try:
+                if not self.dest_stream:
+                    # NOTE: the proxy layer left the connection to the pool lookup.
+                    self.dest_stream = yield self.create_dest_stream(
+                        (self.context.host, self.context.port))
+                    self.dest_conn = ClientConnection(self.dest_stream)
+                dest_stream, select_alpn = yield self.start_dest_tls(
+                    hostname, client_hello.alpn_protocols)
+            except:
+                if not self.src_stream.closed():
+                    self.src_stream.close()
+                raise
 
         try:
             src_stream = yield self.start_src_tls(
@@ -131,7 +180,8 @@ class TlsLayer(ApplicationLayer):
                 port=self.context.port,
                 client_tls=self._resolve_tls_info(src_stream),
                 server_tls=self._resolve_tls_info(dest_stream),
-                src_info=self.context.src_info
+                src_info=self.context.src_info,
+                timing=self.context.timing
             )
         except:
             src_stream.close()
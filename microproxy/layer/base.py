@@ -4,6 +4,7 @@ import socket
 from tornado import gen
 
 from microproxy.tornado_ext.iostream import MicroProxyIOStream
+from microproxy.utils import monotonic
 
 
 class Layer(object):
@@ -25,6 +26,10 @@ class ApplicationLayer(Layer):
     def config(self):
         return self.server_state.config
 
+    @property
+    def dest_pool(self):
+        return self.server_state.dest_pool
+
     @property
     def src_stream(self):
         return self.context.src_stream
@@ -53,12 +58,29 @@ class ApplicationLayer(Layer):
 
 
 class DestStreamCreatorMixin:
+    dest_pool = None
+
+    def has_idle_tls_stream(self, hostname, port):
+        """Whether TlsLayer could take an idle tls stream from the pool instead of connecting."""
+        return bool(self.dest_pool) and self.dest_pool.has_idle(
+            self.dest_pool.key(hostname, port, True, "http/1.1"))
+
     @gen.coroutine
     def create_dest_stream(self, dest_addr_info):
+        if self.dest_pool:
+            dest_stream = self.dest_pool.acquire(
+                self.dest_pool.key(*dest_addr_info))
+            if dest_stream:
+                raise gen.Return(dest_stream)
+
         dest_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM, 0)
         dest_stream = MicroProxyIOStream(dest_socket)
         yield gen.with_timeout(
             timedelta(seconds=5), dest_stream.connect(dest_addr_info))
+        self.context.timing["connect"] = monotonic()
+        # NOTE: messages are written in several chunks, e.g. the headers then the body,
+        # with Nagle the later chunks wait for the delayed ack of the peer.
+        dest_stream.set_nodelay(True)
         raise gen.Return(dest_stream)
 
 
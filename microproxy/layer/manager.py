@@ -3,9 +3,10 @@ from __future__ import absolute_import
 from tornado import gen
 from tornado import iostream
 
+from microproxy import metrics
 from microproxy.exception import (
     DestStreamClosedError, SrcStreamClosedError, DestNotConnectedError,
-    TlsError)
+    TlsError, PluginError)
 from microproxy.layer import (
     SocksLayer, TransparentLayer, ReplayLayer, HttpProxyLayer,
     ForwardLayer, TlsLayer, Http1Layer, Http2Layer
@@ -14,17 +15,26 @@ from microproxy.layer import (
 from microproxy.log import ProxyLogger
 logger = ProxyLogger.get_logger(__name__)
 
+_layers_total = metrics.registry.counter(
+    "microproxy_layers_total", "Layers entered by connections", ["layer"])
+_layer_errors_total = metrics.registry.counter(
+    "microproxy_layer_errors_total", "Errors ending the layers by the error class",
+    ["layer", "error"])
 
-def get_first_layer(context):
+
+def get_first_layer(context, dest_pool=None, config=None):
     mode = context.mode
+    config = config or {}
+    https_ports = [443] + config.get("https_port", [])
     if mode == "socks":
-        return SocksLayer(context)
+        return SocksLayer(context, dest_pool=dest_pool, https_ports=https_ports)
     elif mode == "transparent":
-        return TransparentLayer(context)
+        return TransparentLayer(context, dest_pool=dest_pool, https_ports=https_ports)
     elif mode == "replay":
-        return ReplayLayer(context)
+        return ReplayLayer(context, insecure=config.get("insecure", False),
+                           trusted_ca_certs=config.get("client_certs", ""))
     elif mode == "http":
-        return HttpProxyLayer(context)
+        return HttpProxyLayer(context, dest_pool=dest_pool)
     else:
         raise ValueError("Unsupport proxy mode: {0}".format(mode))
 
@@ -37,6 +47,7 @@ def run_layers(server_state, initial_layer, initial_layer_context):  # pragma: n
     while current_layer:
         try:
             logger.debug("Enter {0} Layer".format(current_layer))
+            _layers_total.inc(labels=(type(current_layer).__name__,))
             current_context = yield current_layer.process_and_return_context()
             logger.debug("Leave {0} Layer".format(current_layer))
             current_layer = _next_layer(server_state, current_layer, current_context)
@@ -48,6 +59,7 @@ def run_layers(server_state, initial_layer, initial_layer_context):  # pragma: n
 
 
 def _handle_layer_error(error, layer):
+    _layer_errors_total.inc(labels=(type(layer).__name__, type(error).__name__))
     if isinstance(error, gen.TimeoutError):
         logger.warn("{0} timeout".format(layer))
         layer.src_stream.close()
@@ -65,6 +77,9 @@ def _handle_layer_error(error, layer):
     elif isinstance(error, TlsError):
         logger.error(error)
         layer.src_stream.close()
+    elif isinstance(error, PluginError):
+        logger.error("{0} failed with {1}".format(layer, error))
+        layer.src_stream.close()
     else:
         logger.exception("{0} unhandled exception {1}".format(layer, error))
         layer.src_stream.close()
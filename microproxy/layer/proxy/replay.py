@@ -5,8 +5,10 @@ from microproxy.layer.base import ProxyLayer
 
 
 class ReplayLayer(ProxyLayer):
-    def __init__(self, context, **kwargs):
+    def __init__(self, context, insecure=False, trusted_ca_certs="", **kwargs):
         super(ReplayLayer, self).__init__(context, **kwargs)
+        self.insecure = insecure
+        self.trusted_ca_certs = trusted_ca_certs
 
     @gen.coroutine
     def process_and_return_context(self):
@@ -19,8 +21,9 @@ class ReplayLayer(ProxyLayer):
             else:
                 alpn = None
 
-            dest_stream = yield dest_stream.start_tls(
-                server_side=False, ssl_options=tls.create_dest_sslcontext(alpn=alpn))
+            dest_stream = yield tls.ClientConnection(dest_stream).start_tls(
+                insecure=self.insecure, trusted_ca_certs=self.trusted_ca_certs,
+                alpns=alpn)
 
         self.context.dest_stream = dest_stream
         raise gen.Return(self.context)
@@ -14,8 +14,10 @@ logger = ProxyLogger.get_logger(__name__)
 
 
 class SocksLayer(ProxyLayer):
-    def __init__(self, context):
-        super(SocksLayer, self).__init__(context)
+    https_ports = ()
+
+    def __init__(self, context, **kwargs):
+        super(SocksLayer, self).__init__(context, **kwargs)
         self.socks_conn = Connection(our_role="server")
 
     @gen.coroutine
@@ -34,7 +36,8 @@ class SocksLayer(ProxyLayer):
             elif _event == "Request":
                 dest_stream, host, port = yield self.handle_request_and_create_destination(_event)
                 self.context.dest_stream = dest_stream
-                self.context.host = host
+                # NOTE: the address is an IPv4Address/IPv6Address for ip requests
+                self.context.host = str(host)
                 self.context.port = port
                 break
             else:
@@ -66,6 +69,14 @@ class SocksLayer(ProxyLayer):
                 event.atyp, event.addr, event.port), raise_exception=False)
             raise ProtocolError("Unsupport bind type")
 
+        if self.dest_pool and event.port in self.https_ports:
+            # NOTE: the sni keying the pooled tls streams is only known by TlsLayer,
+            # which takes an idle stream from the pool or connects then.
+            yield self.send_event_to_src_conn(Response(
+                RESP_STATUS["SUCCESS"],
+                event.atyp, event.addr, event.port))
+            raise gen.Return((None, event.addr, event.port))
+
         try:
             dest_stream = yield self.create_dest_stream((str(event.addr), event.port))
         except gen.TimeoutError as e:
@@ -9,6 +9,7 @@ from microproxy.layer.base import ProxyLayer
 
 class TransparentLayer(ProxyLayer):
     SO_ORIGINAL_DST = 80
+    https_ports = ()
 
     def __init__(self, context, dest_addr_resolver=None, **kwargs):
         super(TransparentLayer, self).__init__(context, **kwargs)
@@ -32,7 +33,12 @@ class TransparentLayer(ProxyLayer):
     @gen.coroutine
     def process_and_return_context(self):
         host, port = self.dest_addr_resolver()
-        dest_stream = yield self.create_dest_stream((host, port))
+        if self.dest_pool and port in self.https_ports:
+            # NOTE: the sni keying the pooled tls streams is only known by TlsLayer,
+            # which takes an idle stream from the pool or connects then.
+            dest_stream = None
+        else:
+            dest_stream = yield self.create_dest_stream((host, port))
         self.context.dest_stream = dest_stream
         self.context.host = host
         self.context.port = port
@@ -0,0 +1,170 @@
+"""This module contains a lightweight in-process registry of the proxy metrics.
+
+Metrics are updated on the io loop and exposed in the Prometheus text format,
+see microproxy.admin. Every process of the proxy keeps its own registry.
+"""
+import bisect
+from collections import OrderedDict
+
+
+def hdr_bounds(lowest, highest, sub_buckets):
+    """Bucket bounds which double every sub_buckets buckets, like HdrHistogram.
+
+    Buckets are linear inside each power of 2, so the relative error of
+    an observation is bounded by 1 / sub_buckets at every magnitude.
+    """
+    bounds = []
+    base = float(lowest)
+    while base < highest:
+        for i in range(1, sub_buckets + 1):
+            bounds.append(base * (1 + float(i) / sub_buckets))
+        base *= 2
+    return bounds
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if value == float("inf"):
+            return "+Inf"
+        return repr(value)
+    return str(value)
+
+
+def _format_labels(label_pairs):
+    if not label_pairs:
+        return ""
+    return "{" + ",".join(
+        '{0}="{1}"'.format(name, str(value).replace("\\", r"\\")
+                           .replace("\n", r"\n").replace('"', r'\"'))
+        for name, value in label_pairs) + "}"
+
+
+class Metric(object):
+    """Metric: A family of values of one metric keyed by the label values.
+
+    collect could be given to read the values when exposed instead,
+    it returns a value, or a dict of {label values: value}.
+    """
+    TYPE = "untyped"
+
+    def __init__(self, name, help_str, label_names=(), collect=None):
+        super(Metric, self).__init__()
+        self.name = name
+        self.help_str = help_str
+        self.label_names = tuple(label_names)
+        self.collect = collect
+        self.values = {}
+
+    def get(self, labels=()):
+        return self.values.get(labels, 0)
+
+    def samples(self):
+        """Returns [(name, label pairs, value)] sorted by the label values."""
+        values = self.collect() if self.collect else self.values
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [(self.name, zip(self.label_names, labels), value)
+                for labels, value in sorted(values.items())]
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def inc(self, amount=1, labels=()):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    TYPE = "gauge"
+
+    def set(self, value, labels=()):
+        self.values[labels] = value
+
+    def inc(self, amount=1, labels=()):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, amount=1, labels=()):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+
+class Histogram(Metric):
+    """Histogram: Observations counted in HDR style buckets, see hdr_bounds.
+
+    The default bounds cover latencies from 0.5 ms to about 30 seconds.
+    """
+    TYPE = "histogram"
+
+    def __init__(self, name, help_str, label_names=(),
+                 lowest=0.0005, highest=30, sub_buckets=4):
+        super(Histogram, self).__init__(name, help_str, label_names)
+        self.bounds = hdr_bounds(lowest, highest, sub_buckets)
+
+    def observe(self, value, labels=()):
+        state = self.values.get(labels)
+        if state is None:
+            # NOTE: [bucket counts, sum, count], the last bucket is +Inf
+            state = self.values[labels] = [[0] * (len(self.bounds) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.bounds, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def get(self, labels=()):
+        state = self.values.get(labels)
+        return state[2] if state else 0
+
+    def samples(self):
+        samples = []
+        bounds = self.bounds + [float("inf")]
+        for labels, (counts, total, count) in sorted(self.values.items()):
+            label_pairs = zip(self.label_names, labels)
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                samples.append((self.name + "_bucket",
+                                label_pairs + [("le", _format_value(bound))],
+                                cumulative))
+            samples.append((self.name + "_sum", label_pairs, total))
+            samples.append((self.name + "_count", label_pairs, count))
+        return samples
+
+
+class MetricsRegistry(object):
+    def __init__(self):
+        super(MetricsRegistry, self).__init__()
+        self.metrics = OrderedDict()
+
+    def _get_or_create(self, metric_class, name, *args, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = metric_class(name, *args, **kwargs)
+        elif type(metric) is not metric_class:
+            raise ValueError("Metric {0} is already registered as {1}".format(
+                name, metric.TYPE))
+        return metric
+
+    def counter(self, name, help_str, label_names=(), collect=None):
+        return self._get_or_create(Counter, name, help_str, label_names, collect)
+
+    def gauge(self, name, help_str, label_names=(), collect=None):
+        return self._get_or_create(Gauge, name, help_str, label_names, collect)
+
+    def histogram(self, name, help_str, label_names=(), **kwargs):
+        return self._get_or_create(Histogram, name, help_str, label_names, **kwargs)
+
+    def expose(self):
+        """Expose the metrics in the Prometheus text format.
+
+        Returns:
+            (str): The text of all metrics.
+        """
+        lines = []
+        for metric in self.metrics.itervalues():
+            lines.append("# HELP {0} {1}".format(metric.name, metric.help_str))
+            lines.append("# TYPE {0} {1}".format(metric.name, metric.TYPE))
+            for name, label_pairs, value in metric.samples():
+                lines.append("{0}{1} {2}".format(
+                    name, _format_labels(label_pairs), _format_value(value)))
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,125 @@
+import errno
+import socket
+from collections import deque
+from functools import partial
+
+from OpenSSL import SSL
+from tornado.ioloop import IOLoop
+
+from microproxy.log import ProxyLogger
+logger = ProxyLogger.get_logger(__name__)
+
+
+class ConnectionPool(object):
+    """ConnectionPool: Keep idle keep-alive destination streams for reuse.
+
+    Streams are keyed by (host, port, tls, alpn), the host of tls streams is
+    the sni sent to the server. The newest idle stream is handed out first
+    and every stream is checked before it is reused.
+    """
+    def __init__(self, max_per_host=8, idle_timeout=60, io_loop=None):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.io_loop = io_loop or IOLoop.current()
+        self.idle_streams = dict()
+
+    @staticmethod
+    def key(host, port, tls=False, alpn=None):
+        return (host, port, bool(tls), alpn)
+
+    def has_idle(self, key):
+        return bool(self.idle_streams.get(key))
+
+    def acquire(self, key):
+        """Get an idle stream from the pool.
+
+        Args:
+            key (tuple): The key created by ConnectionPool.key.
+
+        Returns:
+            (object): An alive iostream or None if there is no idle stream.
+        """
+        streams = self.idle_streams.get(key)
+        while streams:
+            stream, timeout = streams.pop()
+            self.io_loop.remove_timeout(timeout)
+            stream.set_close_callback(None)
+            if self.is_alive(stream):
+                logger.debug("reuse idle stream for {0}".format(key))
+                self._cleanup(key)
+                return stream
+            stream.close()
+
+        self._cleanup(key)
+        return None
+
+    def release(self, key, stream):
+        """Put a stream which is idle at the protocol level back to the pool.
+
+        The stream will be closed if it could not be kept.
+
+        Args:
+            key (tuple): The key created by ConnectionPool.key.
+            stream (object): The iostream to keep.
+
+        Returns:
+            (bool): Whether the stream was kept in the pool.
+        """
+        if not self.idle_timeout or not self.is_alive(stream):
+            stream.close()
+            return False
+
+        streams = self.idle_streams.setdefault(key, deque())
+        if len(streams) >= self.max_per_host:
+            stream.close()
+            return False
+
+        timeout = self.io_loop.call_later(
+            self.idle_timeout, partial(self._expire, key, stream))
+        streams.append((stream, timeout))
+        stream.set_close_callback(partial(self._remove, key, stream))
+        logger.debug("keep idle stream for {0}".format(key))
+        return True
+
+    def close(self):
+        idle_streams, self.idle_streams = self.idle_streams, dict()
+        for streams in idle_streams.values():
+            for stream, timeout in streams:
+                self.io_loop.remove_timeout(timeout)
+                stream.set_close_callback(None)
+                stream.close()
+
+    def is_alive(self, stream):
+        if (stream.closed() or stream.reading() or
+                stream.writing() or stream._read_buffer_size):
+            return False
+
+        try:
+            stream.socket.recv(1, socket.MSG_PEEK)
+        except SSL.WantReadError:
+            return True
+        except SSL.Error:
+            return False
+        except socket.error as e:
+            return e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK)
+
+        # NOTE: either closed by peer or unexpected data arrived while idle
+        return False
+
+    def _expire(self, key, stream):
+        logger.debug("idle stream for {0} expired".format(key))
+        self._remove(key, stream)
+        stream.set_close_callback(None)
+        stream.close()
+
+    def _remove(self, key, stream):
+        streams = self.idle_streams.get(key, [])
+        for item in list(streams):
+            if item[0] is stream:
+                streams.remove(item)
+                self.io_loop.remove_timeout(item[1])
+        self._cleanup(key)
+
+    def _cleanup(self, key):
+        if key in self.idle_streams and not self.idle_streams[key]:
+            del self.idle_streams[key]
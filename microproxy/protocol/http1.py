@@ -15,7 +15,9 @@ logger = ProxyLogger.get_logger(__name__)
 class Connection(H11Connection):
     def __init__(self, our_role, io_stream, conn_type=None,
                  readonly=False, on_request=None, on_response=None,
-                 on_info_response=None, on_unhandled=None, **kwargs):
+                 on_info_response=None, on_response_headers=None,
+                 on_data=None, on_end_of_message=None,
+                 on_unhandled=None, **kwargs):
         super(Connection, self).__init__(our_role, **kwargs)
         on_unhandled = on_unhandled or self._default_on_unhandled
 
@@ -25,6 +27,12 @@ class Connection(H11Connection):
         self.on_request = on_request or on_unhandled
         self.on_response = on_response or on_unhandled
         self.on_info_response = on_info_response or on_unhandled
+
+        # NOTE: When on_response_headers is given, the response body will not be buffered.
+        # The headers, each body chunk and the end of message are delivered as they arrive.
+        self.on_response_headers = on_response_headers
+        self.on_data = on_data or on_unhandled
+        self.on_end_of_message = on_end_of_message or on_unhandled
         self._req = None
         self._resp = None
         self._body_chunks = []
@@ -70,8 +78,17 @@ class Connection(H11Connection):
                             headers=self._resp.headers,
                             body=b"".join(self._body_chunks)))
                         self._cleanup_after_received()
+                    elif self.streaming():
+                        self.on_response_headers(HttpResponse(
+                            version=self._parse_version(self._resp),
+                            reason=self._resp.reason,
+                            code=str(self._resp.status_code),
+                            headers=self._resp.headers))
                 elif isinstance(event, Data):
-                    self._body_chunks.append(bytes(event.data))
+                    if self._resp and self.streaming():
+                        self.on_data(bytes(event.data))
+                    else:
+                        self._body_chunks.append(bytes(event.data))
                 elif isinstance(event, EndOfMessage):
                     if self.our_role is h11.SERVER:
                         if not self._req:  # pragma: no cover
@@ -87,12 +104,15 @@ class Connection(H11Connection):
                         if not self._resp:  # pragma: no cover
                             # NOTE: guess that never happen because h11 should help us handle http state
                             raise ProtocolError("EndOfMessage received, but not response found")
-                        self.on_response(HttpResponse(
-                            version=self._parse_version(self._resp),
-                            reason=self._resp.reason,
-                            code=str(self._resp.status_code),
-                            headers=self._resp.headers,
-                            body=b"".join(self._body_chunks)))
+                        if self.streaming():
+                            self.on_end_of_message()
+                        else:
+                            self.on_response(HttpResponse(
+                                version=self._parse_version(self._resp),
+                                reason=self._resp.reason,
+                                code=str(self._resp.status_code),
+                                headers=self._resp.headers,
+                                body=b"".join(self._body_chunks)))
                     self._cleanup_after_received()
                     break
                 elif isinstance(event, ConnectionClosed):  # pragma: no cover
@@ -109,6 +129,9 @@ class Connection(H11Connection):
             logger.error("Exception on {0}".format(self.conn_type))
             logger.exception(e)
 
+    def streaming(self):
+        return self.on_response_headers is not None
+
     def _log_event(self, event):
         if isinstance(event, Data):  # Note: Data event that would print to mush info
             logger.debug("event recevied from {0}: {1}".format(self.conn_type, type(event)))
@@ -140,18 +163,29 @@ class Connection(H11Connection):
         self.send(h11.EndOfMessage())
 
     def send_response(self, response):
+        self.send_response_headers(response)
+        if response.body:
+            self.send_data(response.body)
+
+        if not self.our_state == h11.SWITCHED_PROTOCOL:
+            self.send(h11.EndOfMessage())
+
+        if self.our_state is h11.MUST_CLOSE:
+            self.io_stream.close()
+
+    def send_response_headers(self, response):
         logger.debug("sent response to {0}: {1}".format(self.conn_type, response))
         self.send(h11.Response(
             status_code=int(response.code),
             reason=response.reason,
             headers=response.headers,
         ))
-        if response.body:
-            self.send(h11.Data(data=response.body))
 
-        if not self.our_state == h11.SWITCHED_PROTOCOL:
-            self.send(h11.EndOfMessage())
+    def send_data(self, data):
+        self.send(h11.Data(data=data))
 
+    def send_end_of_message(self):
+        self.send(h11.EndOfMessage())
         if self.our_state is h11.MUST_CLOSE:
             self.io_stream.close()
 
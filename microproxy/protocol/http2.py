@@ -26,8 +26,9 @@ class Connection(H2Connection):
                  on_request=None, on_response=None, on_push=None,
                  on_settings=None, on_window_updates=None,
                  on_priority_updates=None, on_reset=None,
-                 on_terminate=None, readonly=False,
-                 on_unhandled=None, **kwargs):
+                 on_terminate=None, on_request_headers=None,
+                 on_response_headers=None, on_data=None, on_end_stream=None,
+                 readonly=False, on_unhandled=None, **kwargs):
         super(Connection, self).__init__(client_side=client_side, **kwargs)
         on_unhandled = on_unhandled or self._default_on_unhandled
 
@@ -47,10 +48,19 @@ class Connection(H2Connection):
         self.on_window_updates = on_window_updates or on_unhandled_with_type("WINDOWS")
         self.on_terminate = on_terminate or on_unhandled_with_type("TERMINATE")
 
+        # NOTE: When on_data is given, DATA frames will not be buffered and
+        # flow control credit will not be returned automatically.
+        # The receiver should call acknowledge_data after consuming the data.
+        self.on_data = on_data
+        self.on_request_headers = on_request_headers or on_unhandled_with_type("REQUEST")
+        self.on_response_headers = on_response_headers or on_unhandled_with_type("RESPONSE")
+        self.on_end_stream = on_end_stream or on_unhandled_with_type("END_STREAM")
+
         self.conn_type = conn_type or self._DEFAULT_TYPES[client_side]
         self.readonly = readonly
         self.ongoings_streams = dict()
         self.unhandled_event = []
+        self._flushed_callbacks = []
 
     def initiate_connection(self):
         super(Connection, self).initiate_connection()
@@ -60,11 +70,39 @@ class Connection(H2Connection):
         if not self.readonly:
             data = self.data_to_send()
             if data:
-                return self.stream.write(data)
+                return self._write(data)
         future = concurrent.Future()
         future.set_result(None)
         return future
 
+    def _write(self, data):
+        future = self.stream.write(data)
+        if self._flushed_callbacks:
+            # NOTE: tornado only resolves the future of the latest write,
+            # so the pending callbacks always follow the latest one.
+            future.add_done_callback(self._run_flushed_callbacks)
+        return future
+
+    def on_flushed(self, callback):
+        """Run callback once the data sent so far was written into the socket."""
+        if self.readonly:
+            callback()
+            return
+        if self.stream.closed():
+            return
+        self._flushed_callbacks.append(callback)
+        self._write(b"")
+
+    def _run_flushed_callbacks(self, future):
+        callbacks, self._flushed_callbacks = self._flushed_callbacks, []
+        if future.exception():
+            return
+        for callback in callbacks:
+            callback()
+
+    def streaming(self):
+        return self.on_data is not None
+
     @gen.coroutine
     def read_bytes(self):
         data = yield self.stream.read_bytes(
@@ -117,6 +155,17 @@ class Connection(H2Connection):
 
     def handle_request(self, event):
         headers_dict = dict(event.headers)
+        if self.streaming():
+            self.on_request_headers(
+                event.stream_id,
+                HttpRequest(
+                    version=self._VERSION,
+                    method=headers_dict[":method"],
+                    path=headers_dict[":path"],
+                    headers=event.headers),
+                event.priority_updated,
+                event.stream_ended is not None)
+            return
         self.ongoings_streams[event.stream_id] = (
             HttpRequest(
                 version=self._VERSION,
@@ -126,6 +175,15 @@ class Connection(H2Connection):
 
     def handle_response(self, event):
         headers_dict = dict(event.headers)
+        if self.streaming():
+            self.on_response_headers(
+                event.stream_id,
+                HttpResponse(
+                    version=self._VERSION,
+                    code=str(headers_dict[":status"]),
+                    headers=event.headers),
+                event.stream_ended is not None)
+            return
         self.ongoings_streams[event.stream_id] = (
             HttpResponse(
                 version=self._VERSION,
@@ -133,6 +191,10 @@ class Connection(H2Connection):
                 headers=event.headers), [], None)
 
     def handle_data(self, event):
+        if self.streaming():
+            self.on_data(event.stream_id, event.data, event.flow_controlled_length)
+            return
+
         _, chunks, _ = self.ongoings_streams[event.stream_id]
         chunks.append(event.data)
 
@@ -141,7 +203,9 @@ class Connection(H2Connection):
             self.flush()
 
     def handle_end_stream(self, stream_id):
-        if self.client_side:
+        if self.streaming():
+            self.on_end_stream(stream_id)
+        elif self.client_side:
             response, chunks, _ = self.ongoings_streams[stream_id]
             response.body = b"".join(chunks)
             self.on_response(stream_id, response)
@@ -176,23 +240,30 @@ class Connection(H2Connection):
         self.on_reset(event.stream_id, event.error_code)
 
     def send_request(self, stream_id, request, **kwargs):
+        self.send_request_headers(
+            stream_id, request, not bool(request.body), **kwargs)
+        if request.body:
+            self.send_data(stream_id, request.body)
+
+    def send_request_headers(self, stream_id, request, stream_ended, **kwargs):
         logger.debug("request sent to {0}: {1}".format(
             self.conn_type, dict(stream_id=stream_id, request=dict(
                 headers=request.headers))))
         self.send_headers(
-            stream_id, request.headers, stream_ended=not bool(request.body), **kwargs)
-        if request.body:
-            self.send_data(stream_id, request.body)
+            stream_id, request.headers, stream_ended=stream_ended, **kwargs)
 
     def send_response(self, stream_id, response):
+        self.send_response_headers(
+            stream_id, response, not bool(response.body))
+        if response.body:
+            self.send_data(stream_id, response.body)
+
+    def send_response_headers(self, stream_id, response, stream_ended):
         logger.debug("response sent to {0}: {1}".format(
             self.conn_type, dict(stream_id=stream_id, response=dict(
                 headers=response.headers))))
         self.send_headers(
-            stream_id, response.headers,
-            stream_ended=not bool(response.body))
-        if response.body:
-            self.send_data(stream_id, response.body)
+            stream_id, response.headers, stream_ended=stream_ended)
 
     def _send_headers(self, *args, **kwargs):
         super(Connection, self).send_headers(*args, **kwargs)
@@ -225,6 +296,35 @@ class Connection(H2Connection):
         except NoSuchStreamError as e:  # pragma: no cover
             raise Http2Error(self.conn_type, e, "send data failed", stream_id=stream_id)
 
+    def send_data_frame(self, stream_id, data):
+        try:
+            self._send_data(stream_id, data)
+            self.flush()
+        except ProtocolError as e:
+            raise Http2Error(self.conn_type, e, "send data failed", stream_id=stream_id)
+
+    def send_end_stream(self, stream_id):
+        try:
+            self.end_stream(stream_id)
+            self.flush()
+        except ProtocolError as e:
+            raise Http2Error(self.conn_type, e, "send end stream failed", stream_id=stream_id)
+
+    def acknowledge_data(self, stream_id, length):
+        if length <= 0 or self.stream.closed():
+            return
+        try:
+            self.increment_flow_control_window(length)
+        except ProtocolError:  # pragma: no cover
+            # NOTE: connection had been terminated
+            return
+        try:
+            self.increment_flow_control_window(length, stream_id)
+        except (KeyError, ProtocolError):
+            # NOTE: stream had been closed, only the connection window matters
+            pass
+        self.flush()
+
     def send_update_settings(self, new_settings):
         logger.debug("settings update sent to {0}: {1}".format(
             self.conn_type, new_settings))
@@ -235,7 +335,13 @@ class Connection(H2Connection):
         stream_id = stream_id or None
         logger.debug("window updates sent to {0}: {1}".format(
             self.conn_type, locals()))
-        self.increment_flow_control_window(delta, stream_id)
+        try:
+            self.increment_flow_control_window(delta, stream_id)
+        except (KeyError, ProtocolError):
+            if stream_id is None:
+                raise
+            # NOTE: the stream had been closed by the peer, its window does not matter anymore
+            return
         self.flush()
 
     def send_priority_updates(self, stream_id, depends_on, weight, exclusive):
@@ -1,10 +1,14 @@
 from __future__ import absolute_import
 
+from collections import OrderedDict
+from functools import partial
 from OpenSSL import SSL, crypto
 import certifi
 import construct
+import socket
 
 from tornado import gen
+from microproxy import metrics
 from microproxy.pyca_tls import _constructs
 from microproxy.utils import HAS_ALPN
 from microproxy.exception import ProtocolError
@@ -106,6 +110,138 @@ def create_src_sslcontext(cert, priv_key, alpn_callback=None,
     return ssl_ctx
 
 
+class SSLContextCache(object):
+    """SSLContextCache: LRU cache of SSL.Context.
+
+    Building a context parses the cipher list and the trusted ca file,
+    and a shared context keeps the session cache across connections.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.contexts = OrderedDict()
+
+    def get(self, key, factory):
+        try:
+            ssl_ctx = self.contexts.pop(key)
+        except KeyError:
+            ssl_ctx = factory()
+
+        self.contexts[key] = ssl_ctx
+        while len(self.contexts) > self.max_size:
+            self.contexts.popitem(last=False)
+        return ssl_ctx
+
+    def clear(self):
+        self.contexts.clear()
+
+
+class TlsSessionCache(object):
+    """TlsSessionCache: Keep the latest TLS session of each destination for session resumption.
+
+    TLS 1.3 servers send the session ticket after the handshake had finished,
+    so the session is updated again when the connection is released or closed.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.sessions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        return self.sessions.get(key)
+
+    def set(self, key, session):
+        self.sessions.pop(key, None)
+        self.sessions[key] = session
+        while len(self.sessions) > self.max_size:
+            self.sessions.popitem(last=False)
+
+    def update(self, key, conn):
+        try:
+            session = conn.get_session()
+        except SSL.Error:  # pragma: no cover
+            return
+        if session is not None:
+            self.set(key, session)
+
+    def record(self, reused):
+        if reused:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def clear(self):
+        self.sessions.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+_dest_sslcontext_cache = SSLContextCache(64)
+_src_sslcontext_cache = SSLContextCache(1024)
+dest_session_cache = TlsSessionCache(256)
+
+metrics.registry.counter(
+    "microproxy_tls_session_reuses_total", "TLS handshakes with servers by session reuse",
+    ["result"], collect=lambda: {("hit",): dest_session_cache.hits,
+                                 ("miss",): dest_session_cache.misses})
+
+
+def _dest_sslcontext_key(insecure, trusted_ca_certs, alpn):
+    if not insecure:
+        trusted_ca_certs = trusted_ca_certs or certifi.where()
+    return (insecure, trusted_ca_certs, tuple(alpn or ()))
+
+
+def get_dest_sslcontext(insecure=False, trusted_ca_certs="", alpn=None):
+    key = _dest_sslcontext_key(insecure, trusted_ca_certs, alpn)
+    return _dest_sslcontext_cache.get(
+        key, partial(create_dest_sslcontext, insecure, key[1], alpn))
+
+
+try:
+    _SSL_session_reused = SSL._lib.SSL_session_reused
+except AttributeError:  # pragma: no cover
+    _SSL_session_reused = None
+
+
+def session_reused(conn):
+    """Whether the handshake resumed a session, None if pyOpenSSL could not tell."""
+    if _SSL_session_reused is None:  # pragma: no cover
+        return None
+    return bool(_SSL_session_reused(conn._ssl))
+
+
+def refresh_session(stream):
+    """Keep the latest session of a dest stream started by ClientConnection."""
+    session_key = getattr(stream, "session_key", None)
+    if session_key and not stream.closed():
+        dest_session_cache.update(session_key, stream.fileno())
+
+
+def _close_session(stream):
+    refresh_session(stream)
+    # NOTE: OpenSSL drops the session of a connection freed without a shutdown.
+    try:
+        stream.fileno().shutdown()
+    except SSL.Error:
+        pass
+
+
+def get_src_sslcontext(cert, priv_key, select_alpn=None):
+    def alpn_callback(conn, alpns):
+        return select_alpn
+
+    def factory():
+        ssl_ctx = create_src_sslcontext(
+            cert, priv_key, alpn_callback=alpn_callback)
+        # NOTE: session id context is required for the server side session cache
+        ssl_ctx.set_session_id(b"microproxy")
+        return ssl_ctx
+
+    key = (cert.digest("sha256"), select_alpn)
+    return _src_sslcontext_cache.get(key, factory)
+
+
 class TlsClientHello(object):
     SUPPORT_PROTOCOLS = ["http/1.1", "h2"]
 
@@ -159,14 +295,9 @@ class ServerConnection(object):
         self.on_alpn = None
 
     def start_tls(self, cert, priv_key, select_alpn=None):
-        self.select_alpn = select_alpn
-        ssl_ctx = create_src_sslcontext(
-            cert, priv_key, alpn_callback=self.alpn_callback)
+        ssl_ctx = get_src_sslcontext(cert, priv_key, select_alpn)
         return self.stream.start_tls(server_side=True, ssl_options=ssl_ctx)
 
-    def alpn_callback(self, conn, alpns):
-        return self.select_alpn
-
 
 class ClientConnection(object):
     def __init__(self, stream):
@@ -175,8 +306,27 @@ class ClientConnection(object):
     @gen.coroutine
     def start_tls(self, insecure=False, trusted_ca_certs="",
                   hostname=None, alpns=None):
-        ssl_ctx = create_dest_sslcontext(insecure, trusted_ca_certs, alpns)
+        ssl_ctx = get_dest_sslcontext(insecure, trusted_ca_certs, alpns)
+        session_key = self._session_key(insecure, trusted_ca_certs, hostname, alpns)
+        ssl_session = dest_session_cache.get(session_key) if session_key else None
         stream = yield self.stream.start_tls(
-            server_side=False, ssl_options=ssl_ctx, server_hostname=hostname)
+            server_side=False, ssl_options=ssl_ctx, server_hostname=hostname,
+            ssl_session=ssl_session)
+
+        reused = session_reused(stream.fileno())
+        logger.debug("tls session to {0} reused: {1}".format(hostname, reused))
+        if reused is not None:
+            dest_session_cache.record(reused)
+        if session_key:
+            stream.session_key = session_key
+            refresh_session(stream)
+            stream.set_before_close_callback(partial(_close_session, stream))
 
         raise gen.Return(stream)
+
+    def _session_key(self, insecure, trusted_ca_certs, hostname, alpns):
+        try:
+            peer = self.stream.socket.getpeername()
+        except socket.error:
+            return None
+        return (hostname, peer, _dest_sslcontext_key(insecure, trusted_ca_certs, alpns))
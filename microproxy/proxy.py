@@ -1,13 +1,19 @@
 from tornado import gen
 
+from microproxy import metrics
 from microproxy.tornado_ext.tcpserver import TCPServer
 from microproxy.layer import manager as layer_manager
 from microproxy.context import LayerContext
-from microproxy.utils import curr_loop
+from microproxy.utils import curr_loop, monotonic
 
 from microproxy.log import ProxyLogger
 logger = ProxyLogger.get_logger(__name__)
 
+_connections_total = metrics.registry.counter(
+    "microproxy_connections_total", "Accepted client connections")
+_connections_active = metrics.registry.gauge(
+    "microproxy_connections_active", "Client connections being proxied")
+
 
 class ProxyServer(TCPServer):
     def __init__(self, server_state, **kwargs):
@@ -17,13 +23,21 @@ class ProxyServer(TCPServer):
 
     @gen.coroutine
     def handle_stream(self, stream):
+        timing = {"accept": monotonic()}
+        # NOTE: see create_dest_stream for why Nagle is disabled.
+        stream.set_nodelay(True)
+        _connections_total.inc()
+        _connections_active.inc()
         src_info = "{0}:{1}".format(*stream.fileno().getpeername())
         try:
             initial_context = LayerContext(
-                mode=self.config["mode"], src_stream=stream, src_info=src_info)
+                mode=self.config["mode"], src_stream=stream, src_info=src_info,
+                timing=timing)
 
             logger.debug("Start new layer manager")
-            initial_layer = layer_manager.get_first_layer(initial_context)
+            initial_layer = layer_manager.get_first_layer(
+                initial_context, dest_pool=self.server_state.dest_pool,
+                config=self.config)
             yield layer_manager.run_layers(
                 self.server_state, initial_layer, initial_context)
         except Exception as e:
@@ -31,6 +45,8 @@ class ProxyServer(TCPServer):
             logger.exception("Unhandled exception occured at {0} with {1}".format(
                 src_info, e))
             stream.close()
+        finally:
+            _connections_active.dec()
 
     def start_listener(self):
         self.listen(self.config["port"], self.config["host"])
@@ -39,7 +55,11 @@ class ProxyServer(TCPServer):
                                                           self.config["port"]))
 
 
-def start_tcp_server(server_state):
+def start_tcp_server(server_state, sockets=None):
     io_loop = curr_loop()
     server = ProxyServer(server_state, io_loop=io_loop)
-    server.start_listener()
+    if sockets:
+        # NOTE: sockets bound by the worker supervisor before forking.
+        server.add_sockets(sockets)
+    else:
+        server.start_listener()
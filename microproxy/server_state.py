@@ -4,7 +4,9 @@ from microproxy.context import ServerContext
 from microproxy.interceptor import Interceptor
 from microproxy.interceptor import MsgPublisher
 from microproxy.interceptor import PluginManager
+from microproxy.interceptor import CapturePolicy
 from microproxy.cert import CertStore
+from microproxy.pool import ConnectionPool
 
 
 def _init_cert_store(config):
@@ -14,8 +16,16 @@ def _init_cert_store(config):
 def _init_interceptor(config, publish_socket):
     plugin_manager = PluginManager(config)
     msg_publisher = MsgPublisher(config, zmq_socket=publish_socket)
+    capture_policy = CapturePolicy(config)
     return Interceptor(
-        plugin_manager=plugin_manager, msg_publisher=msg_publisher)
+        plugin_manager=plugin_manager, msg_publisher=msg_publisher,
+        capture_policy=capture_policy)
+
+
+def _init_dest_pool(config):
+    return ConnectionPool(
+        max_per_host=config["pool_max_per_host"],
+        idle_timeout=config["pool_idle_timeout"])
 
 
 def init_server_state(config, publish_socket):
@@ -30,6 +40,8 @@ def init_server_state(config, publish_socket):
     """
     cert_store = _init_cert_store(config)
     interceptor = _init_interceptor(config, publish_socket)
+    dest_pool = _init_dest_pool(config)
 
     return ServerContext(
-        config=config, interceptor=interceptor, cert_store=cert_store)
+        config=config, interceptor=interceptor, cert_store=cert_store,
+        dest_pool=dest_pool)
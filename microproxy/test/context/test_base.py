@@ -1,6 +1,27 @@
 import unittest
 
-from microproxy.context.base import parse_version
+from microproxy.context.base import Serializable, parse_version
+
+
+class SlotsContext(Serializable):
+    __slots__ = ("name", "child")
+
+    def __init__(self, name="", child=None):
+        self.name = name
+        self.child = child
+
+
+class DictContext(Serializable):
+    def __init__(self, name=""):
+        self.name = name
+
+
+class ExtendedSlotsContext(SlotsContext):
+    __slots__ = ("value",)
+
+    def __init__(self, value=0, **kwargs):
+        super(ExtendedSlotsContext, self).__init__(**kwargs)
+        self.value = value
 
 
 class TestBase(unittest.TestCase):
@@ -12,3 +33,26 @@ class TestBase(unittest.TestCase):
 
     def test_parse_plus_dev_version(self):
         self.assertEquals((0, 4, 0), parse_version("0.4.0+dev"))
+
+
+class TestSerializable(unittest.TestCase):
+    def test_serialize_slots(self):
+        ctx = SlotsContext(name="parent", child=DictContext(name="child"))
+        self.assertFalse(hasattr(ctx, "__dict__"))
+        self.assertEqual(ctx.serialize(),
+                         {"name": "parent", "child": {"name": "child"}})
+
+    def test_serialize_inherited_slots(self):
+        ctx = ExtendedSlotsContext(value=1, name="ctx")
+        self.assertEqual(ctx.serialize(),
+                         {"name": "ctx", "child": None, "value": 1})
+
+    def test_deserialize_slots(self):
+        ctx = ExtendedSlotsContext.deserialize({"name": "ctx", "value": 1})
+        self.assertEqual(ctx, ExtendedSlotsContext(value=1, name="ctx"))
+        self.assertNotEqual(ctx, ExtendedSlotsContext(value=2, name="ctx"))
+
+    def test_str(self):
+        self.assertEqual(str(DictContext(name="ctx")), "DictContext{'name': 'ctx'}")
+        self.assertEqual(str(SlotsContext(name="ctx")),
+                         "SlotsContext{'name': 'ctx', 'child': None}")
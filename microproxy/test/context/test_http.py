@@ -111,5 +111,61 @@ class TestHttpHeaders(unittest.TestCase):
         with self.assertRaises(ValueError):
             HttpHeaders("aaa")
 
+    def test_case_insensitive(self):
+        self.assertTrue("host" in self.headers)
+        self.assertEqual(self.headers["ACCEPT"], "application/xml")
+
+    def test_get(self):
+        self.headers["accept"] = "text/html"
+        self.assertEqual(self.headers.get("Accept"), "application/xml, text/html")
+        self.assertIsNone(self.headers.get("Hahaha"))
+        self.assertEqual(self.headers.get("Hahaha", ""), "")
+
+    def test_getlist(self):
+        self.headers["accept"] = "text/html"
+        self.assertEqual(self.headers.getlist("Accept"),
+                         ["application/xml", "text/html"])
+        self.assertEqual(self.headers.getlist("Hahaha"), [])
+
+    def test_remove(self):
+        self.headers["accept"] = "text/html"
+        self.assertEqual(self.headers.remove("Accept"),
+                         ["application/xml", "text/html"])
+        self.assertFalse("Accept" in self.headers)
+        self.assertEqual(self.headers["Yayaya"], "Yoyoyo")
+        self.assertEqual(
+            list(self.headers),
+            [("Host", "localhost"), ("Yayaya", "Yoyoyo")])
+        self.assertEqual(self.headers.remove("Accept"), [])
+
+    def test_replace(self):
+        self.headers["accept"] = "text/html"
+        self.headers.replace("Accept", "*/*")
+        self.assertEqual(
+            list(self.headers),
+            [("Host", "localhost"),
+             ("Accept", "*/*"),
+             ("Yayaya", "Yoyoyo")])
+        self.assertEqual(self.headers["yayaya"], "Yoyoyo")
+
+        self.headers.replace("Hahaha", "hey!!!")
+        self.assertEqual(self.headers["hahaha"], "hey!!!")
+        self.assertEqual(len(self.headers), 4)
+
+    def test_modify_headers_list(self):
+        self.assertEqual(self.headers["Host"], "localhost")
+        self.headers.headers.append(("Hahaha", "hey!!!"))
+        self.assertEqual(self.headers["hahaha"], "hey!!!")
+
+        self.headers.headers = [("Host", "example.com")]
+        self.assertEqual(self.headers["Host"], "example.com")
+        self.assertFalse("Accept" in self.headers)
+
+    def test_str(self):
+        self.assertEqual(
+            str(HttpHeaders([("Host", "localhost")])),
+            "HttpHeaders{'headers': [('Host', 'localhost')]}")
+
+
 if __name__ == "__main__":
     unittest.main()
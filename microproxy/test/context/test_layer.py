@@ -1,4 +1,6 @@
 import unittest
+from copy import copy
+
 from microproxy.context import LayerContext
 
 
@@ -6,3 +8,20 @@ class TestLayerContext(unittest.TestCase):
     def test_invalid_mode(self):
         with self.assertRaises(ValueError):
             LayerContext(mode="test")
+
+    def test_copy(self):
+        context = LayerContext(mode="socks", host="127.0.0.1", port=8080)
+        self.assertFalse(hasattr(context, "__dict__"))
+
+        new_context = copy(context)
+        new_context.host = "localhost"
+        self.assertEqual(new_context.port, 8080)
+        self.assertEqual(context.host, "127.0.0.1")
+
+    def test_timing_shared_by_copies(self):
+        context = LayerContext(mode="socks", timing={"accept": 1.0})
+
+        new_context = copy(context)
+        new_context.timing["connect"] = 2.0
+        self.assertEqual(context.timing, {"accept": 1.0, "connect": 2.0})
+        self.assertEqual(LayerContext(mode="socks").timing, {})
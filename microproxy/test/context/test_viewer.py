@@ -67,3 +67,86 @@ class TestViewerContext(unittest.TestCase):
         self.assertEqual("http/1.1", viewer_context.server_tls.alpn)
         self.assertEqual("localhost", viewer_context.server_tls.sni)
         self.assertEqual("AES", viewer_context.server_tls.cipher)
+
+        self.assertFalse(viewer_context.truncated)
+        self.assertEqual(0, viewer_context.request_body_length)
+        self.assertEqual(0, viewer_context.response_body_length)
+
+    def _create_viewer_context(self):
+        return ViewerContext.deserialize({
+            "scheme": "https",
+            "host": "localhost",
+            "port": 8080,
+            "path": "/index",
+            "request": {
+                "version": "1.1",
+                "method": "POST",
+                "path": "/index",
+                "headers": [["Content-Type", "application/octet-stream"]],
+                "body": b"\x00\xffrequest".encode("base64"),
+            },
+            "response": {
+                "version": "1.1",
+                "code": "200",
+                "reason": "OK",
+                "headers": [["Content-Type", "text/html"]],
+                "body": b"<html></html>".encode("base64"),
+            },
+            "client_tls": {
+                "sni": "localhost",
+                "alpn": "http/1.1",
+                "cipher": "AES",
+            },
+            "server_tls": None,
+        })
+
+    def test_binary_round_trip(self):
+        viewer_context = self._create_viewer_context()
+        message = viewer_context.serialize_binary()
+
+        self.assertIn(b"\x00\xffrequest", message)
+        self.assertNotIn(b"\x00\xffrequest".encode("base64").strip(), message)
+
+        new_viewer_context = ViewerContext.deserialize_binary(message)
+        self.assertEqual(new_viewer_context.serialize(), viewer_context.serialize())
+        self.assertEqual(new_viewer_context.request.body, b"\x00\xffrequest")
+        self.assertEqual(new_viewer_context.response.body, b"<html></html>")
+        self.assertEqual(new_viewer_context.request.headers["Content-Type"],
+                         "application/octet-stream")
+
+    def test_truncated(self):
+        viewer_context = self._create_viewer_context()
+        viewer_context.truncated = True
+        viewer_context.response_body_length = 1024
+
+        for new_viewer_context in (
+                ViewerContext.deserialize(viewer_context.serialize()),
+                ViewerContext.deserialize_binary(viewer_context.serialize_binary())):
+            self.assertTrue(new_viewer_context.truncated)
+            self.assertEqual(new_viewer_context.response_body_length, 1024)
+            self.assertEqual(new_viewer_context.response.body, b"<html></html>")
+
+    def test_binary_without_response(self):
+        viewer_context = self._create_viewer_context()
+        viewer_context.response = None
+
+        new_viewer_context = ViewerContext.deserialize_binary(
+            viewer_context.serialize_binary())
+        self.assertIsNone(new_viewer_context.response)
+        self.assertEqual(new_viewer_context.request.body, b"\x00\xffrequest")
+
+    def test_binary_with_old_version(self):
+        viewer_context = self._create_viewer_context()
+        viewer_context.version = "0.4.0"
+
+        new_viewer_context = ViewerContext.deserialize_binary(
+            viewer_context.serialize_binary())
+        self.assertEqual(new_viewer_context.version, VERSION)
+
+    def test_binary_with_unsupported_format(self):
+        message = self._create_viewer_context().serialize_binary()
+
+        with self.assertRaises(ValueError):
+            ViewerContext.deserialize_binary(b"XXX" + message[3:])
+        with self.assertRaises(ValueError):
+            ViewerContext.deserialize_binary(message[:2])
@@ -3,7 +3,7 @@ import mock
 import unittest
 
 from microproxy.context import Event
-from microproxy.event import EventManager
+from microproxy.event import EventManager, start_events_server
 
 
 class TestEventManager(unittest.TestCase):
@@ -29,5 +29,18 @@ class TestEventManager(unittest.TestCase):
         self.handler.handle_event.assert_called_with(
             Event(name="replay", context={"replay": "yoyo"}))
 
+    @mock.patch("microproxy.event.manager.EventHandler")
+    def test_start_events_server_with_broadcast(self, mock_handler):
+        zmq_stream, broadcast_stream = mock.Mock(), mock.Mock()
+        start_events_server(None, zmq_stream, broadcast_stream)
+
+        handler = mock_handler.return_value
+        zmq_stream.on_recv.call_args[0][0]([json.dumps({"name": "replay"})])
+        broadcast_stream.on_recv.call_args[0][0]([json.dumps({"name": "gc_stats"})])
+        self.assertEqual(
+            handler.handle_event.call_args_list,
+            [mock.call(Event(name="replay")), mock.call(Event(name="gc_stats"))])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,125 @@
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import time
+import mock
+import unittest
+
+from microproxy.context import Event, ServerContext
+from microproxy.event import (
+    PROFILE_START, PROFILE_STOP, MEMORY_SNAPSHOT, GC_STATS)
+from microproxy.event.profiling import ProfileHandler, StackSampler
+
+
+def busy_function(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+
+class TestProfileHandler(unittest.TestCase):
+    def setUp(self):
+        self.interceptor = mock.Mock()
+        self.profile_handler = ProfileHandler(
+            ServerContext(interceptor=self.interceptor), io_loop=mock.Mock())
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def published_report(self):
+        topic, message = self.interceptor.msg_publisher.send.call_args[0]
+        self.assertEqual(topic, "profile")
+        return json.loads(message)
+
+    def test_cprofile(self):
+        self.profile_handler.handle(Event(PROFILE_START, {"profiler": "cprofile"}))
+        busy_function(0.01)
+        self.profile_handler.handle(Event(PROFILE_STOP, {}))
+
+        message = self.published_report()
+        self.assertEqual(message["event"], PROFILE_STOP)
+        self.assertEqual(message["pid"], os.getpid())
+        self.assertIn("busy_function", message["report"])
+        self.assertIsNone(self.profile_handler.profiler)
+
+    def test_cprofile_output(self):
+        output = os.path.join(self.output_dir, "proxy.prof")
+        self.profile_handler.handle(Event(PROFILE_START, {"profiler": "cprofile"}))
+        busy_function(0.01)
+        self.profile_handler.handle(Event(PROFILE_STOP, {"output": output}))
+
+        self.interceptor.msg_publisher.send.assert_not_called()
+        stats = pstats.Stats(output)
+        self.assertTrue(any(name == "busy_function" for _, _, name in stats.stats))
+
+    def test_sampling(self):
+        output = os.path.join(self.output_dir, "proxy.stacks")
+        self.profile_handler.handle(Event(
+            PROFILE_START, {"profiler": "sampling", "interval": 0.001}))
+        busy_function(0.05)
+        self.profile_handler.handle(Event(PROFILE_STOP, {"output": output}))
+
+        with open(output) as fp:
+            lines = fp.read().splitlines()
+        self.assertTrue(lines)
+        stack, count = lines[0].rsplit(" ", 1)
+        self.assertTrue(stack.endswith("test_profiling.py:busy_function"))
+        self.assertGreater(int(count), 0)
+
+    def test_start_twice(self):
+        self.profile_handler.handle(Event(PROFILE_START, {}))
+        with self.assertRaises(ValueError):
+            self.profile_handler.handle(Event(PROFILE_START, {}))
+        self.profile_handler.handle(Event(PROFILE_STOP, {}))
+
+    def test_stop_without_start(self):
+        with self.assertRaises(ValueError):
+            self.profile_handler.handle(Event(PROFILE_STOP, {}))
+
+    def test_unknown_profiler(self):
+        with self.assertRaises(ValueError):
+            self.profile_handler.handle(Event(PROFILE_START, {"profiler": "perf"}))
+        self.assertIsNone(self.profile_handler.profiler)
+
+    def test_other_pid(self):
+        self.profile_handler.handle(Event(
+            PROFILE_START, {"profiler": "cprofile", "pid": os.getpid() + 1}))
+        self.assertIsNone(self.profile_handler.profiler)
+
+        self.profile_handler.handle(Event(
+            PROFILE_START, {"profiler": "cprofile", "pid": os.getpid()}))
+        self.assertIsNotNone(self.profile_handler.profiler)
+        self.profile_handler.handle(Event(PROFILE_STOP, {}))
+
+    def test_output_with_workers(self):
+        self.profile_handler.server_state.config = {"workers": 2}
+        output = os.path.join(self.output_dir, "gc.json")
+        self.profile_handler.handle(Event(GC_STATS, {"output": output}))
+
+        self.assertTrue(os.path.exists("{0}.{1}".format(output, os.getpid())))
+        self.assertFalse(os.path.exists(output))
+
+    def test_memory_snapshot(self):
+        self.profile_handler.handle(Event(MEMORY_SNAPSHOT, {}))
+        self.assertIsNotNone(self.profile_handler.last_snapshot)
+
+        leaked = [StackSampler(0) for _ in range(100)]
+        self.profile_handler.handle(Event(MEMORY_SNAPSHOT, {}))
+        self.assertIn("StackSampler +100", self.published_report()["report"])
+        del leaked
+
+    def test_gc_stats(self):
+        self.profile_handler.handle(Event(GC_STATS, {"collect": True}))
+
+        stats = json.loads(self.published_report()["report"])
+        self.assertTrue(stats["enabled"])
+        self.assertEqual(len(stats["count"]), 3)
+        self.assertIn("collected", stats)
+        self.assertGreater(stats["objects"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -56,7 +56,7 @@ class TestReplayHandler(AsyncTestCase):
 
         self.assertIsNotNone(self.context)
         self.layer_manager.get_first_layer.assert_called_with(
-            self.context)
+            self.context, config=self.server_state.config)
         self.layer_manager.run_layers.assert_called_with(
             self.server_state, self.layer_manager.first_layer, self.context)
 
@@ -89,7 +89,7 @@ class TestReplayHandler(AsyncTestCase):
 
         self.assertIsNotNone(self.context)
         self.layer_manager.get_first_layer.assert_called_with(
-            self.context)
+            self.context, config=self.server_state.config)
         self.layer_manager.run_layers.assert_called_with(
             self.server_state, self.layer_manager.first_layer, self.context)
 
@@ -120,7 +120,7 @@ class TestReplayHandler(AsyncTestCase):
 
         self.assertIsNotNone(self.context)
         self.layer_manager.get_first_layer.assert_called_with(
-            self.context)
+            self.context, config=self.server_state.config)
         self.layer_manager.run_layers.assert_called_with(
             self.server_state, self.layer_manager.first_layer, self.context)
 
@@ -152,7 +152,7 @@ class TestReplayHandler(AsyncTestCase):
 
         self.assertIsNotNone(self.context)
         self.layer_manager.get_first_layer.assert_called_with(
-            self.context)
+            self.context, config=self.server_state.config)
         self.layer_manager.run_layers.assert_called_with(
             self.server_state, self.layer_manager.first_layer, self.context)
 
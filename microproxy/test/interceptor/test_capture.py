@@ -0,0 +1,175 @@
+import unittest
+import mock
+
+from microproxy.context import HttpRequest, HttpResponse, LayerContext
+from microproxy.interceptor import Interceptor
+from microproxy.interceptor.capture import (
+    CapturePolicy, parse_content_type_limits)
+
+
+class TestParseContentTypeLimits(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(
+            parse_content_type_limits(["image/*=0", "Text/HTML=1024"]),
+            [("image/*", 0), ("text/html", 1024)])
+
+    def test_parse_invalid(self):
+        with self.assertRaises(ValueError):
+            parse_content_type_limits(["image/*"])
+        with self.assertRaises(ValueError):
+            parse_content_type_limits(["=10"])
+        with self.assertRaises(ValueError):
+            parse_content_type_limits(["image/*=big"])
+
+
+class TestCapturePolicy(unittest.TestCase):
+    def create_response(self, body, content_type="text/html"):
+        return HttpResponse(
+            code="200", headers=[("Content-Type", content_type)], body=body)
+
+    def test_default(self):
+        policy = CapturePolicy()
+        response = self.create_response(b"x" * 100)
+
+        self.assertTrue(policy.should_capture("example.com", "/index"))
+        self.assertEqual(policy.truncate(response), (response, 100, False))
+
+    def test_max_body(self):
+        policy = CapturePolicy(dict(capture_max_body=10))
+        response = self.create_response(b"0123456789abc")
+
+        new_response, length, truncated = policy.truncate(response)
+        self.assertEqual(new_response.body, b"0123456789")
+        self.assertEqual(new_response.code, "200")
+        self.assertEqual(length, 13)
+        self.assertTrue(truncated)
+        self.assertEqual(response.body, b"0123456789abc")
+
+        response = self.create_response(b"0123456789")
+        self.assertEqual(policy.truncate(response), (response, 10, False))
+
+    def test_streamed_body(self):
+        response = self.create_response(b"abc")
+        self.assertEqual(CapturePolicy().truncate(response, 8), (response, 8, True))
+        self.assertEqual(CapturePolicy().truncate(response, 3), (response, 3, False))
+
+        new_response, length, truncated = CapturePolicy(
+            dict(capture_max_body=2)).truncate(response, 8)
+        self.assertEqual(new_response.body, b"ab")
+        self.assertEqual(length, 8)
+        self.assertTrue(truncated)
+
+    def test_content_type_limits(self):
+        policy = CapturePolicy(dict(
+            capture_max_body=10,
+            capture_content_type_limits=["image/*=0", "application/json=-1"]))
+
+        new_response, length, truncated = policy.truncate(
+            self.create_response(b"png", "image/png"))
+        self.assertEqual(new_response.body, b"")
+        self.assertEqual(length, 3)
+        self.assertTrue(truncated)
+
+        response = self.create_response(b"{}" * 10, "application/json; charset=utf-8")
+        self.assertEqual(policy.truncate(response), (response, 20, False))
+
+        new_response, _, truncated = policy.truncate(
+            self.create_response(b"x" * 20))
+        self.assertEqual(new_response.body, b"x" * 10)
+        self.assertTrue(truncated)
+
+    def test_headers_only(self):
+        policy = CapturePolicy(dict(
+            capture_headers_only=True,
+            capture_content_type_limits=["text/*=-1"]))
+        request = HttpRequest(method="POST", body=b"data")
+
+        new_request, length, truncated = policy.truncate(request)
+        self.assertEqual(new_request.body, b"")
+        self.assertEqual(new_request.method, "POST")
+        self.assertEqual(length, 4)
+        self.assertTrue(truncated)
+
+        _, length, truncated = policy.truncate(HttpRequest(method="GET"))
+        self.assertEqual(length, 0)
+        self.assertFalse(truncated)
+
+    def test_truncate_none(self):
+        self.assertEqual(CapturePolicy().truncate(None), (None, 0, False))
+
+    def test_include(self):
+        policy = CapturePolicy(dict(
+            capture_include=["*.example.com/api/*", "github.com"]))
+
+        self.assertTrue(policy.should_capture("www.example.com", "/api/users"))
+        self.assertFalse(policy.should_capture("www.example.com", "/index"))
+        self.assertTrue(policy.should_capture("github.com", "/index"))
+        self.assertTrue(policy.should_capture("github.com", "*"))
+        self.assertFalse(policy.should_capture("gitlab.com", "/index"))
+
+    def test_exclude(self):
+        policy = CapturePolicy(dict(
+            capture_include=["*.example.com"],
+            capture_exclude=["*/*.mp4", "cdn.example.com"]))
+
+        self.assertTrue(policy.should_capture("www.example.com", "/index"))
+        self.assertFalse(policy.should_capture("www.example.com", "/video.mp4"))
+        self.assertFalse(policy.should_capture("cdn.example.com", "/index"))
+
+
+class TestInterceptorPublish(unittest.TestCase):
+    def setUp(self):
+        self.msg_publisher = mock.Mock()
+        self.layer_context = LayerContext(
+            mode="socks", scheme="https", host="example.com", port=443)
+        self.request = HttpRequest(method="GET", path="/index")
+        self.response = HttpResponse(
+            code="200", headers=[("Content-Type", "text/html")],
+            body=b"<html></html>")
+
+    def test_publish(self):
+        interceptor = Interceptor(msg_publisher=self.msg_publisher)
+        interceptor.publish(self.layer_context, self.request, self.response)
+
+        viewer_context = self.msg_publisher.publish.call_args[0][0]
+        self.assertEqual(viewer_context.host, "example.com")
+        self.assertEqual(viewer_context.path, "/index")
+        self.assertIs(viewer_context.response, self.response)
+        self.assertFalse(viewer_context.truncated)
+        self.assertEqual(viewer_context.request_body_length, 0)
+        self.assertEqual(viewer_context.response_body_length, 13)
+
+    def test_publish_truncated(self):
+        interceptor = Interceptor(
+            msg_publisher=self.msg_publisher,
+            capture_policy=CapturePolicy(dict(capture_max_body=6)))
+        interceptor.publish(self.layer_context, self.request, self.response)
+
+        viewer_context = self.msg_publisher.publish.call_args[0][0]
+        self.assertEqual(viewer_context.response.body, b"<html>")
+        self.assertTrue(viewer_context.truncated)
+        self.assertEqual(viewer_context.response_body_length, 13)
+        self.assertEqual(self.response.body, b"<html></html>")
+
+    def test_publish_streamed(self):
+        interceptor = Interceptor(msg_publisher=self.msg_publisher)
+        interceptor.publish(self.layer_context, self.request, self.response,
+                            response_body_length=100)
+
+        viewer_context = self.msg_publisher.publish.call_args[0][0]
+        self.assertIs(viewer_context.response, self.response)
+        self.assertTrue(viewer_context.truncated)
+        self.assertEqual(viewer_context.request_body_length, 0)
+        self.assertEqual(viewer_context.response_body_length, 100)
+
+    def test_publish_excluded(self):
+        interceptor = Interceptor(
+            msg_publisher=self.msg_publisher,
+            capture_policy=CapturePolicy(dict(capture_exclude=["example.com"])))
+        interceptor.publish(self.layer_context, self.request, self.response)
+
+        self.msg_publisher.publish.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
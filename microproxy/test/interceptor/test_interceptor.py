@@ -0,0 +1,83 @@
+import unittest
+import mock
+
+from microproxy.context import HttpRequest, HttpResponse, LayerContext
+from microproxy.interceptor import Interceptor
+from microproxy.interceptor.interceptor import relative_timing
+
+
+class TestInterceptor(unittest.TestCase):
+    def setUp(self):
+        self.plugin_manager = mock.Mock()
+        self.interceptor = Interceptor(plugin_manager=self.plugin_manager)
+        self.layer_context = LayerContext(
+            mode="socks", scheme="https", host="example.com", port=443)
+        self.request = HttpRequest(method="GET", path="/index")
+        self.response = HttpResponse(code="200")
+
+    def test_request(self):
+        hooks = [(mock.Mock(), False)]
+        self.plugin_manager.request_hooks.return_value = hooks
+
+        result = self.interceptor.request(self.layer_context, self.request)
+
+        self.plugin_manager.request_hooks.assert_called_once_with(
+            "example.com", self.request)
+        self.assertEqual(result, self.plugin_manager.exec_hooks.return_value)
+        plugin_context = self.plugin_manager.exec_hooks.call_args[0][1]
+        self.assertEqual(self.plugin_manager.exec_hooks.call_args[0][0], hooks)
+        self.assertEqual(plugin_context.host, "example.com")
+        self.assertEqual(plugin_context.path, "/index")
+        self.assertIs(plugin_context.request, self.request)
+        self.assertIsNone(plugin_context.response)
+
+    def test_request_without_matched_plugins(self):
+        self.plugin_manager.request_hooks.return_value = []
+
+        self.assertIsNone(self.interceptor.request(self.layer_context, self.request).result())
+        self.plugin_manager.exec_hooks.assert_not_called()
+
+    def test_response(self):
+        self.plugin_manager.response_hooks.return_value = [(mock.Mock(), False)]
+
+        result = self.interceptor.response(
+            self.layer_context, self.request, self.response)
+
+        self.plugin_manager.response_hooks.assert_called_once_with(
+            "example.com", self.request, self.response)
+        self.assertEqual(result, self.plugin_manager.exec_hooks.return_value)
+        plugin_context = self.plugin_manager.exec_hooks.call_args[0][1]
+        self.assertIs(plugin_context.response, self.response)
+
+    def test_response_without_matched_plugins(self):
+        self.plugin_manager.response_hooks.return_value = []
+
+        self.assertIsNone(self.interceptor.response(
+            self.layer_context, self.request, self.response).result())
+        self.plugin_manager.exec_hooks.assert_not_called()
+
+    def test_without_plugin_manager(self):
+        interceptor = Interceptor()
+        self.assertIsNone(interceptor.request(self.layer_context, self.request).result())
+        self.assertIsNone(interceptor.response(
+            self.layer_context, self.request, self.response).result())
+
+
+class TestRelativeTiming(unittest.TestCase):
+    def test_since_accept(self):
+        self.assertEqual(
+            relative_timing({"accept": 10.0, "connect": 10.5},
+                            {"request": 10.25, "response": 11.0}),
+            {"accept": 0.0, "connect": 500.0, "request": 250.0, "response": 1000.0})
+
+    def test_without_accept(self):
+        self.assertEqual(
+            relative_timing({}, {"request": 10.0, "response": 10.002}),
+            {"request": 0.0, "response": 2.0})
+
+    def test_empty(self):
+        self.assertEqual(relative_timing({}, None), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
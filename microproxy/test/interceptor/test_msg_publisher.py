@@ -10,10 +10,11 @@ from microproxy.version import VERSION
 class TestMsgPublisher(unittest.TestCase):
     def setUp(self):
         self.zmq_socket = mock.Mock()
-        self.msg_publisher = MsgPublisher(None, self.zmq_socket)
-
-    def test_publish(self):
-        ctx_data = {
+        self.io_loop = mock.Mock()
+        self.msg_publisher = MsgPublisher(
+            dict(publish_queue_size=3, publish_batch_size=2, publish_interval=50),
+            self.zmq_socket, io_loop=self.io_loop)
+        self.ctx_data = {
             "scheme": "https",
             "host": "example.com",
             "path": "/index",
@@ -23,13 +24,86 @@ class TestMsgPublisher(unittest.TestCase):
             "server_tls": None,
             "response": None,
             "request": None,
+            "truncated": False,
+            "request_body_length": 0,
+            "response_body_length": 0,
+            "timing": {},
         }
-        ctx = ViewerContext.deserialize(ctx_data)
-        self.msg_publisher.publish(ctx)
+        self.ctx = ViewerContext.deserialize(self.ctx_data)
+
+    def test_publish(self):
+        self.msg_publisher.publish(self.ctx)
+
+        self.zmq_socket.send_multipart.assert_not_called()
+        self.io_loop.call_later.assert_called_once_with(
+            0.05, self.msg_publisher._on_flush_timeout)
 
+        self.msg_publisher._on_flush_timeout()
         self.zmq_socket.send_multipart.assert_called_with([
             "message",
-            JsonStrMatcher(ctx_data)])
+            JsonStrMatcher(self.ctx_data)])
+        self.assertEqual(self.msg_publisher.published, 1)
+
+    def test_publish_batch(self):
+        self.msg_publisher.publish(self.ctx)
+        self.msg_publisher.publish(self.ctx)
+
+        self.io_loop.remove_timeout.assert_called_once_with(
+            self.io_loop.call_later.return_value)
+        self.io_loop.add_callback.assert_called_once_with(
+            self.msg_publisher._run_scheduled_flush)
+
+        self.msg_publisher._run_scheduled_flush()
+        self.zmq_socket.send_multipart.assert_called_once_with([
+            "message",
+            JsonStrMatcher(self.ctx_data),
+            JsonStrMatcher(self.ctx_data)])
+        self.assertEqual(self.msg_publisher.published, 2)
+
+    def test_publish_queue_full(self):
+        for _ in range(5):
+            self.msg_publisher.publish(self.ctx)
+
+        self.assertEqual(len(self.msg_publisher.queue), 3)
+        self.assertEqual(self.msg_publisher.dropped, 2)
+
+    def test_flush_remaining_later(self):
+        for _ in range(3):
+            self.msg_publisher.publish(self.ctx)
+        self.msg_publisher._run_scheduled_flush()
+
+        self.assertEqual(self.zmq_socket.send_multipart.call_count, 1)
+        self.assertEqual(len(self.msg_publisher.queue), 1)
+        self.assertEqual(self.io_loop.add_callback.call_count, 2)
+
+        self.msg_publisher._run_scheduled_flush()
+        self.assertEqual(self.zmq_socket.send_multipart.call_count, 2)
+        self.assertEqual(self.msg_publisher.published, 3)
+
+    def test_flush_empty(self):
+        self.msg_publisher.flush()
+        self.zmq_socket.send_multipart.assert_not_called()
+
+    def test_send(self):
+        self.msg_publisher.publish(self.ctx)
+        self.msg_publisher.send("profile", "report")
+
+        self.zmq_socket.send_multipart.assert_called_once_with(["profile", "report"])
+        self.assertEqual(len(self.msg_publisher.queue), 1)
+
+
+class TestBinaryMsgPublisher(unittest.TestCase):
+    def test_publish(self):
+        zmq_socket = mock.Mock()
+        msg_publisher = MsgPublisher(
+            dict(viewer_format="binary"), zmq_socket, io_loop=mock.Mock())
+        ctx = ViewerContext(scheme="https", host="example.com", port=443)
+
+        msg_publisher.publish(ctx)
+        msg_publisher.flush()
+
+        zmq_socket.send_multipart.assert_called_once_with([
+            "message.bin", ctx.serialize_binary()])
 
 
 class JsonStrMatcher(object):
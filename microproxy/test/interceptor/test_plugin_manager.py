@@ -0,0 +1,332 @@
+import mock
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+from tornado import gen
+from tornado.testing import AsyncTestCase, gen_test
+
+from microproxy.context import PluginContext, HttpRequest, HttpResponse
+from microproxy.exception import PluginError
+from microproxy.interceptor.plugin_manager import PluginManager, start_plugin_processes
+
+REQUEST_PLUGIN = """
+def on_request(plugin_context):
+    plugin_context.path += "/request"
+    return plugin_context
+"""
+
+RESPONSE_PLUGIN = """
+def on_response(plugin_context):
+    plugin_context.path += "/response"
+    return plugin_context
+"""
+
+SCOPED_PLUGIN = """
+MATCH = {"host": "*.example.com", "path": "/api/"}
+
+def on_request(plugin_context):
+    plugin_context.path += "/scoped"
+    return plugin_context
+"""
+
+INVALID_MATCH_PLUGIN = """
+MATCH = {"hostname": "example.com"}
+
+def on_request(plugin_context):
+    return plugin_context
+"""
+
+COPY_PLUGIN = """
+COPY_CONTEXT = True
+
+def on_request(plugin_context):
+    plugin_context.path += "/copy"
+    return plugin_context
+"""
+
+COROUTINE_PLUGIN = """
+from tornado import gen
+
+@gen.coroutine
+def on_request(plugin_context):
+    yield gen.moment
+    plugin_context.path += "/coroutine"
+    raise gen.Return(plugin_context)
+"""
+
+EXECUTOR_PLUGIN = """
+import threading
+
+RUN_IN_EXECUTOR = True
+
+def on_request(plugin_context):
+    plugin_context.path += "/" + threading.current_thread().name
+    return plugin_context
+"""
+
+PROCESS_PLUGIN = """
+import os
+
+RUN_IN_PROCESS = True
+
+def on_request(plugin_context):
+    plugin_context.path += "/" + str(os.getpid())
+    return plugin_context
+"""
+
+SLOW_PLUGIN = """
+from tornado import gen
+
+TIMEOUT = 0.01
+
+@gen.coroutine
+def on_request(plugin_context):
+    yield gen.sleep(1)
+    raise gen.Return(plugin_context)
+"""
+
+SLOW_EXECUTOR_PLUGIN = """
+import time
+
+RUN_IN_EXECUTOR = True
+TIMEOUT = 0.01
+
+def on_request(plugin_context):
+    time.sleep(0.1)
+    plugin_context.request.path = "/late"
+    plugin_context.path += "/late"
+    return plugin_context
+"""
+
+FAILING_PLUGIN = """
+FAIL_POLICY = "open"
+
+def on_request(plugin_context):
+    raise RuntimeError("broken plugin")
+"""
+
+INVALID_FAIL_POLICY_PLUGIN = """
+FAIL_POLICY = "ignore"
+
+def on_request(plugin_context):
+    return plugin_context
+"""
+
+
+class TestPluginManager(AsyncTestCase):
+    def setUp(self):
+        super(TestPluginManager, self).setUp()
+        self.plugin_dir = tempfile.mkdtemp()
+        self.plugin_manager = PluginManager({"plugins": []})
+        self.plugin_context = PluginContext(
+            scheme="http", host="example.com", port=80, path="",
+            request=HttpRequest(method="GET", path="/index"),
+            response=HttpResponse(code="200"))
+
+    def tearDown(self):
+        self.plugin_manager.close()
+        shutil.rmtree(self.plugin_dir)
+        super(TestPluginManager, self).tearDown()
+
+    def write_plugin(self, name, content):
+        path = os.path.join(self.plugin_dir, name)
+        with open(path, "w") as fp:
+            fp.write(content)
+        return path
+
+    def load_plugin(self, name, content):
+        self.plugin_manager.load_plugins([self.write_plugin(name, content)])
+        return self.plugin_manager.plugins[-1]
+
+    def test_no_plugins(self):
+        self.assertIs(
+            self.plugin_manager.exec_request(self.plugin_context).result(),
+            self.plugin_context)
+        self.assertIs(
+            self.plugin_manager.exec_response(self.plugin_context).result(),
+            self.plugin_context)
+
+    def test_dispatch_tables(self):
+        self.load_plugin("request_plugin.py", REQUEST_PLUGIN)
+        self.load_plugin("response_plugin.py", RESPONSE_PLUGIN)
+
+        self.assertEqual(len(self.plugin_manager.hooks["on_request"]), 1)
+        self.assertEqual(len(self.plugin_manager.hooks["on_response"]), 1)
+
+        context = self.plugin_manager.exec_request(self.plugin_context).result()
+        self.assertIs(context, self.plugin_context)
+        self.assertEqual(context.path, "/request")
+
+        context = self.plugin_manager.exec_response(context).result()
+        self.assertEqual(context.path, "/request/response")
+
+    def test_copy_context(self):
+        self.load_plugin("request_plugin.py", REQUEST_PLUGIN)
+        self.load_plugin("copy_plugin.py", COPY_PLUGIN)
+
+        context = self.plugin_manager.exec_request(self.plugin_context).result()
+        self.assertIsNot(context, self.plugin_context)
+        self.assertEqual(context.path, "/request/copy")
+        self.assertEqual(self.plugin_context.path, "/request")
+
+    def test_reload(self):
+        plugin = self.load_plugin("plugin.py", REQUEST_PLUGIN)
+        self.assertEqual(len(self.plugin_manager.hooks["on_response"]), 0)
+
+        with open(plugin.plugin_path, "w") as fp:
+            fp.write(RESPONSE_PLUGIN)
+        plugin._reload_plugin()
+
+        self.assertEqual(len(self.plugin_manager.hooks["on_request"]), 0)
+        context = self.plugin_manager.exec_response(self.plugin_context).result()
+        self.assertEqual(context.path, "/response")
+
+    def test_scoped_plugin(self):
+        self.load_plugin("scoped_plugin.py", SCOPED_PLUGIN)
+        self.load_plugin("request_plugin.py", REQUEST_PLUGIN)
+
+        request = HttpRequest(method="GET", path="/api/users")
+        hooks = self.plugin_manager.request_hooks("www.example.com", request)
+        self.assertEqual(len(hooks), 2)
+        self.assertEqual(len(self.plugin_manager.request_hooks("example.org", request)), 1)
+        self.assertEqual(len(self.plugin_manager.request_hooks(
+            "www.example.com", HttpRequest(path="/index"))), 1)
+
+        self.plugin_context.host = "www.example.com"
+        self.plugin_context.request = request
+        context = self.plugin_manager.exec_hooks(hooks, self.plugin_context).result()
+        self.assertEqual(context.path, "/scoped/request")
+
+    def test_invalid_match(self):
+        plugin = self.load_plugin("invalid_plugin.py", INVALID_MATCH_PLUGIN)
+
+        self.assertIsNone(plugin.matcher)
+        self.assertIsNone(plugin.get_hook("on_request"))
+        self.assertEqual(len(self.plugin_manager.hooks["on_request"]), 0)
+
+    @gen_test
+    def test_coroutine_hook(self):
+        self.load_plugin("coroutine_plugin.py", COROUTINE_PLUGIN)
+        self.load_plugin("request_plugin.py", REQUEST_PLUGIN)
+
+        future = self.plugin_manager.exec_request(self.plugin_context)
+        self.assertFalse(future.done())
+        context = yield future
+        self.assertEqual(context.path, "/coroutine/request")
+
+    @gen_test
+    def test_executor_hook(self):
+        self.load_plugin("executor_plugin.py", EXECUTOR_PLUGIN)
+
+        context = yield self.plugin_manager.exec_request(self.plugin_context)
+        self.assertIsNot(context, self.plugin_context)
+        self.assertNotEqual(context.path, "/MainThread")
+        self.assertEqual(self.plugin_context.path, "")
+
+    @mock.patch("microproxy.interceptor.plugin_manager._process_executor", None)
+    @gen_test(timeout=30)
+    def test_process_hook(self):
+        path = self.write_plugin("process_plugin.py", PROCESS_PLUGIN)
+        self.plugin_manager.process_executor = start_plugin_processes(
+            {"plugins": [path], "plugin_processes": 1})
+        self.load_plugin("process_plugin.py", PROCESS_PLUGIN)
+        self.load_plugin("request_plugin.py", REQUEST_PLUGIN)
+
+        context = yield self.plugin_manager.exec_request(self.plugin_context)
+        worker_pid, _ = context.path[1:].split("/")
+        self.assertNotEqual(int(worker_pid), os.getpid())
+        self.assertTrue(context.path.endswith("/request"))
+        self.assertEqual(self.plugin_context.path, "")
+
+    @gen_test
+    def test_process_hook_not_started(self):
+        self.load_plugin("process_plugin.py", PROCESS_PLUGIN)
+
+        with self.assertRaises(PluginError):
+            yield self.plugin_manager.exec_request(self.plugin_context)
+
+    @mock.patch("microproxy.interceptor.plugin_manager._process_executor", None)
+    def test_start_plugin_processes(self):
+        path = self.write_plugin("request_plugin.py", REQUEST_PLUGIN)
+        self.assertIsNone(start_plugin_processes({"plugins": [path]}))
+
+        sock = socket.socket()
+        self.addCleanup(sock.close)
+        path = self.write_plugin("process_plugin.py", PROCESS_PLUGIN)
+        executor = start_plugin_processes(
+            {"plugins": [path], "plugin_processes": 1}, [sock])
+        self.addCleanup(executor.shutdown)
+
+        self.assertIs(start_plugin_processes({"plugins": [path]}), executor)
+        # NOTE: the socket is closed in the worker process only.
+        with self.assertRaises(OSError):
+            executor.submit(os.fstat, sock.fileno()).result()
+        os.fstat(sock.fileno())
+
+    @mock.patch("microproxy.interceptor.plugin_manager._process_executor", None)
+    def test_start_plugin_processes_without_exec(self):
+        path = self.write_plugin("side_effect_plugin.py", "raise RuntimeError()\n")
+        self.assertIsNone(start_plugin_processes({"plugins": [path]}))
+
+        path = self.write_plugin(
+            "process_plugin.py", PROCESS_PLUGIN + "raise RuntimeError()\n")
+        executor = start_plugin_processes({"plugins": [path], "plugin_processes": 1})
+        self.addCleanup(executor.shutdown)
+        self.assertIsNotNone(executor)
+
+    @gen_test
+    def test_timeout_fail_closed(self):
+        self.load_plugin("slow_plugin.py", SLOW_PLUGIN)
+
+        with self.assertRaises(PluginError):
+            yield self.plugin_manager.exec_request(self.plugin_context)
+
+    @gen_test
+    def test_timeout_fail_open(self):
+        self.plugin_manager.fail_policy = "open"
+        self.load_plugin("slow_plugin.py", SLOW_PLUGIN)
+        self.load_plugin("request_plugin.py", REQUEST_PLUGIN)
+
+        context = yield self.plugin_manager.exec_request(self.plugin_context)
+        self.assertEqual(context.path, "/request")
+
+    @gen_test
+    def test_executor_timeout(self):
+        self.plugin_manager.fail_policy = "open"
+        self.load_plugin("slow_plugin.py", SLOW_EXECUTOR_PLUGIN)
+        self.load_plugin("request_plugin.py", REQUEST_PLUGIN)
+
+        context = yield self.plugin_manager.exec_request(self.plugin_context)
+        self.assertEqual(context.path, "/request")
+
+        yield gen.sleep(0.2)
+        self.assertEqual(context.path, "/request")
+        self.assertEqual(context.request.path, "/index")
+        self.assertEqual(self.plugin_context.request.path, "/index")
+
+    def test_plugin_fail_policy(self):
+        self.load_plugin("failing_plugin.py", FAILING_PLUGIN)
+        self.load_plugin("request_plugin.py", REQUEST_PLUGIN)
+
+        context = self.plugin_manager.exec_request(self.plugin_context).result()
+        self.assertEqual(context.path, "/request")
+
+    def test_invalid_fail_policy(self):
+        plugin = self.load_plugin("invalid_plugin.py", INVALID_FAIL_POLICY_PLUGIN)
+
+        self.assertIsNone(plugin.get_hook("on_request"))
+        self.assertEqual(len(self.plugin_manager.hooks["on_request"]), 0)
+
+    def test_get_hook(self):
+        plugin = self.load_plugin("request_plugin.py", REQUEST_PLUGIN)
+
+        self.assertIsNotNone(plugin.get_hook("on_request"))
+        self.assertIsNone(plugin.get_hook("on_response"))
+        with self.assertRaises(ValueError):
+            plugin.get_hook("on_connect")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+
+from microproxy.context import HttpHeaders
+from microproxy.interceptor.plugin_route import PluginMatcher, HookTable
+
+
+class TestPluginMatcher(unittest.TestCase):
+    def test_match_all(self):
+        matcher = PluginMatcher()
+        self.assertTrue(matcher.match_all)
+        self.assertIsNone(matcher.host_regex)
+        self.assertTrue(matcher.match("example.com", "/index", "GET", None))
+
+    def test_host(self):
+        matcher = PluginMatcher({"host": ["*.example.com", "example.org"]})
+
+        self.assertTrue(matcher.match("www.example.com", "/", "GET", None))
+        self.assertTrue(matcher.match("Example.ORG", "/", "GET", None))
+        self.assertFalse(matcher.match("example.com", "/", "GET", None))
+        self.assertFalse(matcher.match("example.org.evil.com", "/", "GET", None))
+        self.assertFalse(matcher.match("exampleXorg", "/", "GET", None))
+
+    def test_path(self):
+        matcher = PluginMatcher({"path": ["/api/", "/login"]})
+
+        self.assertTrue(matcher.match("example.com", "/api/users", "GET", None))
+        self.assertTrue(matcher.match("example.com", "/login?next=/", "GET", None))
+        self.assertFalse(matcher.match("example.com", "/index", "GET", None))
+
+    def test_method(self):
+        matcher = PluginMatcher({"method": "post"})
+
+        self.assertTrue(matcher.match("example.com", "/", "POST", None))
+        self.assertFalse(matcher.match("example.com", "/", "GET", None))
+
+    def test_content_type(self):
+        matcher = PluginMatcher({"content_type": ["application/json", "text/*"]})
+
+        self.assertTrue(matcher.match(
+            "example.com", "/", "GET",
+            HttpHeaders([("Content-Type", "application/json; charset=utf-8")])))
+        self.assertTrue(matcher.match(
+            "example.com", "/", "GET", HttpHeaders([("Content-Type", "text/html")])))
+        self.assertFalse(matcher.match(
+            "example.com", "/", "GET", HttpHeaders([("Content-Type", "image/png")])))
+        self.assertFalse(matcher.match("example.com", "/", "GET", HttpHeaders()))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            PluginMatcher(["example.com"])
+        with self.assertRaises(ValueError):
+            PluginMatcher({"hostname": "example.com"})
+
+
+class TestHookTable(unittest.TestCase):
+    def setUp(self):
+        self.example_hook = object()
+        self.api_hook = object()
+        self.all_hook = object()
+
+    def test_empty(self):
+        table = HookTable()
+        self.assertEqual(len(table), 0)
+        self.assertEqual(table.select("example.com", "/", "GET", None), [])
+
+    def test_unscoped(self):
+        table = HookTable([
+            (self.all_hook, False, PluginMatcher()),
+            (self.api_hook, True, PluginMatcher()),
+        ])
+        self.assertEqual(
+            table.select("example.com", "/", "GET", None),
+            [(self.all_hook, False), (self.api_hook, True)])
+
+    def test_select(self):
+        table = HookTable([
+            (self.example_hook, False, PluginMatcher({"host": "example.com"})),
+            (self.all_hook, True, PluginMatcher()),
+            (self.api_hook, False, PluginMatcher({"path": "/api/"})),
+        ])
+        self.assertIsNone(table.host_regex)
+        self.assertIsNone(table.unscoped_hooks)
+
+        self.assertEqual(
+            table.select("example.com", "/api/users", "GET", None),
+            [(self.example_hook, False), (self.all_hook, True), (self.api_hook, False)])
+        self.assertEqual(
+            table.select("example.org", "/index", "GET", None),
+            [(self.all_hook, True)])
+
+    def test_host_index(self):
+        table = HookTable([
+            (self.example_hook, False, PluginMatcher({"host": "example.com"})),
+            (self.api_hook, False, PluginMatcher({"host": "api.*", "path": "/v1/"})),
+        ])
+        self.assertIsNotNone(table.host_regex)
+
+        self.assertEqual(table.select("example.org", "/v1/users", "GET", None), [])
+        self.assertEqual(
+            table.select("api.example.org", "/v1/users", "GET", None),
+            [(self.api_hook, False)])
+        self.assertEqual(table.select("api.example.org", "/index", "GET", None), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
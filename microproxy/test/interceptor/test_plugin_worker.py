@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from microproxy.context import PluginContext
+from microproxy.interceptor import plugin_worker
+
+PLUGIN = """
+def on_request(plugin_context):
+    plugin_context.path += "/{0}"
+    return plugin_context
+"""
+
+
+class TestPluginWorker(unittest.TestCase):
+    def setUp(self):
+        self.plugin_dir = tempfile.mkdtemp()
+        self.plugin_path = os.path.join(self.plugin_dir, "plugin.py")
+
+    def tearDown(self):
+        plugin_worker._plugins.pop(self.plugin_path, None)
+        shutil.rmtree(self.plugin_dir)
+
+    def write_plugin(self, name, mtime):
+        with open(self.plugin_path, "w") as fp:
+            fp.write(PLUGIN.format(name))
+        os.utime(self.plugin_path, (mtime, mtime))
+
+    def run_hook(self):
+        plugin_context = PluginContext(
+            scheme="http", host="example.com", port=80, path="",
+            request=None, response=None)
+        return plugin_worker.run_hook(self.plugin_path, "on_request", plugin_context)
+
+    def test_run_hook(self):
+        self.write_plugin("first", 1000)
+
+        self.assertEqual(self.run_hook().path, "/first")
+        self.assertEqual(plugin_worker._plugins[self.plugin_path][0], 1000)
+
+    def test_reload_modified_plugin(self):
+        self.write_plugin("first", 1000)
+        self.assertEqual(self.run_hook().path, "/first")
+
+        self.write_plugin("second", 2000)
+        self.assertEqual(self.run_hook().path, "/second")
+
+
+if __name__ == "__main__":
+    unittest.main()
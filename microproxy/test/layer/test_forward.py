@@ -1,8 +1,10 @@
 import mock
+from tornado import gen
+from tornado.concurrent import Future
 from tornado.testing import gen_test
 
 from microproxy.test.utils import ProxyAsyncTestCase
-from microproxy.context import LayerContext
+from microproxy.context import LayerContext, ServerContext
 from microproxy.layer import ForwardLayer
 
 
@@ -32,6 +34,83 @@ class TestForwardLayer(ProxyAsyncTestCase):
         message = yield self.client_stream.read_until(b"\r\n")
         assert message == b"bbb\r\n"
 
+        self.assertEqual(self.forward_layer.request_bytes, 5)
+        self.assertEqual(self.forward_layer.response_bytes, 5)
+
+        self.client_stream.close()
+        self.server_stream.close()
+        self.context.src_stream.close()
+        self.context.dest_stream.close()
+
+    @gen_test
+    def test_forward_message_directly(self):
+        self.forward_layer = ForwardLayer(
+            ServerContext(config={"forward_relay": "direct"}), self.context)
+        forward_future = self.forward_layer.process_and_return_context()
+        self.assertTrue(self.context.src_stream.closed())
+        self.assertTrue(self.context.dest_stream.closed())
+
+        self.client_stream.write(b"aaa\r\n")
+        message = yield self.server_stream.read_until(b"\r\n")
+        assert message == b"aaa\r\n"
+
+        self.server_stream.write(b"bbbb\r\n")
+        message = yield self.client_stream.read_until(b"\r\n")
+        assert message == b"bbbb\r\n"
+
+        self.client_stream.close()
+        context = yield forward_future
+        self.assertIs(context, self.forward_layer.context)
+        self.assertEqual(self.forward_layer.request_bytes, 5)
+        self.assertEqual(self.forward_layer.response_bytes, 6)
+        self.server_stream.close()
+
+    @gen_test
+    def test_forward_message_directly_with_buffered_data(self):
+        self.client_stream.write(b"aaa\r\n")
+        message = yield self.context.src_stream.read_bytes(1)
+        self.context.src_stream._read_buffer.appendleft(message)
+        self.context.src_stream._read_buffer_size += 1
+
+        self.forward_layer = ForwardLayer(
+            ServerContext(config={"forward_relay": "direct"}), self.context)
+        self.assertFalse(self.forward_layer.can_relay_directly())
+        self.forward_layer.process_and_return_context()
+
+        message = yield self.server_stream.read_until(b"\r\n")
+        assert message == b"aaa\r\n"
+
+        self.client_stream.close()
+        self.server_stream.close()
+        self.context.src_stream.close()
+        self.context.dest_stream.close()
+
+    @gen_test
+    def test_pump_with_backpressure(self):
+        self.forward_layer = ForwardLayer(
+            ServerContext(config={"forward_high_water": 4,
+                                  "forward_low_water": 2}), self.context)
+        to_stream = mock.Mock()
+        to_stream.write_buffer_size.return_value = 10
+        drain_future = Future()
+        to_stream.wait_for_drain.return_value = drain_future
+        on_data = mock.Mock()
+
+        self.forward_layer.pump(self.context.src_stream, to_stream, on_data)
+        self.client_stream.write(b"aaa")
+        yield gen.sleep(0.05)
+        on_data.assert_called_once_with(b"aaa")
+        to_stream.wait_for_drain.assert_called_once_with(2)
+
+        self.client_stream.write(b"bbb")
+        yield gen.sleep(0.05)
+        on_data.assert_called_once_with(b"aaa")
+
+        to_stream.write_buffer_size.return_value = 0
+        drain_future.set_result(None)
+        yield gen.sleep(0.05)
+        on_data.assert_called_with(b"bbb")
+
         self.client_stream.close()
         self.server_stream.close()
         self.context.src_stream.close()
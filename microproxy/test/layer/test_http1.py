@@ -1,18 +1,19 @@
 import h11
 import mock
-from tornado.gen import coroutine, sleep
+from tornado.gen import coroutine, maybe_future, sleep
 from tornado.netutil import add_accept_handler
 from tornado.testing import gen_test, bind_unused_port
 from unittest import TestCase
 
 from microproxy.context import (
     HttpRequest, HttpResponse, HttpHeaders,
-    LayerContext, ServerContext
+    LayerContext, ServerContext, TlsInfo
 )
 from microproxy.exception import SrcStreamClosedError, DestStreamClosedError
 from microproxy.layer import Http1Layer
 from microproxy.layer.application.http1 import (
     parse_proxy_path, parse_tunnel_proxy_path)
+from microproxy.pool import ConnectionPool
 from microproxy.protocol.http1 import Connection
 from microproxy.tornado_ext.iostream import MicroProxyIOStream
 from microproxy.test.utils import ProxyAsyncTestCase
@@ -62,6 +63,11 @@ class TestHtt1(TestCase):
             parse_tunnel_proxy_path("example.com:443"),
             ("https", "example.com", 443))
 
+    def test_parse_tunnel_proxy_path_https_port(self):
+        self.assertEqual(
+            parse_tunnel_proxy_path("example.com:8443", [8443]),
+            ("https", "example.com", 8443))
+
     def test_parse_tunnel_proxy_path_without_port(self):
         with self.assertRaises(ValueError):
             parse_tunnel_proxy_path("example.com")
@@ -83,8 +89,8 @@ class TestHttp1Layer(ProxyAsyncTestCase):
             config={},
             interceptor=mock.Mock(**{
                 "publish.return_value": None,
-                "request.return_value": None,
-                "response.return_value": None,
+                "request.return_value": maybe_future(None),
+                "response.return_value": maybe_future(None),
             })
         )
 
@@ -352,6 +358,91 @@ class TestHttp1Layer(ProxyAsyncTestCase):
         with self.assertRaises(SrcStreamClosedError):
             yield http_layer_future
 
+    @gen_test
+    def test_stream_resp(self):
+        self.http_layer.stream_body = True
+        self.http_layer.stream_preview_size = 3
+        self.http_layer.dest_conn.on_response_headers = self.http_layer.on_response_headers
+
+        http_layer_future = self.http_layer.process_and_return_context()
+        self.client_conn.send_request(HttpRequest(
+            version="HTTP/1.1", method="GET", path="/index",
+            headers=[("Host", "localhost")]))
+
+        yield self.read_until_new_event(self.server_conn, self.dest_events)
+        self.server_conn.send_response_headers(HttpResponse(
+            version="HTTP/1.1", code="200", reason="OK",
+            headers=[("Content-Type", "plain/text"), ("Content-Length", "8")]))
+        self.server_conn.send_data(b"body")
+
+        yield self.client_stream.read_until(b"\r\n\r\n")
+        body = yield self.client_stream.read_bytes(4)
+        self.assertEqual(body, b"body")
+        self.assertFalse(self.http_layer.interceptor.publish.called)
+        self.http_layer.interceptor.response.assert_called_once_with(
+            layer_context=self.http_layer.context,
+            request=self.http_layer.req, response=mock.ANY)
+
+        self.server_conn.send_data(b"body")
+        self.server_conn.send_end_of_message()
+        body = yield self.client_stream.read_bytes(4)
+        self.assertEqual(body, b"body")
+
+        yield sleep(0.1)
+        self.assertTrue(self.http_layer.interceptor.publish.called)
+        response = self.http_layer.interceptor.publish.call_args[1]["response"]
+        self.assertEqual(response.code, "200")
+        self.assertEqual(response.body, b"bod")
+        self.assertEqual(
+            self.http_layer.interceptor.publish.call_args[1]["response_body_length"], 8)
+        timing = self.http_layer.interceptor.publish.call_args[1]["timing"]
+        self.assertEqual(sorted(timing), ["request", "response", "response_start"])
+        self.assertTrue(timing["request"] <= timing["response_start"] <= timing["response"])
+        self.assertTrue(http_layer_future.running())
+
+        self.client_stream.close()
+        self.server_stream.close()
+        self.http_layer.src_stream.close()
+        self.http_layer.dest_stream.close()
+        yield http_layer_future
+
+    @mock.patch("microproxy.layer.application.http1.refresh_session")
+    def test_release_tls_stream_by_sni(self, mock_refresh_session):
+        dest_pool = mock.Mock()
+        self.http_layer.server_state.dest_pool = dest_pool
+        self.http_layer.context.host = "10.0.0.1"
+        self.http_layer.context.port = 443
+        self.http_layer.context.server_tls = TlsInfo(sni=u"example.com", alpn="http/1.1")
+
+        self.http_layer.release_dest_stream()
+
+        mock_refresh_session.assert_called_once_with(self.http_layer.dest_stream)
+        dest_pool.key.assert_called_once_with(u"example.com", 443, True, "http/1.1")
+        dest_pool.release.assert_called_once_with(
+            dest_pool.key.return_value, self.http_layer.dest_stream)
+
+    @gen_test
+    def test_stream_resp_dest_closed(self):
+        self.http_layer.stream_body = True
+        self.http_layer.dest_conn.on_response_headers = self.http_layer.on_response_headers
+
+        http_layer_future = self.http_layer.process_and_return_context()
+        self.client_conn.send_request(HttpRequest(
+            version="HTTP/1.1", method="GET", path="/index",
+            headers=[("Host", "localhost")]))
+
+        yield self.read_until_new_event(self.server_conn, self.dest_events)
+        self.server_conn.send_response_headers(HttpResponse(
+            version="HTTP/1.1", code="200", reason="OK",
+            headers=[("Content-Type", "plain/text"), ("Content-Length", "8")]))
+        yield self.server_stream.write(b"body")
+        self.server_stream.close()
+
+        with self.assertRaises(DestStreamClosedError):
+            yield http_layer_future
+        self.assertTrue(self.http_layer.src_stream.closed())
+        self.assertFalse(self.http_layer.interceptor.publish.called)
+
     def tearDown(self):
         self.client_stream.close()
         self.server_stream.close()
@@ -377,8 +468,8 @@ class TestHttp1LayerProxying(ProxyAsyncTestCase):
             config={},
             interceptor=mock.Mock(**{
                 "publish.return_value": None,
-                "request.return_value": None,
-                "response.return_value": None,
+                "request.return_value": maybe_future(None),
+                "response.return_value": maybe_future(None),
             })
         )
 
@@ -465,6 +556,36 @@ class TestHttp1LayerProxying(ProxyAsyncTestCase):
         self.http_layer.dest_stream.close()
         yield http_layer_future
 
+    @gen_test
+    def test_proxy_release_to_pool(self):
+        dest_pool = ConnectionPool(io_loop=self.io_loop)
+        self.http_layer.server_state.dest_pool = dest_pool
+
+        http_layer_future = self.http_layer.process_and_return_context()
+        path = "http://127.0.0.1:{0}/".format(self.port)
+        self.client_conn.send_request(HttpRequest(
+            version="HTTP/1.1", method="GET", path=path,
+            headers=[("Host", "localhost")]))
+
+        yield self.wait_for_server_connect()
+        yield self.read_until_new_event(self.server_conn, self.dest_events)
+        self.server_conn.send_response(HttpResponse(
+            version="HTTP/1.1", code="200", reason="OK",
+            headers=[("Content-Type", "plain/text")], body="body"))
+
+        yield self.read_until_new_event(self.client_conn, self.src_events)
+        dest_stream = self.http_layer.dest_stream
+
+        self.client_stream.close()
+        yield http_layer_future
+
+        self.assertFalse(dest_stream.closed())
+        self.assertIs(
+            dest_pool.acquire(ConnectionPool.key("127.0.0.1", self.port)),
+            dest_stream)
+        dest_stream.close()
+        self.server_stream.close()
+
     @gen_test
     def test_proxy_reuse_connection(self):
         http_layer_future = self.http_layer.process_and_return_context()
@@ -601,6 +722,26 @@ class TestHttp1LayerProxying(ProxyAsyncTestCase):
 
         yield http_layer_future
 
+    @gen_test
+    def test_tunnel_to_idle_tls_stream(self):
+        dest_pool = mock.Mock(**{"has_idle.return_value": True})
+        self.http_layer.server_state.dest_pool = dest_pool
+
+        http_layer_future = self.http_layer.process_and_return_context()
+        self.client_conn.send_request(HttpRequest(
+            version="HTTP/1.1", method="CONNECT", path="example.com:443",
+            headers=[("Host", "example.com:443")]))
+
+        context = yield http_layer_future
+        dest_pool.key.assert_called_once_with("example.com", 443, True, "http/1.1")
+        self.assertIsNone(context.dest_stream)
+        self.assertEqual((context.scheme, context.host, context.port),
+                         ("https", "example.com", 443))
+        yield self.read_until_new_event(self.client_conn, self.src_events)
+        response, = self.src_events.pop()
+        self.assertEqual(response.code, "200")
+        self.assertIsNone(self.server_stream)
+
     def tearDown(self):
         self.client_stream.close()
         if self.server_stream:
@@ -1,10 +1,13 @@
 import mock
+from h2.errors import INTERNAL_ERROR
 
+from tornado.concurrent import Future
 from tornado.testing import gen_test
-from tornado.gen import coroutine
+from tornado.gen import coroutine, maybe_future
 
 from microproxy.test.utils import ProxyAsyncTestCase
-from microproxy.context import LayerContext, ServerContext
+from microproxy.context import LayerContext, ServerContext, PluginContext
+from microproxy.exception import PluginError
 from microproxy.layer import Http2Layer
 from microproxy.protocol.http2 import Connection
 from microproxy.context import HttpRequest, HttpResponse, HttpHeaders
@@ -26,8 +29,8 @@ class TestHttp2Layer(ProxyAsyncTestCase):
             config={},
             interceptor=mock.Mock(**{
                 "publish.return_value": None,
-                "request.return_value": None,
-                "response.return_value": None,
+                "request.return_value": maybe_future(None),
+                "response.return_value": maybe_future(None),
             })
         )
 
@@ -330,6 +333,77 @@ class TestHttp2Layer(ProxyAsyncTestCase):
         self.assertEqual(len(self.dest_events), 3)  # NOTE: req, reset, req
         self.assertEqual(self.dest_events[1], (1, 0))
 
+    @gen_test
+    def test_async_plugin(self):
+        self.client_conn = Connection(
+            self.client_stream, client_side=True,
+            on_unhandled=self.ignore_event)
+        self.server_conn = Connection(
+            self.server_stream, client_side=False,
+            on_request=self.record_dest_event,
+            on_unhandled=self.ignore_event)
+        pending_result = Future()
+        self.http_layer.interceptor.request.side_effect = [
+            pending_result, maybe_future(None)]
+
+        result_future = self.http_layer.process_and_return_context()
+        self.client_conn.initiate_connection()
+        self.server_conn.initiate_connection()
+
+        self.client_conn.send_request(
+            1, HttpRequest(headers=[(":method", "GET"), (":path", "/slow")]))
+        self.client_conn.send_request(
+            3, HttpRequest(headers=[(":method", "GET"), (":path", "/fast")]))
+        yield self.read_until_new_event(self.server_conn, self.dest_events)
+
+        pending_result.set_result(PluginContext(
+            scheme="https", host="example.com", port=443, path="/modified",
+            request=HttpRequest(headers=[(":method", "GET"), (":path", "/modified")]),
+            response=None))
+        yield self.read_until_new_event(self.server_conn, self.dest_events)
+
+        self.client_stream.close()
+        self.server_stream.close()
+        yield result_future
+
+        self.assertEqual(len(self.dest_events), 2)
+        stream_id, request, _ = self.dest_events[0]
+        self.assertEqual(stream_id, 1)
+        self.assertEqual(request.path, "/fast")
+        stream_id, request, _ = self.dest_events[1]
+        self.assertEqual(stream_id, 3)
+        self.assertEqual(request.path, "/modified")
+
+    @gen_test
+    def test_plugin_error(self):
+        self.client_conn = Connection(
+            self.client_stream, client_side=True,
+            on_reset=self.record_src_event,
+            on_unhandled=self.ignore_event)
+        self.server_conn = Connection(
+            self.server_stream, client_side=False,
+            on_request=self.record_dest_event,
+            on_unhandled=self.ignore_event)
+        pending_result = Future()
+        self.http_layer.interceptor.request.return_value = pending_result
+
+        result_future = self.http_layer.process_and_return_context()
+        self.client_conn.initiate_connection()
+        self.server_conn.initiate_connection()
+
+        self.client_conn.send_request(
+            1, HttpRequest(headers=[(":method", "GET"), (":path", "/")]))
+        pending_result.set_exception(PluginError("plugin.py", RuntimeError()))
+        yield self.read_until_new_event(self.client_conn, self.src_events)
+
+        self.client_stream.close()
+        self.server_stream.close()
+        yield result_future
+
+        self.assertEqual(self.src_events, [(1, INTERNAL_ERROR)])
+        self.assertEqual(self.dest_events, [])
+        self.assertEqual(self.http_layer.streams, {})
+
     @gen_test
     def test_src_send_terminate(self):
         self.client_conn = Connection(
@@ -459,6 +533,86 @@ class TestHttp2Layer(ProxyAsyncTestCase):
                          (":path", "/"),
                          ("aaa", "bbb")]))
 
+    @gen_test
+    def test_stream_req_and_resp(self):
+        self.http_layer = Http2Layer(
+            ServerContext(
+                config={"stream_body": True, "stream_preview_size": 2},
+                interceptor=self.http_layer.interceptor),
+            self.http_layer.context)
+
+        self.client_conn = Connection(
+            self.client_stream, client_side=True,
+            on_response_headers=self.record_src_event,
+            on_data=self.record_src_event,
+            on_end_stream=self.record_src_event,
+            on_unhandled=self.ignore_event)
+        self.server_conn = Connection(
+            self.server_stream, client_side=False,
+            on_request_headers=self.record_dest_event,
+            on_data=self.record_dest_event,
+            on_end_stream=self.record_dest_event,
+            on_unhandled=self.ignore_event)
+
+        result_future = self.http_layer.process_and_return_context()
+        self.client_conn.initiate_connection()
+        self.server_conn.initiate_connection()
+
+        self.client_conn.send_request_headers(
+            1, HttpRequest(headers=[
+                (":method", "POST"),
+                (":path", "/"),
+                ("aaa", "bbb")]), False)
+        yield self.read_until_new_event(self.server_conn, self.dest_events)
+        stream_id, request, _, stream_ended = self.dest_events.pop()
+        self.assertEqual(stream_id, 1)
+        self.assertEqual(request.method, "POST")
+        self.assertFalse(stream_ended)
+
+        self.client_conn.send_data_frame(1, b"req")
+        yield self.read_until_new_event(self.server_conn, self.dest_events)
+        self.assertEqual(self.dest_events.pop(), (1, b"req", 3))
+        self.server_conn.acknowledge_data(1, 3)
+
+        self.client_conn.send_end_stream(1)
+        yield self.read_until_new_event(self.server_conn, self.dest_events)
+        self.assertEqual(self.dest_events[-1], (1, ))
+
+        self.server_conn.send_response_headers(
+            1, HttpResponse(headers=[(":status", "200"), ("aaa", "bbb")]), False)
+        yield self.read_until_new_event(self.client_conn, self.src_events)
+        stream_id, response, stream_ended = self.src_events.pop()
+        self.assertEqual(stream_id, 1)
+        self.assertEqual(response.code, "200")
+        self.assertFalse(stream_ended)
+
+        self.server_conn.send_data_frame(1, b"ccc")
+        yield self.read_until_new_event(self.client_conn, self.src_events)
+        self.assertEqual(self.src_events.pop(), (1, b"ccc", 3))
+        self.assertFalse(self.http_layer.interceptor.publish.called)
+
+        # NOTE: credit is only returned to dest after the data was written to src
+        self.assertEqual(self.server_conn.local_flow_control_window(1), 65532)
+        yield self.server_conn.read_bytes()
+        self.assertEqual(self.server_conn.local_flow_control_window(1), 65535)
+
+        self.server_conn.send_end_stream(1)
+        yield self.read_until_new_event(self.client_conn, self.src_events)
+        self.assertEqual(self.src_events[-1], (1, ))
+
+        self.assertTrue(self.http_layer.interceptor.publish.called)
+        _, kwargs = self.http_layer.interceptor.publish.call_args
+        self.assertEqual(kwargs["request"].body, b"re")
+        self.assertEqual(kwargs["response"].body, b"cc")
+        self.assertEqual(kwargs["request_body_length"], 3)
+        self.assertEqual(kwargs["response_body_length"], 3)
+        self.assertEqual(
+            sorted(kwargs["timing"]), ["request", "response", "response_start"])
+
+        self.client_stream.close()
+        self.server_stream.close()
+        yield result_future
+
     def tearDown(self):
         self.client_stream.close()
         self.server_stream.close()
@@ -3,6 +3,7 @@ import sys
 from mock import Mock
 
 from tornado import gen, iostream
+from microproxy import metrics
 from microproxy.context import LayerContext, ServerContext
 from microproxy.exception import (
     DestStreamClosedError, SrcStreamClosedError, DestNotConnectedError
@@ -49,6 +50,12 @@ class TestLayerManager(unittest.TestCase):
         context = LayerContext(mode="replay", port=443)
         layer = layer_manager.get_first_layer(context)
         self.assertIsInstance(layer, ReplayLayer)
+        self.assertFalse(layer.insecure)
+
+        layer = layer_manager.get_first_layer(
+            context, config=dict(insecure=True, client_certs="ca.pem"))
+        self.assertTrue(layer.insecure)
+        self.assertEqual(layer.trusted_ca_certs, "ca.pem")
 
     def test_get_tls_layer_from_socks(self):
         context = LayerContext(mode="socks", port=443)
@@ -146,6 +153,17 @@ class TestLayerManager(unittest.TestCase):
         layer_manager._handle_layer_error(iostream.StreamClosedError("stream closed"), context)
         context.src_stream.close.assert_called_once_with()
 
+    def test_layer_error_metrics(self):
+        context = LayerContext(
+            mode="socks", src_stream=Mock(), port=443, scheme="h2")
+        errors_total = metrics.registry.counter(
+            "microproxy_layer_errors_total", "", ["layer", "error"])
+        before = errors_total.get(("LayerContext", "TimeoutError"))
+
+        layer_manager._handle_layer_error(gen.TimeoutError("timeout"), context)
+        self.assertEqual(
+            errors_total.get(("LayerContext", "TimeoutError")), before + 1)
+
     def test_handle_unhandled_layer_error(self):
         context = LayerContext(
             mode="socks", src_stream=Mock(), port=443, scheme="h2")
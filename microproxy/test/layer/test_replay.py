@@ -3,6 +3,7 @@ from tornado.testing import AsyncTestCase, gen_test
 from tornado.concurrent import Future
 
 from microproxy.layer.proxy.replay import ReplayLayer
+from microproxy.protocol import tls
 
 
 class TestReplayLayer(AsyncTestCase):
@@ -19,6 +20,12 @@ class TestReplayLayer(AsyncTestCase):
         self.context.host = "localhost"
         self.context.port = 8080
 
+        patcher = mock.patch("microproxy.protocol.tls.session_reused",
+                             return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(tls.dest_session_cache.clear)
+
     def _create_future(self, result):
         future = Future()
         future.set_result(result)
@@ -1,15 +1,18 @@
 import errno
+import socket
+import struct
 from mock import Mock
 
 from ipaddress import IPv4Address
-from tornado.gen import TimeoutError
+from tornado.gen import TimeoutError, maybe_future
 from tornado.testing import gen_test, bind_unused_port
 from tornado.iostream import StreamClosedError
 from tornado.netutil import add_accept_handler
 
 from microproxy.test.utils import ProxyAsyncTestCase
-from microproxy.context import LayerContext
-from microproxy.layer import SocksLayer
+from microproxy.context import LayerContext, ServerContext
+from microproxy.layer import SocksLayer, TlsLayer
+from microproxy.pool import ConnectionPool
 from microproxy.exception import ProtocolError, DestNotConnectedError, SrcStreamClosedError
 from microproxy.tornado_ext.iostream import MicroProxyIOStream
 
@@ -272,6 +275,75 @@ class TestSocksProxyHandler(ProxyAsyncTestCase):
         self.assertEqual(context.port, self.port)
         self.assertIsNotNone(context.dest_stream)
 
+    @gen_test
+    def test_process_and_return_context_with_pooled_tls_stream(self):
+        pooled_stream, pooled_server_stream = yield self.create_iostream_pair()
+        self.addCleanup(pooled_server_stream.close)
+        self.addCleanup(pooled_stream.close)
+        dest_pool = ConnectionPool(io_loop=self.io_loop)
+        dest_pool.release(
+            dest_pool.key(u"www.google.com", self.port, True, "http/1.1"), pooled_stream)
+        self.layer.dest_pool = dest_pool
+        self.layer.https_ports = [self.port]
+
+        client_socks_conn = Connection(our_role="client")
+        client_socks_conn.initiate_connection()
+        result_future = self.layer.process_and_return_context()
+        data = client_socks_conn.send(GreetingRequest([AUTH_TYPE["NO_AUTH"]]))
+        yield self.client_stream.write(data)
+        data = yield self.client_stream.read_bytes(1024, partial=True)
+        client_socks_conn.recv(data)
+
+        data = client_socks_conn.send(Request(
+            REQ_COMMAND["CONNECT"], ADDR_TYPE["IPV4"],
+            u"127.0.0.1", self.port))
+        yield self.client_stream.write(data)
+        data = yield self.client_stream.read_bytes(1024, partial=True)
+        event = client_socks_conn.recv(data)
+
+        self.assertEqual(event.status, RESP_STATUS["SUCCESS"])
+        context = yield result_future
+        self.assertEqual(context.host, "127.0.0.1")
+        self.assertIsNone(context.dest_stream)
+
+        # NOTE: the tls layer finds the pooled stream by the sni of the client hello.
+        with open("./microproxy/test/protocol/client_hello.bin", "rb") as fp:
+            raw_client_hello = fp.read()
+        yield self.client_stream.write(
+            b"\x16\x03\x01" + struct.pack("!H", len(raw_client_hello)) + raw_client_hello)
+        tls_layer = TlsLayer(ServerContext(config={}, dest_pool=dest_pool), context)
+        tls_layer.start_src_tls = Mock(return_value=maybe_future(Mock()))
+        tls_layer.create_dest_stream = Mock()
+
+        context = yield tls_layer.process_and_return_context()
+        self.assertIs(context.dest_stream, pooled_stream)
+        self.assertEqual(context.host, "www.google.com")
+        tls_layer.create_dest_stream.assert_not_called()
+        self.assertFalse(hasattr(self, "dest_server_stream"))
+
+    @gen_test
+    def test_process_and_return_context_with_ipv4(self):
+        client_socks_conn = Connection(our_role="client")
+        client_socks_conn.initiate_connection()
+        result_future = self.layer.process_and_return_context()
+        data = client_socks_conn.send(GreetingRequest([AUTH_TYPE["NO_AUTH"]]))
+        yield self.client_stream.write(data)
+        data = yield self.client_stream.read_bytes(1024, partial=True)
+        client_socks_conn.recv(data)
+
+        data = client_socks_conn.send(Request(
+            REQ_COMMAND["CONNECT"], ADDR_TYPE["IPV4"],
+            u"127.0.0.1", self.port))
+        yield self.client_stream.write(data)
+        data = yield self.client_stream.read_bytes(1024, partial=True)
+        client_socks_conn.recv(data)
+
+        context = yield result_future
+        self.assertEqual(context.host, "127.0.0.1")
+        self.assertIsInstance(context.host, str)
+        self.assertTrue(context.dest_stream.socket.getsockopt(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY))
+
     @gen_test
     def test_process_with_src_stream_closed(self):
         result_future = self.layer.process_and_return_context()
@@ -1,9 +1,11 @@
 import mock
+import struct
 import unittest
 
 from OpenSSL import SSL
 from service_identity import VerificationError
 from tornado.iostream import StreamClosedError
+from tornado import gen
 from tornado.testing import gen_test
 
 from microproxy.test.utils import ProxyAsyncTestCase
@@ -26,6 +28,7 @@ def create_src_sslcontext(cert, priv_key, alpn_callback):
 
     return ssl_ctx
 
+
 class TestTlsLayer(ProxyAsyncTestCase):
     def setUp(self):
         super(TestTlsLayer, self).setUp()
@@ -149,6 +152,62 @@ class TestTlsLayer(ProxyAsyncTestCase):
         with self.assertRaises(DestStreamClosedError):
             dest_stream, alpn = yield ctx_future
 
+    def _client_hello_record(self):
+        with open("./microproxy/test/protocol/client_hello.bin", "rb") as fp:
+            raw_client_hello = fp.read()
+        record = b"\x16\x03\x01" + struct.pack("!H", len(raw_client_hello))
+        return raw_client_hello, record + raw_client_hello
+
+    @gen_test
+    def test_process_with_deferred_dest_stream(self):
+        _, record = self._client_hello_record()
+        self.client_stream.write(record)
+        dest_stream = self.tls_layer.dest_stream
+        self.tls_layer.dest_stream = None
+        dest_tls_stream, src_tls_stream = mock.Mock(), mock.Mock()
+        self.tls_layer.create_dest_stream = mock.Mock(
+            return_value=gen.maybe_future(dest_stream))
+        self.tls_layer.start_dest_tls = mock.Mock(
+            return_value=gen.maybe_future((dest_tls_stream, b"http/1.1")))
+        self.tls_layer.start_src_tls = mock.Mock(
+            return_value=gen.maybe_future(src_tls_stream))
+
+        context = yield self.tls_layer.process_and_return_context()
+
+        self.tls_layer.create_dest_stream.assert_called_once_with(("127.0.0.1", "443"))
+        self.assertIs(self.tls_layer.dest_conn.stream, dest_stream)
+        self.assertIs(context.dest_stream, dest_tls_stream)
+        self.assertIs(context.src_stream, src_tls_stream)
+        dest_stream.close()
+
+    @gen_test
+    def test_peek_client_hello(self):
+        raw_client_hello, record = self._client_hello_record()
+        self.client_stream.write(record[:10])
+        client_hello_future = self.tls_layer.peek_client_hello()
+        yield gen.sleep(0.05)
+        self.assertFalse(client_hello_future.done())
+
+        self.client_stream.write(record[10:])
+        client_hello = yield client_hello_future
+        self.assertEqual(client_hello, raw_client_hello)
+
+    @gen_test
+    def test_peek_client_hello_timeout(self):
+        self.config.update(dict(client_hello_timeout=0.05))
+        raw_client_hello, record = self._client_hello_record()
+        self.client_stream.write(record[:10])
+
+        with self.assertRaises(gen.TimeoutError):
+            yield self.tls_layer.peek_client_hello()
+
+    @gen_test
+    def test_peek_client_hello_not_tls(self):
+        self.client_stream.write(b"GET / HTTP/1.1\r\n\r\n")
+
+        with self.assertRaises(ProtocolError):
+            yield self.tls_layer.peek_client_hello()
+
     def tearDown(self):
         if self.client_stream and not self.client_stream.closed():
             self.client_stream.close()
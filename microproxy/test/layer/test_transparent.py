@@ -35,3 +35,14 @@ class TestTransparentLayer(AsyncTestCase):
         self.assertEqual(context.host, "localhost")
         self.assertEqual(context.port, 8080)
         self.create_dest_stream.assert_called_with(("localhost", 8080))
+
+    @gen_test
+    def test_run_layer_with_https_port_and_pool(self):
+        self.layer.dest_pool = mock.Mock()
+        self.layer.https_ports = [8080]
+        context = yield self.layer.process_and_return_context()
+
+        self.assertIsNone(context.dest_stream)
+        self.assertEqual(context.host, "localhost")
+        self.assertEqual(context.port, 8080)
+        self.create_dest_stream.assert_not_called()
@@ -65,6 +65,42 @@ class TestConnection(ProxyAsyncTestCase):
         self.assertEqual(self.response.version, "HTTP/1.1")
         self.assertEqual(self.response.body, b"A")
 
+    @gen_test
+    def test_on_streaming_response(self):
+        data_chunks = []
+        end_of_message = []
+
+        server_conn = Connection(h11.SERVER, self.server_stream)
+        server_conn.send_response_headers(HttpResponse(
+            version="HTTP/1.1", code="200", reason="OK",
+            headers=[("Host", "localhost"),
+                     ("Content-Length", "2")]))
+        server_conn.send_data(b"A")
+
+        client_conn = Connection(
+            h11.CLIENT, self.client_stream,
+            on_response=self.on_response,
+            on_response_headers=self.on_response,
+            on_data=data_chunks.append,
+            on_end_of_message=lambda: end_of_message.append(True))
+        yield client_conn.read_bytes()
+
+        self.assertIsNotNone(self.response)
+        self.assertEqual(self.response.headers,
+                         HttpHeaders([("host", "localhost"),
+                                      ("content-length", "2")]))
+        self.assertEqual(self.response.code, "200")
+        self.assertEqual(self.response.body, b"")
+        self.assertEqual(data_chunks, [b"A"])
+        self.assertEqual(end_of_message, [])
+
+        server_conn.send_data(b"B")
+        server_conn.send_end_of_message()
+        yield client_conn.read_bytes()
+
+        self.assertEqual(data_chunks, [b"A", b"B"])
+        self.assertEqual(end_of_message, [True])
+
     @gen_test
     def test_on_info_response(self):
         client_conn = Connection(
@@ -117,6 +117,54 @@ class TestConnection(ProxyAsyncTestCase):
         self.assertEqual(response.code, "200")
         self.assertEqual(response.version, "HTTP/2")
 
+    @gen_test
+    def test_on_streaming_response(self):
+        events = []
+
+        def record(*args):
+            events.append(args)
+
+        client_conn = Connection(
+            self.client_stream, client_side=True,
+            on_response_headers=record, on_data=record,
+            on_end_stream=record)
+        client_conn.initiate_connection()
+        client_conn.send_request(
+            1, HttpRequest(headers=[
+                (":method", "GET"),
+                (":path", "/"),
+                ("aaa", "bbb")]))
+
+        server_conn = Connection(
+            self.server_stream, client_side=False,
+            on_request=self.on_request)
+        server_conn.initiate_connection()
+        yield server_conn.read_bytes()
+        server_conn.send_response_headers(
+            1, HttpResponse(headers=[(":status", "200")]), False)
+        server_conn.send_data_frame(1, b"aaa")
+
+        while len(events) < 2:
+            yield client_conn.read_bytes()
+
+        stream_id, response, stream_ended = events[0]
+        self.assertEqual(stream_id, 1)
+        self.assertEqual(response.code, "200")
+        self.assertEqual(response.body, b"")
+        self.assertFalse(stream_ended)
+        self.assertEqual(events[1], (1, b"aaa", 3))
+        self.assertEqual(server_conn.local_flow_control_window(1), 65532)
+
+        client_conn.acknowledge_data(1, 3)
+        server_conn.send_end_stream(1)
+        while len(events) < 4:
+            yield client_conn.read_bytes()
+        self.assertEqual(events[2], (1, b"", 0))
+        self.assertEqual(events[3], (1, ))
+
+        yield server_conn.read_bytes()
+        self.assertEqual(server_conn.outbound_flow_control_window, 65535)
+
     @gen_test
     def test_on_settings(self):
         client_conn = Connection(
@@ -156,6 +204,21 @@ class TestConnection(ProxyAsyncTestCase):
         self.assertIsNotNone(self.window_updates)
         self.assertEqual(self.window_updates, (0, 100))
 
+    def test_send_window_updates_closed_stream(self):
+        client_conn = Connection(
+            self.client_stream, client_side=True, on_unhandled=mock.Mock())
+        client_conn.initiate_connection()
+        stream_id = client_conn.get_next_available_stream_id()
+        client_conn.send_request(
+            stream_id,
+            HttpRequest(headers=[
+                (":method", "GET"),
+                (":path", "/")]))
+        client_conn.send_reset(stream_id, 0)
+
+        client_conn.send_window_updates(stream_id, 100)
+        client_conn.send_window_updates(0, 100)
+
     @gen_test
     def test_on_priority_updates(self):
         client_conn = Connection(
@@ -1,4 +1,4 @@
-# import mock
+import mock
 import socket
 import unittest
 
@@ -12,7 +12,8 @@ from microproxy.tornado_ext.iostream import MicroProxySSLIOStream
 from microproxy.protocol.tls import (
     TlsClientHello,
     ClientConnection, ServerConnection, create_dest_sslcontext,
-    create_src_sslcontext)
+    create_src_sslcontext, get_dest_sslcontext, get_src_sslcontext,
+    SSLContextCache, TlsSessionCache, dest_session_cache)
 from microproxy.utils import HAS_ALPN
 
 
@@ -30,6 +31,78 @@ class TestTlsClientHello(unittest.TestCase):
         self.assertIsNone(self.client_hello.alpn_protocols)
 
 
+class TestSSLContextCache(unittest.TestCase):
+    def setUp(self):
+        self.cert_store = CertStore(dict(certfile="microproxy/test/test.crt",
+                                         keyfile="microproxy/test/test.key"))
+
+    def test_get(self):
+        cache = SSLContextCache(2)
+        ctx = cache.get("a", lambda: "ctx-a")
+        self.assertEqual(ctx, "ctx-a")
+        self.assertEqual(cache.get("a", lambda: "new-ctx-a"), "ctx-a")
+
+        cache.get("b", lambda: "ctx-b")
+        cache.get("a", lambda: "new-ctx-a")
+        cache.get("c", lambda: "ctx-c")
+        self.assertEqual(list(cache.contexts), ["a", "c"])
+
+    def test_get_dest_sslcontext(self):
+        ctx = get_dest_sslcontext(insecure=True, alpn=[b"h2"])
+        self.assertIsInstance(ctx, SSL.Context)
+        self.assertIs(ctx, get_dest_sslcontext(insecure=True, alpn=[b"h2"]))
+        self.assertIsNot(ctx, get_dest_sslcontext(insecure=True))
+        self.assertIsNot(ctx, get_dest_sslcontext(
+            insecure=False, trusted_ca_certs="microproxy/test/test.crt", alpn=[b"h2"]))
+
+    def test_get_src_sslcontext(self):
+        cert, pkey = self.cert_store.get_cert_and_pkey("www.abc.com")
+        ctx = get_src_sslcontext(cert, pkey, "http/1.1")
+        self.assertIsInstance(ctx, SSL.Context)
+        self.assertIs(ctx, get_src_sslcontext(cert, pkey, "http/1.1"))
+        self.assertIsNot(ctx, get_src_sslcontext(cert, pkey, "h2"))
+
+        other_cert, _ = self.cert_store.get_cert_and_pkey("www.def.com")
+        self.assertIsNot(ctx, get_src_sslcontext(other_cert, pkey, "http/1.1"))
+
+
+class TestTlsSessionCache(unittest.TestCase):
+    def test_get_and_set(self):
+        cache = TlsSessionCache(2)
+        self.assertIsNone(cache.get("a"))
+
+        cache.set("a", "session-a")
+        self.assertEqual(cache.get("a"), "session-a")
+
+        cache.set("b", "session-b")
+        cache.set("a", "session-a")
+        cache.set("c", "session-c")
+        self.assertEqual(list(cache.sessions), ["a", "c"])
+
+    def test_update(self):
+        cache = TlsSessionCache(2)
+        conn = mock.Mock()
+        conn.get_session.return_value = "session-a"
+        cache.update("a", conn)
+        self.assertEqual(cache.get("a"), "session-a")
+
+        conn.get_session.return_value = None
+        cache.update("a", conn)
+        self.assertEqual(cache.get("a"), "session-a")
+
+    def test_record(self):
+        cache = TlsSessionCache(2)
+        cache.record(True)
+        cache.record(False)
+        cache.record(False)
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 2)
+
+        cache.clear()
+        self.assertEqual(cache.hits, 0)
+        self.assertEqual(cache.misses, 0)
+
+
 class TestServerConnection(ProxyAsyncTestCase):
     def setUp(self):
         super(TestServerConnection, self).setUp()
@@ -179,6 +252,42 @@ class TestClientConnection(ProxyAsyncTestCase):
         data = yield self.server_stream.read_bytes(5)
         self.assertEqual(data, b"hello")
 
+    @gen_test
+    def test_start_tls_resume_session(self):
+        dest_session_cache.clear()
+        self.addCleanup(dest_session_cache.clear)
+        server_ctx = get_src_sslcontext(
+            *self.cert_store.get_cert_and_pkey("127.0.0.1"))
+
+        server_stream_future = self.server_stream.start_tls(
+            server_side=True, ssl_options=server_ctx)
+        self.dest_stream = yield ClientConnection(self.dest_stream).start_tls(
+            insecure=True, trusted_ca_certs="")
+        self.server_stream = yield server_stream_future
+
+        # NOTE: the session ticket of TLS 1.3 arrives after the handshake.
+        yield self.server_stream.write(b"hello")
+        yield self.dest_stream.read_bytes(5)
+        self.assertEqual(dest_session_cache.hits, 0)
+        self.assertEqual(dest_session_cache.misses, 1)
+        session_key = list(dest_session_cache.sessions)[0]
+        self.assertIsInstance(dest_session_cache.get(session_key), SSL.Session)
+
+        self.dest_stream.close()
+        self.server_stream.close()
+        self.dest_stream, self.server_stream = yield self.create_iostream_pair()
+
+        server_stream_future = self.server_stream.start_tls(
+            server_side=True, ssl_options=server_ctx)
+        with mock.patch.object(ClientConnection, "_session_key",
+                               return_value=session_key):
+            self.dest_stream = yield ClientConnection(self.dest_stream).start_tls(
+                insecure=True, trusted_ca_certs="")
+        self.server_stream = yield server_stream_future
+
+        self.assertEqual(dest_session_cache.hits, 1)
+        self.assertEqual(dest_session_cache.misses, 1)
+
     @gen_test
     def test_start_tls_with_truct_cert(self):
         server_stream_future = self.server_stream.start_tls(
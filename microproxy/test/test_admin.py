@@ -0,0 +1,24 @@
+from tornado.testing import AsyncHTTPTestCase
+
+from microproxy.admin import create_admin_app
+from microproxy.metrics import MetricsRegistry
+
+
+class AdminTest(AsyncHTTPTestCase):
+    def get_app(self):
+        self.registry = MetricsRegistry()
+        self.registry.counter("requests_total", "Requests").inc()
+        return create_admin_app(self.registry)
+
+    def test_metrics(self):
+        response = self.fetch("/metrics")
+
+        self.assertEqual(response.code, 200)
+        self.assertTrue(response.headers["Content-Type"].startswith("text/plain; version=0.0.4"))
+        self.assertEqual(response.body, (
+            "# HELP requests_total Requests\n"
+            "# TYPE requests_total counter\n"
+            "requests_total 1\n"))
+
+    def test_not_found(self):
+        self.assertEqual(self.fetch("/").code, 404)
@@ -1,4 +1,9 @@
+import mock
+import shutil
+import tempfile
+import threading
 import unittest
+from tornado.testing import AsyncTestCase, gen_test
 
 from microproxy.cert import CertStore
 from OpenSSL import crypto
@@ -27,6 +32,11 @@ class CertStoreTest(unittest.TestCase):
         # self.assertEqual(pkey._pkey, cert.get_pubkey()._pkey)
         self.assertEquals(unicode(cn), cert.get_subject().CN)
 
+    def test_create_cert_unique_serial(self):
+        serials = set(self.cert_store._sign_cert("www.test.com").get_serial_number()
+                      for _ in range(10))
+        self.assertEqual(len(serials), 10)
+
     def test_get_cert_from_cache_nonexist(self):
         cert = self.cert_store.get_cert_from_cache("www.abc.com")
         self.assertIsNone(cert)
@@ -50,3 +60,112 @@ class CertStoreTest(unittest.TestCase):
         self.assertIsInstance(new_pkey, crypto.PKey)
         self.assertEqual(old_ca, new_ca)
         self.assertEqual(old_pkey, new_pkey)
+
+    def test_cache_size(self):
+        self.cert_store.cache_size = 2
+        self.cert_store.create_cert("www.a.com")
+        self.cert_store.create_cert("www.b.com")
+        self.cert_store.get_cert_from_cache("www.a.com")
+        self.cert_store.create_cert("www.c.com")
+
+        self.assertEqual(list(self.cert_store.certs_cache),
+                         ["www.a.com", "www.c.com"])
+        self.assertIsNone(self.cert_store.get_cert_from_cache("www.b.com"))
+
+
+class CertStoreDiskCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.config = {
+            "certfile": "microproxy/test/test.crt",
+            "keyfile": "microproxy/test/test.key",
+            "cert_cache_dir": self.cache_dir
+        }
+
+    def test_load_from_disk(self):
+        orig_cert = CertStore(self.config).create_cert("www.abc.com")
+
+        cert_store = CertStore(self.config)
+        self.assertEqual(len(cert_store.certs_cache), 0)
+        cert = cert_store.get_cert_from_cache("www.abc.com")
+
+        self.assertIsInstance(cert, crypto.X509)
+        self.assertEqual(orig_cert.get_serial_number(), cert.get_serial_number())
+        self.assertIn("www.abc.com", cert_store.certs_cache)
+
+    def test_load_from_disk_nonexist(self):
+        cert_store = CertStore(self.config)
+        self.assertIsNone(cert_store.get_cert_from_cache("www.abc.com"))
+
+    def test_warmup_hosts(self):
+        self.config["cert_warmup_hosts"] = ["www.abc.com", "www.def.com"]
+        cert_store = CertStore(self.config)
+        self.assertEqual(list(cert_store.certs_cache),
+                         ["www.abc.com", "www.def.com"])
+
+        del self.config["cert_warmup_hosts"]
+        cert_store = CertStore(self.config)
+        self.assertIsNotNone(cert_store.get_cert_from_cache("www.def.com"))
+
+
+class CertStoreAsyncTest(AsyncTestCase):
+    def setUp(self):
+        super(CertStoreAsyncTest, self).setUp()
+        config = {
+            "certfile": "microproxy/test/test.crt",
+            "keyfile": "microproxy/test/test.key"
+        }
+
+        self.cert_store = CertStore(config)
+
+    @gen_test
+    def test_get_cert_and_pkey_async(self):
+        cert, pkey = yield self.cert_store.get_cert_and_pkey_async("www.abc.com")
+
+        self.assertIsInstance(cert, crypto.X509)
+        self.assertEqual(pkey, self.cert_store.private_key)
+        self.assertEquals(u"www.abc.com", cert.get_subject().CN)
+        self.assertEqual(self.cert_store.get_cert_from_cache("www.abc.com"), cert)
+        self.assertEqual(self.cert_store.pending_certs, {})
+
+    @gen_test
+    def test_get_cert_and_pkey_async_coalesced(self):
+        with mock.patch.object(self.cert_store, "_sign_cert",
+                               wraps=self.cert_store._sign_cert) as sign_cert:
+            results = yield [
+                self.cert_store.get_cert_and_pkey_async("www.abc.com"),
+                self.cert_store.get_cert_and_pkey_async("www.abc.com"),
+                self.cert_store.get_cert_and_pkey_async("www.def.com")]
+
+        self.assertEqual(sign_cert.call_count, 2)
+        self.assertIs(results[0][0], results[1][0])
+        self.assertIsNot(results[0][0], results[2][0])
+
+    @gen_test
+    def test_get_cert_and_pkey_async_write_error(self):
+        self.cert_store.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cert_store.cache_dir)
+        threads = []
+
+        def log(*args):
+            threads.append(threading.current_thread())
+
+        with mock.patch("microproxy.cert.tempfile.mkstemp", side_effect=OSError("denied")), \
+                mock.patch("microproxy.cert.logger") as logger:
+            logger.warning.side_effect = logger.debug.side_effect = log
+            cert, _ = yield self.cert_store.get_cert_and_pkey_async("www.abc.com")
+
+        self.assertIsInstance(cert, crypto.X509)
+        self.assertIn("denied", logger.warning.call_args[0][0])
+        # NOTE: the log handlers are not thread-safe, nothing logs in the executor.
+        self.assertEqual(set(threads), {threading.current_thread()})
+
+    @gen_test
+    def test_get_cert_and_pkey_async_from_cache(self):
+        orig_cert = self.cert_store.create_cert("www.abc.com")
+        with mock.patch.object(self.cert_store, "executor") as executor:
+            cert, _ = yield self.cert_store.get_cert_and_pkey_async("www.abc.com")
+
+        self.assertFalse(executor.submit.called)
+        self.assertIs(cert, orig_cert)
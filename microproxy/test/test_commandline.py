@@ -23,6 +23,14 @@ class CommandLineTest(unittest.TestCase):
                       cmd_flags="--port",
                       config_file_flags="proxy:port")
 
+        define_option(option_info=proxy_option_info,
+                      option_name="workers",
+                      help_str="Specify the number of proxy processes sharing the listening port",
+                      default="1",
+                      option_type="int",
+                      cmd_flags="--workers",
+                      config_file_flags="proxy:workers")
+
         define_option(option_info=proxy_option_info,
                       option_name="mode",
                       help_str="Speficy the proxy mode, currently support socks proxy and transparent proxy",
@@ -85,6 +93,39 @@ class CommandLineTest(unittest.TestCase):
                       cmd_flags="--plugins",
                       config_file_flags="advanced:plugins")
 
+        define_option(option_info=proxy_option_info,
+                      option_name="plugin_timeout",
+                      help_str="Specify the seconds to wait for an asynchronous plugin hook",
+                      option_type="int",
+                      default="5",
+                      cmd_flags="--plugin-timeout",
+                      config_file_flags="advanced:plugin.timeout")
+
+        define_option(option_info=proxy_option_info,
+                      option_name="plugin_fail_policy",
+                      help_str="Specify what happens when a plugin hook fails, open skips the plugin, closed drops the exchange",
+                      option_type="str",
+                      default="closed",
+                      cmd_flags="--plugin-fail-policy",
+                      choices=["open", "closed"],
+                      config_file_flags="advanced:plugin.fail_policy")
+
+        define_option(option_info=proxy_option_info,
+                      option_name="plugin_workers",
+                      help_str="Specify the number of threads running the plugin hooks with RUN_IN_EXECUTOR",
+                      option_type="int",
+                      default="4",
+                      cmd_flags="--plugin-workers",
+                      config_file_flags="advanced:plugin.workers")
+
+        define_option(option_info=proxy_option_info,
+                      option_name="plugin_processes",
+                      help_str="Specify the number of worker processes running the plugin hooks with RUN_IN_PROCESS, 0 for the number of cpus",
+                      option_type="int",
+                      default="0",
+                      cmd_flags="--plugin-processes",
+                      config_file_flags="advanced:plugin.processes")
+
         define_option(option_info=proxy_option_info,
                       option_name="client_certs",
                       help_str="Specify the location of trusted ca pem file",
@@ -100,6 +141,198 @@ class CommandLineTest(unittest.TestCase):
                       default=False,
                       cmd_flags=["--insecure", "-k"])
 
+        define_option(option_info=proxy_option_info,
+                      option_name="stream_body",
+                      help_str="Relay http body to the other side as it arrives instead of buffering it.",
+                      option_type="bool",
+                      default=False,
+                      cmd_flags="--stream-body")
+
+        define_option(option_info=proxy_option_info,
+                      option_name="stream_preview_size",
+                      help_str="Specify how many bytes of a streamed body are kept for plugins and viewers",
+                      option_type="int",
+                      default="65536",
+                      cmd_flags="--stream-preview-size",
+                      config_file_flags="advanced:stream.preview.size")
+
+        define_option(option_info=proxy_option_info,
+                      option_name="pool_max_per_host",
+                      help_str="Specify the max number of idle upstream connections kept for each host",
+                      option_type="int",
+                      default="8",
+                      cmd_flags="--pool-max-per-host",
+                      config_file_flags="advanced:pool.max.per.host")
+
+        define_option(option_info=proxy_option_info,
+                      option_name="pool_idle_timeout",
+                      help_str="Specify how many seconds an idle upstream connection is kept, 0 to disable reuse",
+                      option_type="int",
+                      default="60",
+                      cmd_flags="--pool-idle-timeout",
+                      config_file_flags="advanced:pool.idle.timeout")
+
+        define_option(option_info=proxy_option_info,
+                      option_name="cert_cache_size",
+                      help_str="Specify the max number of generated certificates kept in memory",
+                      option_type="int",
+                      default="1024",
+                      cmd_flags="--cert-cache-size",
+                      config_file_flags="advanced:cert.cache.size")
+
+        define_option(option_info=proxy_option_info,
+                      option_name="cert_cache_dir",
+                      help_str="Specify the directory to store generated certificates across restarts",
+                      option_type="str",
+                      default="",
+                      cmd_flags="--cert-cache-dir",
+                      config_file_flags="advanced:cert.cache.dir")
+
+        define_option(option_info=proxy_option_info,
+                      option_name="cert_warmup_hosts",
+                      help_str="Specify hostnames to generate certificates for at startup",
+                      option_type="list:str",
+                      default="",
+                      cmd_flags="--cert-warmup-hosts",
+                      config_file_flags="advanced:cert.warmup.hosts")
+
+        define_option(option_info=proxy_option_info,
+                      option_name="cert_workers",
+                      help_str="Specify the number of threads used to sign certificates",
+                      option_type="int",
+                      default="4",
+                      cmd_flags="--cert-workers",
+                      config_file_flags="advanced:cert.workers")
+
+        define_option(option_info=proxy_option_info,
+                      option_name="forward_relay",
+                      help_str="Specify how not intercepted traffic is relayed, direct skips the iostream buffers for plain tcp",
+                      option_type="str",
+                      default="stream",
+                      cmd_flags="--forward-relay",
+                      choices=["stream", "direct"],
+                      config_file_flags="advanced:forward.relay")
+
+        define_option(option_info=proxy_option_info,
+                      option_name="forward_high_water",
+                      help_str="Specify how many unsent bytes pause reading the other side of a forwarded connection",
+                      option_type="int",
+                      default="1048576",
+                      cmd_flags="--forward-high-water",
+                      config_file_flags="advanced:forward.high.water")
+
+        define_option(option_info=proxy_option_info,
+                      option_name="forward_low_water",
+                      help_str="Specify how many unsent bytes resume reading the other side of a forwarded connection",
+                      option_type="int",
+                      default="262144",
+                      cmd_flags="--forward-low-water",
+                      config_file_flags="advanced:forward.low.water")
+
+        define_option(option_info=proxy_option_info,
+                      option_name="publish_queue_size",
+                      help_str="Specify the max number of messages waiting for the viewers, newer messages are dropped when full",
+                      option_type="int",
+                      default="1000",
+                      cmd_flags="--publish-queue-size",
+                      config_file_flags="advanced:publish.queue.size")
+
+        define_option(option_info=proxy_option_info,
+                      option_name="publish_batch_size",
+                      help_str="Specify the max number of messages sent to the viewers in one batch",
+                      option_type="int",
+                      default="64",
+                      cmd_flags="--publish-batch-size",
+                      config_file_flags="advanced:publish.batch.size")
+
+        define_option(option_info=proxy_option_info,
+                      option_name="publish_interval",
+                      help_str="Specify how many milliseconds a message may wait for its batch",
+                      option_type="int",
+                      default="50",
+                      cmd_flags="--publish-interval",
+                      config_file_flags="advanced:publish.interval")
+
+        define_option(option_info=proxy_option_info,
+                      option_name="viewer_format",
+                      help_str="Specify the format of messages published to the viewers, binary keeps bodies as raw bytes",
+                      option_type="str",
+                      default="json",
+                      cmd_flags="--viewer-format",
+                      choices=["json", "binary"],
+                      config_file_flags="advanced:viewer.format")
+
+        define_option(option_info=proxy_option_info,
+                      option_name="capture_max_body",
+                      help_str="Specify the max bytes of a body published to the viewers, negative means unlimited",
+                      option_type="int",
+                      default="-1",
+                      cmd_flags="--capture-max-body",
+                      config_file_flags="advanced:capture.max.body")
+
+        define_option(option_info=proxy_option_info,
+                      option_name="capture_content_type_limits",
+                      help_str="Specify the max bytes of a body by content type, e.g. image/*=0,text/html=65536",
+                      option_type="list:str",
+                      default="",
+                      cmd_flags="--capture-content-type-limits",
+                      config_file_flags="advanced:capture.content.type.limits")
+
+        define_option(option_info=proxy_option_info,
+                      option_name="capture_headers_only",
+                      help_str="Publish only the headers of the exchanges to the viewers",
+                      option_type="bool",
+                      default=False,
+                      cmd_flags="--capture-headers-only")
+
+        define_option(option_info=proxy_option_info,
+                      option_name="capture_include",
+                      help_str="Specify host/path patterns of the exchanges published to the viewers, e.g. *.example.com/api/*",
+                      option_type="list:str",
+                      default="",
+                      cmd_flags="--capture-include",
+                      config_file_flags="advanced:capture.include")
+
+        define_option(option_info=proxy_option_info,
+                      option_name="capture_exclude",
+                      help_str="Specify host/path patterns of the exchanges not published to the viewers",
+                      option_type="list:str",
+                      default="",
+                      cmd_flags="--capture-exclude",
+                      config_file_flags="advanced:capture.exclude")
+
+        define_option(option_info=proxy_option_info,
+                      option_name="client_hello_timeout",
+                      help_str="Specify how many seconds to wait for the tls client hello",
+                      option_type="int",
+                      default="10",
+                      cmd_flags="--client-hello-timeout",
+                      config_file_flags="advanced:client.hello.timeout")
+
+        define_option(option_info=proxy_option_info,
+                      option_name="admin_port",
+                      help_str="Specify the local admin port serving /metrics, 0 to disable. Worker N listens at admin port + N",
+                      option_type="int",
+                      default="0",
+                      cmd_flags="--admin-port",
+                      config_file_flags="admin:port")
+
+        define_option(option_info=proxy_option_info,
+                      option_name="admin_host",
+                      help_str="Specify the address of the admin server",
+                      option_type="str",
+                      default="127.0.0.1",
+                      cmd_flags="--admin-host",
+                      config_file_flags="admin:host")
+
+        define_option(option_info=proxy_option_info,
+                      option_name="lag_threshold",
+                      help_str="Specify the milliseconds of io loop lag logged with the stack of the blocking code, 0 to disable",
+                      option_type="int",
+                      default="500",
+                      cmd_flags="--lag-threshold",
+                      config_file_flags="advanced:lag.threshold")
+
         define_option(option_info=proxy_option_info,
                       option_name="log_level",
                       help_str="Specify the server log level",
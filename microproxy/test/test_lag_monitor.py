@@ -0,0 +1,50 @@
+import time
+import unittest
+import mock
+from tornado import gen
+from tornado.testing import AsyncTestCase, gen_test
+
+from microproxy import lag_monitor
+from microproxy.lag_monitor import LagMonitor
+
+
+def blocking_callback():
+    time.sleep(0.2)
+
+
+class TestLagMonitor(AsyncTestCase):
+    def setUp(self):
+        super(TestLagMonitor, self).setUp()
+        self.monitor = LagMonitor(0.05, interval=0.01, io_loop=self.io_loop)
+        self.monitor.start()
+
+    def tearDown(self):
+        self.monitor.stop()
+        super(TestLagMonitor, self).tearDown()
+
+    @gen_test
+    def test_heartbeat(self):
+        lag_count = lag_monitor._lag_seconds.get()
+        yield gen.sleep(0.05)
+
+        self.assertGreater(self.monitor.beats, 0)
+        self.assertGreater(lag_monitor._lag_seconds.get(), lag_count)
+        self.assertIsNone(self.monitor.stall_stack)
+
+    @gen_test
+    def test_stall(self):
+        stalls = lag_monitor._stalls_total.get()
+        with mock.patch.object(lag_monitor, "logger") as logger:
+            self.io_loop.add_callback(blocking_callback)
+            yield gen.sleep(0.05)
+
+        self.assertEqual(lag_monitor._stalls_total.get(), stalls + 1)
+        logger.warning.assert_called_once()
+        message = logger.warning.call_args[0][0]
+        self.assertTrue(message.startswith("io loop was blocked for"))
+        self.assertIn("in blocking_callback", message)
+        self.assertIsNone(self.monitor.stall_stack)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+
+from microproxy.metrics import MetricsRegistry, hdr_bounds
+
+
+class MetricsRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter(self):
+        counter = self.registry.counter("requests_total", "Requests", ["method"])
+        counter.inc(labels=("GET",))
+        counter.inc(2, labels=("GET",))
+        counter.inc(labels=("POST",))
+
+        self.assertEqual(counter.get(("GET",)), 3)
+        self.assertEqual(self.registry.expose(), (
+            "# HELP requests_total Requests\n"
+            "# TYPE requests_total counter\n"
+            'requests_total{method="GET"} 3\n'
+            'requests_total{method="POST"} 1\n'))
+
+    def test_gauge(self):
+        gauge = self.registry.gauge("connections", "Connections")
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+        self.assertEqual(gauge.get(), 1)
+
+        gauge.set(0.5)
+        self.assertIn("connections 0.5\n", self.registry.expose())
+
+    def test_collect(self):
+        self.registry.counter(
+            "cache_total", "Cache", ["result"],
+            collect=lambda: {("hit",): 1, ("miss",): 2})
+
+        self.assertIn('cache_total{result="hit"} 1\n', self.registry.expose())
+        self.assertIn('cache_total{result="miss"} 2\n', self.registry.expose())
+
+    def test_histogram(self):
+        histogram = self.registry.histogram(
+            "latency_seconds", "Latency", ["side"], lowest=1, highest=4, sub_buckets=2)
+        self.assertEqual(histogram.bounds, [1.5, 2.0, 3.0, 4.0])
+
+        histogram.observe(1.2, labels=("src",))
+        histogram.observe(3.0, labels=("src",))
+        histogram.observe(10, labels=("src",))
+
+        self.assertEqual(histogram.get(("src",)), 3)
+        self.assertEqual(self.registry.expose(), (
+            "# HELP latency_seconds Latency\n"
+            "# TYPE latency_seconds histogram\n"
+            'latency_seconds_bucket{side="src",le="1.5"} 1\n'
+            'latency_seconds_bucket{side="src",le="2.0"} 1\n'
+            'latency_seconds_bucket{side="src",le="3.0"} 2\n'
+            'latency_seconds_bucket{side="src",le="4.0"} 2\n'
+            'latency_seconds_bucket{side="src",le="+Inf"} 3\n'
+            'latency_seconds_sum{side="src"} 14.2\n'
+            'latency_seconds_count{side="src"} 3\n'))
+
+    def test_hdr_bounds(self):
+        bounds = hdr_bounds(0.001, 1, 4)
+        self.assertEqual(bounds[:4], [0.00125, 0.0015, 0.00175, 0.002])
+        self.assertTrue(bounds[-1] >= 1)
+        for lower, upper in zip(bounds, bounds[1:]):
+            self.assertTrue((upper - lower) / lower <= 0.25)
+
+    def test_label_escaping(self):
+        counter = self.registry.counter("errors_total", "Errors", ["error"])
+        counter.inc(labels=('say "hi"\n',))
+        self.assertIn(r'errors_total{error="say \"hi\"\n"} 1', self.registry.expose())
+
+    def test_get_or_create(self):
+        counter = self.registry.counter("requests_total", "Requests")
+        self.assertIs(self.registry.counter("requests_total", "Requests"), counter)
+        with self.assertRaises(ValueError):
+            self.registry.gauge("requests_total", "Requests")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+from tornado.gen import sleep
+from tornado.testing import gen_test
+
+from microproxy.pool import ConnectionPool
+from microproxy.test.utils import ProxyAsyncTestCase
+
+
+class ConnectionPoolTest(ProxyAsyncTestCase):
+    def setUp(self):
+        super(ConnectionPoolTest, self).setUp()
+        self.pool = ConnectionPool(
+            max_per_host=1, idle_timeout=60, io_loop=self.io_loop)
+        self.key = ConnectionPool.key("127.0.0.1", 80)
+        self.asyncSetUp()
+
+    @gen_test
+    def asyncSetUp(self):
+        self.client_stream, self.server_stream = yield self.create_iostream_pair()
+
+    def test_key(self):
+        self.assertEqual(ConnectionPool.key("127.0.0.1", 80),
+                         ("127.0.0.1", 80, False, None))
+        self.assertEqual(ConnectionPool.key("127.0.0.1", 443, 1, "http/1.1"),
+                         ("127.0.0.1", 443, True, "http/1.1"))
+
+    def test_acquire_empty(self):
+        self.assertIsNone(self.pool.acquire(self.key))
+
+    def test_release_and_acquire(self):
+        self.assertTrue(self.pool.release(self.key, self.client_stream))
+        self.assertIsNone(self.pool.acquire(
+            ConnectionPool.key("127.0.0.1", 443, True, "http/1.1")))
+
+        self.assertIs(self.pool.acquire(self.key), self.client_stream)
+        self.assertIsNone(self.pool.acquire(self.key))
+        self.assertEqual(self.pool.idle_streams, {})
+        self.assertFalse(self.client_stream.closed())
+
+    def test_has_idle(self):
+        self.assertFalse(self.pool.has_idle(self.key))
+        self.pool.release(self.key, self.client_stream)
+        self.assertTrue(self.pool.has_idle(self.key))
+        self.pool.acquire(self.key)
+        self.assertFalse(self.pool.has_idle(self.key))
+
+    @gen_test
+    def test_release_over_max_per_host(self):
+        client_stream, server_stream = yield self.create_iostream_pair()
+        self.addCleanup(server_stream.close)
+
+        self.assertTrue(self.pool.release(self.key, self.client_stream))
+        self.assertFalse(self.pool.release(self.key, client_stream))
+        self.assertTrue(client_stream.closed())
+
+    def test_release_closed_stream(self):
+        self.client_stream.close()
+        self.assertFalse(self.pool.release(self.key, self.client_stream))
+        self.assertEqual(self.pool.idle_streams, {})
+
+    def test_release_with_pool_disabled(self):
+        self.pool.idle_timeout = 0
+        self.assertFalse(self.pool.release(self.key, self.client_stream))
+        self.assertTrue(self.client_stream.closed())
+
+    @gen_test
+    def test_acquire_with_unexpected_data(self):
+        self.assertTrue(self.pool.release(self.key, self.client_stream))
+        yield self.server_stream.write(b"data")
+        yield sleep(0.1)
+
+        self.assertIsNone(self.pool.acquire(self.key))
+        self.assertTrue(self.client_stream.closed())
+
+    @gen_test
+    def test_closed_by_peer(self):
+        self.assertTrue(self.pool.release(self.key, self.client_stream))
+        self.server_stream.close()
+        yield sleep(0.1)
+
+        self.assertTrue(self.client_stream.closed())
+        self.assertEqual(self.pool.idle_streams, {})
+
+    @gen_test
+    def test_idle_timeout(self):
+        self.pool.idle_timeout = 0.1
+        self.assertTrue(self.pool.release(self.key, self.client_stream))
+        yield sleep(0.2)
+
+        self.assertTrue(self.client_stream.closed())
+        self.assertEqual(self.pool.idle_streams, {})
+
+    def test_close(self):
+        self.assertTrue(self.pool.release(self.key, self.client_stream))
+        self.pool.close()
+
+        self.assertTrue(self.client_stream.closed())
+        self.assertEqual(self.pool.idle_streams, {})
+
+    def tearDown(self):
+        self.client_stream.close()
+        self.server_stream.close()
+        super(ConnectionPoolTest, self).tearDown()
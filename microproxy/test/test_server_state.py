@@ -1,7 +1,8 @@
 import unittest
 import mock
 
-from microproxy.server_state import init_server_state, _init_cert_store, _init_interceptor
+from microproxy.server_state import (
+    init_server_state, _init_cert_store, _init_interceptor, _init_dest_pool)
 
 
 class ServerStateAPITest(unittest.TestCase):
@@ -9,11 +10,13 @@ class ServerStateAPITest(unittest.TestCase):
         self.config = dict()
 
     @mock.patch("microproxy.server_state.ServerContext")
+    @mock.patch("microproxy.server_state._init_dest_pool")
     @mock.patch("microproxy.server_state._init_cert_store")
     @mock.patch("microproxy.server_state._init_interceptor")
     def test_init_server_state(self,
                                mock_init_interceptor,
                                mock_init_cert_store,
+                               mock_init_dest_pool,
                                MockServerContext):
         publish_socket = dict()
         context = init_server_state(self.config, publish_socket)
@@ -21,11 +24,13 @@ class ServerStateAPITest(unittest.TestCase):
         mock_init_cert_store.assert_called_once_with(self.config)
         mock_init_interceptor.assert_called_once_with(
             self.config, publish_socket)
+        mock_init_dest_pool.assert_called_once_with(self.config)
 
         MockServerContext.assert_called_once_with(
             config=self.config,
             interceptor=mock_init_interceptor.return_value,
-            cert_store=mock_init_cert_store.return_value)
+            cert_store=mock_init_cert_store.return_value,
+            dest_pool=mock_init_dest_pool.return_value)
         self.assertEqual(context, MockServerContext.return_value)
 
     @mock.patch("microproxy.server_state.CertStore")
@@ -35,13 +40,24 @@ class ServerStateAPITest(unittest.TestCase):
         MockCertStore.assert_called_once_with(self.config)
         self.assertEqual(cert_store, MockCertStore.return_value)
 
+    @mock.patch("microproxy.server_state.ConnectionPool")
+    def test_init_dest_pool(self, MockConnectionPool):
+        self.config = {"pool_max_per_host": 4, "pool_idle_timeout": 30}
+        dest_pool = _init_dest_pool(self.config)
+
+        MockConnectionPool.assert_called_once_with(
+            max_per_host=4, idle_timeout=30)
+        self.assertEqual(dest_pool, MockConnectionPool.return_value)
+
+    @mock.patch("microproxy.server_state.CapturePolicy")
     @mock.patch("microproxy.server_state.MsgPublisher")
     @mock.patch("microproxy.server_state.PluginManager")
     @mock.patch("microproxy.server_state.Interceptor")
     def test_init_interceptor(self,
                               MockInterceptor,
                               MockPluginManager,
-                              MockMsgPublisher):
+                              MockMsgPublisher,
+                              MockCapturePolicy):
 
         publish_socket = dict()
         interceptor = _init_interceptor(self.config, publish_socket)
@@ -51,6 +67,8 @@ class ServerStateAPITest(unittest.TestCase):
         MockPluginManager.assert_called_once_with(self.config)
         MockMsgPublisher.assert_called_once_with(
             self.config, zmq_socket=publish_socket)
+        MockCapturePolicy.assert_called_once_with(self.config)
         MockInterceptor.assert_called_once_with(
             plugin_manager=MockPluginManager.return_value,
-            msg_publisher=MockMsgPublisher.return_value)
+            msg_publisher=MockMsgPublisher.return_value,
+            capture_policy=MockCapturePolicy.return_value)
@@ -0,0 +1,87 @@
+import json
+import os
+import unittest
+import mock
+
+from microproxy.event import REPLAY, PROFILE_START
+from microproxy.worker import (
+    WorkerSupervisor, AGGREGATOR, internal_channels, route_event)
+
+
+class WorkerSupervisorTest(unittest.TestCase):
+    def setUp(self):
+        self.config = dict(workers=2, host="127.0.0.1", port=5580,
+                           cert_cache_dir="")
+        self.supervisor = WorkerSupervisor(self.config, max_restarts=1)
+
+    def test_internal_channels(self):
+        self.assertEqual(internal_channels("/tmp/abc"),
+                         ("ipc:///tmp/abc/viewer", "ipc:///tmp/abc/events",
+                          "ipc:///tmp/abc/broadcast"))
+
+    def test_route_event(self):
+        backend, broadcast = mock.Mock(), mock.Mock()
+        msg_parts = [json.dumps({"name": REPLAY, "context": {}})]
+        route_event(msg_parts, backend, broadcast)
+
+        backend.send_multipart.assert_called_once_with(msg_parts)
+        broadcast.send_multipart.assert_not_called()
+
+    def test_route_broadcast_event(self):
+        backend, broadcast = mock.Mock(), mock.Mock()
+        msg_parts = [json.dumps({"name": PROFILE_START, "context": {}})]
+        route_event(msg_parts, backend, broadcast)
+
+        broadcast.send_multipart.assert_called_once_with(msg_parts)
+        backend.send_multipart.assert_not_called()
+
+    def test_route_wrong_event(self):
+        backend, broadcast = mock.Mock(), mock.Mock()
+        route_event(["not json"], backend, broadcast)
+        backend.send_multipart.assert_called_once_with(["not json"])
+
+    @mock.patch("os.fork", side_effect=[101, 102])
+    def test_spawn(self, mock_fork):
+        self.supervisor.spawn(AGGREGATOR)
+        self.supervisor.spawn(0)
+        self.assertEqual(self.supervisor.children, {101: AGGREGATOR, 102: 0})
+
+    @mock.patch("os.fork", return_value=103)
+    @mock.patch("os.wait")
+    def test_supervise_restart_dead_worker(self, mock_wait, mock_fork):
+        self.supervisor.children = {101: AGGREGATOR, 102: 0}
+        # NOTE: 102 killed by SIGKILL, then everyone exits normally.
+        mock_wait.side_effect = [(102, 9), (101, 0), (103, 0)]
+
+        self.supervisor.supervise()
+
+        mock_fork.assert_called_once_with()
+        self.assertEqual(self.supervisor.restarts, 1)
+        self.assertEqual(self.supervisor.children, {})
+
+    @mock.patch("os.fork", return_value=103)
+    @mock.patch("os.wait")
+    def test_supervise_too_many_restarts(self, mock_wait, mock_fork):
+        self.supervisor.children = {102: 0}
+        mock_wait.side_effect = [(102, 1 << 8), (103, 1 << 8)]
+
+        with self.assertRaises(RuntimeError):
+            self.supervisor.supervise()
+
+    @mock.patch("microproxy.worker.bind_sockets")
+    @mock.patch.object(WorkerSupervisor, "supervise")
+    @mock.patch.object(WorkerSupervisor, "spawn")
+    def test_start(self, mock_spawn, mock_supervise, mock_bind_sockets):
+        sock = mock.Mock()
+        mock_bind_sockets.return_value = [sock]
+
+        self.supervisor.start()
+
+        mock_bind_sockets.assert_called_once_with(5580, "127.0.0.1")
+        self.assertEqual(mock_spawn.call_args_list,
+                         [mock.call(AGGREGATOR), mock.call(0), mock.call(1)])
+        mock_supervise.assert_called_once_with()
+        self.assertTrue(self.config["cert_cache_dir"].startswith(
+            self.supervisor.ipc_dir))
+        sock.close.assert_called_once_with()
+        self.assertFalse(os.path.exists(self.supervisor.ipc_dir))
@@ -6,8 +6,11 @@ from tornado.stack_context import NullContext
 from tornado.testing import AsyncTestCase, bind_unused_port, gen_test
 from tornado.test.util import unittest, skipIfNonUnix, refusing_port
 
+from tornado.iostream import StreamClosedError
 from microproxy.tornado_ext.iostream import MicroProxyIOStream
 from microproxy.tornado_ext.iostream import MicroProxySSLIOStream
+from microproxy.tornado_ext.iostream import bytes_received_total, bytes_sent_total
+from microproxy.test.utils import ProxyAsyncTestCase
 from microproxy.protocol.tls import create_src_sslcontext
 from microproxy.protocol.tls import create_basic_sslcontext
 from OpenSSL import crypto
@@ -704,6 +707,117 @@ class TestSSLIOStream(TestIOStreamMixin, AsyncTestCase):
             ssl_options=dest_context, **kwargs)
 
 
+class TestIOStreamPeek(ProxyAsyncTestCase):
+    def setUp(self):
+        super(TestIOStreamPeek, self).setUp()
+        self.asyncSetUp()
+
+    @gen_test
+    def asyncSetUp(self):
+        self.client, self.server = yield self.create_iostream_pair()
+
+    @gen_test
+    def test_peek(self):
+        self.client.write(b"abcd")
+        data = yield self.server.peek(4, timeout=1)
+        self.assertEqual(data, b"abcd")
+
+        # NOTE: peeked bytes are still readable.
+        data = yield self.server.read_bytes(4)
+        self.assertEqual(data, b"abcd")
+
+    @gen_test
+    def test_peek_partial_data(self):
+        self.client.write(b"ab")
+        future = self.server.peek(4, timeout=1)
+        yield gen.sleep(0.05)
+        self.assertFalse(future.done())
+
+        self.client.write(b"cd")
+        data = yield future
+        self.assertEqual(data, b"abcd")
+
+    @gen_test
+    def test_peek_timeout(self):
+        self.client.write(b"ab")
+        with self.assertRaises(gen.TimeoutError):
+            yield self.server.peek(4, timeout=0.05)
+
+        data = yield self.server.peek(2)
+        self.assertEqual(data, b"ab")
+
+    @gen_test
+    def test_peek_closed_by_peer(self):
+        future = self.server.peek(4)
+        self.client.close()
+        data = yield future
+        self.assertEqual(data, b"")
+
+    @gen_test
+    def test_peek_stream_closed(self):
+        future = self.server.peek(4)
+        self.server.close()
+        with self.assertRaises(StreamClosedError):
+            yield future
+
+    def test_peek_with_incorrect_length(self):
+        with self.assertRaises(ValueError):
+            self.server.peek(-1)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+        super(TestIOStreamPeek, self).tearDown()
+
+
+class TestIOStreamWriteBuffer(ProxyAsyncTestCase):
+    def setUp(self):
+        super(TestIOStreamWriteBuffer, self).setUp()
+        self.asyncSetUp()
+
+    @gen_test
+    def asyncSetUp(self):
+        self.client, self.server = yield self.create_iostream_pair()
+
+    @gen_test
+    def test_wait_for_drain(self):
+        data = b"a" * 8 * 1024 * 1024
+        self.client.write(data)
+        self.assertGreater(self.client.write_buffer_size(), 1024 * 1024)
+
+        future = self.client.wait_for_drain(1024 * 1024)
+        self.assertFalse(future.done())
+        self.assertTrue(self.client.wait_for_drain(len(data)).done())
+
+        self.server.read_bytes(len(data))
+        yield future
+        self.assertLessEqual(self.client.write_buffer_size(), 1024 * 1024)
+
+    @gen_test
+    def test_transfer_metrics(self):
+        received = bytes_received_total.get()
+        sent = bytes_sent_total.get()
+
+        self.client.write(b"a" * 1024)
+        data = yield self.server.read_bytes(1024)
+        self.assertEqual(len(data), 1024)
+        self.assertEqual(bytes_sent_total.get(), sent + 1024)
+        self.assertEqual(bytes_received_total.get(), received + 1024)
+
+    @gen_test
+    def test_wait_for_drain_stream_closed(self):
+        self.client.write(b"a" * 8 * 1024 * 1024)
+        future = self.client.wait_for_drain()
+        self.client.close()
+        with self.assertRaises(StreamClosedError):
+            yield future
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+        super(TestIOStreamWriteBuffer, self).tearDown()
+
+
 class TestIOStreamStartTLS(AsyncTestCase):
     def setUp(self):
         try:
@@ -0,0 +1,60 @@
+from tornado.testing import gen_test
+
+from microproxy.test.utils import ProxyAsyncTestCase
+from microproxy.tornado_ext.relay import SocketRelay
+
+
+class TestSocketRelay(ProxyAsyncTestCase):
+    def setUp(self):
+        super(TestSocketRelay, self).setUp()
+        self.asyncSetUp()
+
+    @gen_test
+    def asyncSetUp(self):
+        self.client_stream, src_stream = yield self.create_iostream_pair()
+        dest_stream, self.server_stream = yield self.create_iostream_pair()
+        self.relay = SocketRelay(src_stream.detach(), dest_stream.detach(),
+                                 chunk_size=4)
+        self.relay_future = self.relay.run()
+
+    @gen_test
+    def test_relay(self):
+        self.client_stream.write(b"aaa\r\n")
+        message = yield self.server_stream.read_until(b"\r\n")
+        self.assertEqual(message, b"aaa\r\n")
+
+        self.server_stream.write(b"bbbbbbbb\r\n")
+        message = yield self.client_stream.read_until(b"\r\n")
+        self.assertEqual(message, b"bbbbbbbb\r\n")
+
+        self.assertEqual(self.relay.request_bytes, 5)
+        self.assertEqual(self.relay.response_bytes, 10)
+        self.assertFalse(self.relay_future.done())
+
+    @gen_test
+    def test_relay_large_data(self):
+        data = b"a" * 64 * 1024
+        self.client_stream.write(data)
+        message = yield self.server_stream.read_bytes(len(data))
+        self.assertEqual(message, data)
+        self.assertEqual(self.relay.request_bytes, len(data))
+
+    @gen_test
+    def test_closed_by_src(self):
+        self.client_stream.close()
+        yield self.relay_future
+        yield self.server_stream.read_until_close()
+        self.assertTrue(self.server_stream.closed())
+
+    @gen_test
+    def test_closed_by_dest(self):
+        self.server_stream.close()
+        yield self.relay_future
+        yield self.client_stream.read_until_close()
+        self.assertTrue(self.client_stream.closed())
+
+    def tearDown(self):
+        self.relay.close()
+        self.client_stream.close()
+        self.server_stream.close()
+        super(TestSocketRelay, self).tearDown()
@@ -92,6 +92,13 @@ class TestRequest(TestCase):
             expected.__dict__,
             Request(request).__dict__)
 
+    def test_truncated_request(self):
+        request = HttpRequest(headers=[("Content-Type", "text/plain")], body="data")
+        self.assertEqual(
+            ColorText("Request Body (truncated from 1024 bytes):",
+                      fg_color="blue", attrs=["bold"]),
+            Request(request, show_body=True, body_length=1024).text_list[2])
+
 
 class TestResponse(TestCase):
     def test_simple_response(self):
@@ -103,6 +110,17 @@ class TestResponse(TestCase):
             expected.__dict__,
             Response(response).__dict__)
 
+    def test_headers_only_response(self):
+        response = HttpResponse(headers=[("Content-Type", "application/xml")])
+        expected = TextList(
+            [ColorText("Response Headers:", fg_color="blue", attrs=["bold"]),
+             Header([("Content-Type", "application/xml")]),
+             ColorText("Response Body (truncated from 1024 bytes):",
+                       fg_color="blue", attrs=["bold"])])
+        self.assertEqual(
+            expected.__dict__,
+            Response(response, show_body=True, body_length=1024).__dict__)
+
 
 class TestConsole(TestCase):
     def test_construct_status_summary(self):
@@ -6,7 +6,7 @@ import json
 
 from microproxy.context import ViewerContext, Event
 from microproxy.version import VERSION
-from microproxy.viewer.tui import Tui, LogDisplayer
+from microproxy.viewer.tui import Tui, LogDisplayer, on_recv_messages
 
 
 class TestTui(unittest.TestCase):
@@ -48,6 +48,12 @@ class TestTui(unittest.TestCase):
             ],
             "body": "body".encode("base64"),
         },
+        "timing": {
+            "accept": 0,
+            "request": 1.5,
+            "response_start": 10.5,
+            "response": 12,
+        },
     })
 
     def setUp(self):
@@ -146,7 +152,7 @@ class TestTui(unittest.TestCase):
         view = self.tui.detail_view(self._VIEWER_CONTEXT)
 
         self.assertIsInstance(view, gviewer.View)
-        self.assertEqual(len(view.groups), 3)
+        self.assertEqual(len(view.groups), 4)
 
         # verify summary
         summary_group = view.groups[0]
@@ -180,6 +186,17 @@ class TestTui(unittest.TestCase):
             "ALPN                 : http/1.1"
         ))
 
+        # verify timing
+        timing_group = view.groups[3]
+        self.assertIsInstance(timing_group, gviewer.PropsGroup)
+        self.assertEqual(str(timing_group), (
+            "Timing\n"
+            "Accept              : 0.0 ms\n"
+            "Request Complete    : 1.5 ms\n"
+            "First Response Byte : 10.5 ms\n"
+            "Response Complete   : 12.0 ms"
+        ))
+
     def test_export_replay(self):
         _, out_file = tempfile.mkstemp()
         self.config["out_file"] = out_file
@@ -298,3 +315,17 @@ class TestLogDisplayer(unittest.TestCase):
         self.assertEqual(
             str(view),
             ("\nthis is log message\nsecond line\n"))
+
+
+class TestOnRecvMessages(unittest.TestCase):
+    def test_on_recv_messages(self):
+        stream = mock.Mock()
+        callback = mock.Mock()
+        on_recv_messages(stream, callback)
+
+        on_recv = stream.on_recv.call_args[0][0]
+        on_recv(["message", "first", "second"])
+
+        self.assertEqual(callback.call_args_list, [
+            mock.call(["message", "first"]),
+            mock.call(["message", "second"])])
@@ -0,0 +1,38 @@
+import StringIO
+import gzip
+import json
+import unittest
+
+from microproxy.context import ViewerContext
+from microproxy.viewer.utils import deserialize_message, ungzip
+
+
+class TestDeserializeMessage(unittest.TestCase):
+    def setUp(self):
+        self.viewer_context = ViewerContext(
+            scheme="https", host="example.com", port=443, path="/index")
+
+    def test_json(self):
+        viewer_context = deserialize_message(
+            "message", json.dumps(self.viewer_context.serialize()))
+        self.assertEqual(viewer_context, self.viewer_context)
+
+    def test_binary(self):
+        viewer_context = deserialize_message(
+            "message.bin", self.viewer_context.serialize_binary())
+        self.assertEqual(viewer_context, self.viewer_context)
+
+
+class TestUngzip(unittest.TestCase):
+    def setUp(self):
+        fio = StringIO.StringIO()
+        with gzip.GzipFile(fileobj=fio, mode="wb") as f:
+            f.write(b"data" * 1024)
+        self.content = fio.getvalue()
+
+    def test_ungzip(self):
+        self.assertEqual(ungzip(self.content), b"data" * 1024)
+
+    def test_ungzip_truncated(self):
+        body = ungzip(self.content[:len(self.content) / 2])
+        self.assertTrue((b"data" * 1024).startswith(body))
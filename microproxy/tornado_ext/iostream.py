@@ -3,18 +3,96 @@ import socket
 from tornado.iostream import IOStream, SSLIOStream, StreamClosedError, UnsatisfiableReadError
 from tornado.log import gen_log
 from tornado.concurrent import TracebackFuture
+from tornado.gen import TimeoutError
+from tornado.util import errno_from_exception
 from OpenSSL import SSL
 from service_identity import VerificationError
 from service_identity.pyopenssl import verify_hostname
 
+from microproxy import metrics
 from microproxy.log import ProxyLogger
 
 logger = ProxyLogger.get_logger(__name__)
 
+bytes_received_total = metrics.registry.counter(
+    "microproxy_bytes_received_total", "Bytes read from clients and servers")
+bytes_sent_total = metrics.registry.counter(
+    "microproxy_bytes_sent_total", "Bytes written to clients and servers")
+
+
+class TransferMetricsMixin(object):
+    """TransferMetricsMixin: Count the bytes read from and written to the socket."""
+    def _read_to_buffer(self):
+        size = super(TransferMetricsMixin, self)._read_to_buffer()
+        if size:
+            bytes_received_total.inc(size)
+        return size
+
+    def _handle_write(self):
+        buffered = self._write_buffer_size
+        super(TransferMetricsMixin, self)._handle_write()
+        if buffered != self._write_buffer_size:
+            bytes_sent_total.inc(buffered - self._write_buffer_size)
+
+
+class WriteBufferMixin(object):
+    """WriteBufferMixin: Let callers wait for the write buffer to go below a mark."""
+    _drain_futures = None
+
+    def write_buffer_size(self):
+        return self._write_buffer_size
+
+    def wait_for_drain(self, low_water=0):
+        """Wait until the write buffer is not larger than low_water.
+
+        Args:
+            low_water (int): The buffer size to wait for.
+
+        Returns:
+            (Future): Resolved once enough buffered bytes had been written.
+        """
+        future = TracebackFuture()
+        if self._write_buffer_size <= low_water:
+            future.set_result(None)
+            return future
+
+        self._check_closed()
+        if self._drain_futures is None:
+            self._drain_futures = []
+        self._drain_futures.append((low_water, future))
+        return future
+
+    def _handle_write(self):
+        super(WriteBufferMixin, self)._handle_write()
+        if not self._drain_futures:
+            return
+
+        drain_futures = self._drain_futures
+        self._drain_futures = []
+        for low_water, future in drain_futures:
+            if self._write_buffer_size <= low_water:
+                future.set_result(None)
+            else:
+                self._drain_futures.append((low_water, future))
+
+    def _maybe_run_close_callback(self):
+        if self.closed() and self._drain_futures:
+            drain_futures, self._drain_futures = self._drain_futures, None
+            for _, future in drain_futures:
+                future.set_exception(StreamClosedError(real_error=self.error))
+        super(WriteBufferMixin, self)._maybe_run_close_callback()
+
+
+class MicroProxyIOStream(TransferMetricsMixin, WriteBufferMixin, IOStream):
+    # NOTE: seconds between peeks while only part of the bytes arrived.
+    peek_retry_interval = 0.01
 
-class MicroProxyIOStream(IOStream):
     def __init__(self, sock, **kwargs):
         super(MicroProxyIOStream, self).__init__(sock, **kwargs)
+        self._peek_future = None
+        self._peek_length = 0
+        self._peek_timeout = None
+        self._peek_retry = None
 
     def _handle_events(self, fd, events):
         if self.closed():
@@ -26,6 +104,8 @@ class MicroProxyIOStream(IOStream):
             if self.closed():
                 return
             if events & self.io_loop.READ:
+                if self._peek_future is not None and self._peek_retry is None:
+                    self._try_peek()
                 # NOTE: We use explict read instead of implicit.
                 # The reason IOStream is not idle is that when an event happened,
                 # tornado iostream will still try to read them into buffer.
@@ -49,7 +129,10 @@ class MicroProxyIOStream(IOStream):
                 state |= self.io_loop.READ
             if self.writing():
                 state |= self.io_loop.WRITE
-            if state == self.io_loop.ERROR and self._read_buffer_size == 0:
+            # NOTE: the socket stays readable while the peeked bytes are
+            # not consumed, so partial peeks are retried by timer instead.
+            if (state == self.io_loop.ERROR and self._read_buffer_size == 0 and
+                    self._peek_retry is None):
                 state |= self.io_loop.READ
             if state != self._state:
                 assert self._state is not None, \
@@ -69,41 +152,89 @@ class MicroProxyIOStream(IOStream):
         _data = self.socket.recv(1, socket.MSG_PEEK)
         return len(_data) == 0
 
-    def peek(self, length):
-        """Peek into the underline socket buffer.
+    def peek(self, length, timeout=None):
+        """Peek into the underline socket buffer without blocking the io loop.
+
+        The peeked bytes are left in the socket buffer,
+        so the following reads and tls handshake still get them.
 
         Args:
             length (int): The peeking buffer length.
+            timeout (float): Seconds to wait, None to wait forever.
 
         Returns:
-            (bytes): Bytes of buffer.
+            (Future): Bytes of buffer, empty if the stream was closed by peer.
+            Peer closing after sending part of the bytes ends up in timeout.
 
         Raises:
             ValueError: If length is not int and smaller than one
-            will raise ValueError.
+            or the stream is already peeking will raise ValueError.
+            TimeoutError: If length bytes did not arrive in time.
         """
         if not isinstance(length, int) or length < 0:
             raise ValueError("Incorrect length.")
+        if self._peek_future is not None:
+            raise ValueError("Already peeking.")
+
+        self._check_closed()
+        future = self._peek_future = TracebackFuture()
+        self._peek_length = length
+        if timeout is not None:
+            self._peek_timeout = self.io_loop.call_later(
+                timeout, self._on_peek_timeout)
+
+        self._try_peek()
+        if not future.done() and self._peek_retry is None:
+            self._add_io_state(self.io_loop.READ)
+        return future
 
-        # TODO: Change into nonblocking mode.
-        self.socket.setblocking(True)
-        while True:
-            try:
-                _data = self.socket.recv(length, socket.MSG_PEEK)
-            except socket.error:
-                continue
-            except:
-                raise
-            else:
-                return _data
-            finally:
-                self.socket.setblocking(False)
+    def _try_peek(self):
+        self._peek_retry = None
+        try:
+            _data = self.socket.recv(self._peek_length, socket.MSG_PEEK)
+        except socket.error as e:
+            if errno_from_exception(e) in (errno.EWOULDBLOCK, errno.EAGAIN):
+                return
+            self._finish_peek(exc=e)
+            return
+
+        if not _data or len(_data) >= self._peek_length:
+            self._finish_peek(data=_data)
+        else:
+            self._peek_retry = self.io_loop.call_later(
+                self.peek_retry_interval, self._try_peek)
+
+    def _on_peek_timeout(self):
+        self._peek_timeout = None
+        self._finish_peek(exc=TimeoutError("Timeout"))
+
+    def _finish_peek(self, data=None, exc=None):
+        future = self._peek_future
+        if future is None:
+            return
+
+        if self._peek_timeout is not None:
+            self.io_loop.remove_timeout(self._peek_timeout)
+        if self._peek_retry is not None:
+            self.io_loop.remove_timeout(self._peek_retry)
+        self._peek_future = self._peek_timeout = self._peek_retry = None
+
+        if exc is not None:
+            future.set_exception(exc)
+        else:
+            future.set_result(data)
+
+    def _maybe_run_close_callback(self):
+        if self.closed():
+            self._finish_peek(exc=StreamClosedError(real_error=self.error))
+        super(MicroProxyIOStream, self)._maybe_run_close_callback()
 
     def detach(self):
         if (self._read_callback or self._read_future or
                 self._write_callback or self._write_future or
                 self._connect_callback or self._connect_future or
                 self._pending_callbacks or self._closed or
+                self._peek_future is not None or
                 self._read_buffer or self._write_buffer):
             raise ValueError("IOStream is not idle; cannot detach")
         _socket = self.socket
@@ -112,7 +243,8 @@ class MicroProxyIOStream(IOStream):
         self._closed = True
         return _socket
 
-    def start_tls(self, server_side, ssl_options, server_hostname=None):
+    def start_tls(self, server_side, ssl_options, server_hostname=None,
+                  ssl_session=None):
         if not isinstance(ssl_options, SSL.Context):
             raise ValueError("ssl_options is not SSL.Context")
 
@@ -124,6 +256,8 @@ class MicroProxyIOStream(IOStream):
             _socket.set_connect_state()
             if server_hostname:
                 _socket.set_tlsext_host_name(server_hostname.encode("idna"))
+            if ssl_session:
+                _socket.set_session(ssl_session)
 
         orig_close_callback = self._close_callback
         self._close_callback = None
@@ -147,10 +281,25 @@ class MicroProxyIOStream(IOStream):
         return future
 
 
-class MicroProxySSLIOStream(SSLIOStream):
+class MicroProxySSLIOStream(TransferMetricsMixin, WriteBufferMixin, SSLIOStream):
     def __init__(self, sock, server_hostname=None, **kwargs):
         super(MicroProxySSLIOStream, self).__init__(sock, **kwargs)
         self._server_hostname = unicode(server_hostname) if server_hostname else None
+        self._before_close_callback = None
+        self.session_key = None
+
+    def set_before_close_callback(self, callback):
+        """Call callback when the stream is closed, while the socket is still open."""
+        self._before_close_callback = callback
+
+    def close_fd(self):
+        callback, self._before_close_callback = self._before_close_callback, None
+        if callback is not None:
+            try:
+                callback()
+            except Exception:
+                logger.exception("before close callback failed")
+        super(MicroProxySSLIOStream, self).close_fd()
 
     def _handle_connect(self):
         super(SSLIOStream, self)._handle_connect()
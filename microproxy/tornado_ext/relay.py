@@ -0,0 +1,142 @@
+import errno
+import socket
+from tornado.concurrent import TracebackFuture
+from tornado.ioloop import IOLoop
+from tornado.util import errno_from_exception
+
+from microproxy.log import ProxyLogger
+
+logger = ProxyLogger.get_logger(__name__)
+
+_ERRNO_WOULDBLOCK = (errno.EWOULDBLOCK, errno.EAGAIN, errno.EINTR)
+
+
+class _Pipe(object):
+    """_Pipe: One direction of the relay with a buffer reused for every chunk."""
+    def __init__(self, from_socket, to_socket, chunk_size):
+        self.from_socket = from_socket
+        self.to_socket = to_socket
+        self.buffer = memoryview(bytearray(chunk_size))
+        self.start = 0
+        self.end = 0
+        self.transferred = 0
+
+    def pending(self):
+        return self.start < self.end
+
+    def read(self):
+        """Read one chunk and try to send it right away.
+
+        Returns:
+            (bool): False if the from side was closed.
+        """
+        try:
+            self.end = self.from_socket.recv_into(self.buffer)
+        except socket.error as e:
+            if errno_from_exception(e) in _ERRNO_WOULDBLOCK:
+                return True
+            raise
+
+        if not self.end:
+            return False
+
+        self.start = 0
+        self.write()
+        return True
+
+    def write(self):
+        try:
+            sent = self.to_socket.send(self.buffer[self.start:self.end])
+        except socket.error as e:
+            if errno_from_exception(e) in _ERRNO_WOULDBLOCK:
+                return
+            raise
+
+        self.start += sent
+        self.transferred += sent
+        if not self.pending():
+            self.start = self.end = 0
+
+
+class SocketRelay(object):
+    """SocketRelay: Copy bytes between two plain sockets without iostream buffering.
+
+    Each direction stops reading while its chunk is not fully sent,
+    so the memory used is bounded by chunk_size per direction.
+    """
+    def __init__(self, src_socket, dest_socket, chunk_size=65536, io_loop=None):
+        self.io_loop = io_loop or IOLoop.current()
+        self.src_socket = src_socket
+        self.dest_socket = dest_socket
+        self.request_pipe = _Pipe(src_socket, dest_socket, chunk_size)
+        self.response_pipe = _Pipe(dest_socket, src_socket, chunk_size)
+        self.src_fd = src_socket.fileno()
+        self.dest_fd = dest_socket.fileno()
+        self.states = dict()
+        self.future = None
+
+    @property
+    def request_bytes(self):
+        return self.request_pipe.transferred
+
+    @property
+    def response_bytes(self):
+        return self.response_pipe.transferred
+
+    def run(self):
+        """Start relaying.
+
+        Returns:
+            (Future): Resolved when either side is closed.
+        """
+        self.future = TracebackFuture()
+        for sock in (self.src_socket, self.dest_socket):
+            sock.setblocking(False)
+            self.states[sock.fileno()] = self.io_loop.READ
+            self.io_loop.add_handler(
+                sock.fileno(), self._handle_events, self.io_loop.READ)
+        return self.future
+
+    def close(self):
+        for fd in self.states:
+            self.io_loop.remove_handler(fd)
+        self.states.clear()
+        self.src_socket.close()
+        self.dest_socket.close()
+
+        if self.future and not self.future.done():
+            self.future.set_result(None)
+
+    def _handle_events(self, fd, events):
+        if fd == self.src_fd:
+            read_pipe, write_pipe = self.request_pipe, self.response_pipe
+        else:
+            read_pipe, write_pipe = self.response_pipe, self.request_pipe
+
+        try:
+            if events & self.io_loop.WRITE and write_pipe.pending():
+                write_pipe.write()
+            if events & self.io_loop.READ and not read_pipe.pending():
+                if not read_pipe.read():
+                    return self.close()
+            if events & self.io_loop.ERROR:
+                return self.close()
+        except socket.error as e:
+            logger.debug("relay closed with {0}".format(e))
+            return self.close()
+
+        self._update_state()
+
+    def _update_state(self):
+        for fd, read_pipe, write_pipe in (
+                (self.src_fd, self.request_pipe, self.response_pipe),
+                (self.dest_fd, self.response_pipe, self.request_pipe)):
+            state = self.io_loop.ERROR
+            if not read_pipe.pending():
+                state |= self.io_loop.READ
+            if write_pipe.pending():
+                state |= self.io_loop.WRITE
+
+            if self.states[fd] != state:
+                self.states[fd] = state
+                self.io_loop.update_handler(fd, state)
@@ -1,4 +1,6 @@
+import time
 import zmq
+from tornado.platform.auto import monotonic_time
 from zmq.eventloop import zmqstream
 from zmq.eventloop.ioloop import IOLoop
 from OpenSSL import SSL
@@ -14,15 +16,37 @@ def curr_loop():  # pragma: no cover
     return IOLoop.current()
 
 
-def create_publish_channel(channel):  # pragma: no cover
+def monotonic():
+    """Seconds of a monotonic clock, falls back to time.time when not available.
+
+    Only meaningful to compare with other values of monotonic in the same process.
+    """
+    return monotonic_time() if monotonic_time else time.time()
+
+
+def create_publish_channel(channel, connect=False):  # pragma: no cover
     context = zmq.Context()
     socket = context.socket(zmq.PUB)
-    socket.bind(channel)
+    if connect:
+        socket.connect(channel)
+    else:
+        socket.bind(channel)
     return socket
 
 
-def create_event_channel(channel):  # pragma: no cover
+def create_event_channel(channel, connect=False):  # pragma: no cover
     context = zmq.Context()
     socket = context.socket(zmq.PULL)
-    socket.bind(channel)
+    if connect:
+        socket.connect(channel)
+    else:
+        socket.bind(channel)
+    return zmqstream.ZMQStream(socket)
+
+
+def create_broadcast_channel(channel):  # pragma: no cover
+    context = zmq.Context()
+    socket = context.socket(zmq.SUB)
+    socket.setsockopt(zmq.SUBSCRIBE, b"")
+    socket.connect(channel)
     return zmqstream.ZMQStream(socket)
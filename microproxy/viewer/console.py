@@ -3,9 +3,10 @@ import zmq
 import json
 from colored import fg, bg, attr
 
-from microproxy.context import ViewerContext, Event
+from microproxy.context import Event
 from microproxy.event import EventClient, REPLAY
 from formatter import ConsoleFormatter
+from utils import deserialize_message
 
 _formatter = ConsoleFormatter()
 
@@ -97,15 +98,20 @@ class Header(TextList):
 class Request(TextList):
     HEADER_TITLE = "Request Headers:"
     BODY_TITLE = "Request Body:"
+    TRUNCATED_BODY_TITLE = "Request Body (truncated from {0} bytes):"
     FG_COLOR = "blue"
     ATTRS = ["bold"]
 
-    def __init__(self, request, show_body=False):
+    def __init__(self, request, show_body=False, body_length=0):
         content = []
         content.append(ColorText(self.HEADER_TITLE, fg_color=self.FG_COLOR, attrs=self.ATTRS))
         content.append(Header(request.headers))
-        if show_body and request.body:
+        if show_body and body_length > len(request.body):
+            content.append(ColorText(self.TRUNCATED_BODY_TITLE.format(body_length),
+                                     fg_color=self.FG_COLOR, attrs=self.ATTRS))
+        elif show_body and request.body:
             content.append(ColorText(self.BODY_TITLE, fg_color=self.FG_COLOR, attrs=self.ATTRS))
+        if show_body and request.body:
             body = _formatter.format_body(request.body, request.headers)
             content.append(body)
         super(Request, self).__init__(content)
@@ -114,15 +120,20 @@ class Request(TextList):
 class Response(TextList):
     HEADER_TITLE = "Response Headers:"
     BODY_TITLE = "Response Body:"
+    TRUNCATED_BODY_TITLE = "Response Body (truncated from {0} bytes):"
     FG_COLOR = "blue"
     ATTRS = ["bold"]
 
-    def __init__(self, response, show_body=False):
+    def __init__(self, response, show_body=False, body_length=0):
         content = []
         content.append(ColorText(self.HEADER_TITLE, fg_color=self.FG_COLOR, attrs=self.ATTRS))
         content.append(Header(response.headers))
-        if show_body and response.body:
+        if show_body and body_length > len(response.body):
+            content.append(ColorText(self.TRUNCATED_BODY_TITLE.format(body_length),
+                                     fg_color=self.FG_COLOR, attrs=self.ATTRS))
+        elif show_body and response.body:
             content.append(ColorText(self.BODY_TITLE, fg_color=self.FG_COLOR, attrs=self.ATTRS))
+        if show_body and response.body:
             body = _formatter.format_body(response.body, response.headers)
             content.append(body)
         super(Response, self).__init__(content)
@@ -146,8 +157,11 @@ def construct_color_msg(message, verbose_level):
         return TextList([status, Request(message.request), Response(message.response)])
     elif verbose_level in ("body", "all"):
         return TextList([
-            status, Request(message.request, show_body=True),
-            Response(message.response, show_body=True)])
+            status,
+            Request(message.request, show_body=True,
+                    body_length=message.request_body_length),
+            Response(message.response, show_body=True,
+                     body_length=message.response_body_length)])
 
 
 def create_msg_channel(channel):  # pragma: no cover
@@ -189,14 +203,16 @@ def start(config):  # pragma: no cover
 
     while True:
         try:
-            topic, data = socket.recv_multipart()
-            viewer_context = ViewerContext.deserialize(json.loads(data))
-            if dump_file:
-                fp.write(data)
-                fp.write("\n")
-
-            print construct_color_msg(viewer_context, verbose_level)
-            print
+            # NOTE: messages are published in batches: [topic, msg, msg, ...]
+            frames = socket.recv_multipart()
+            for data in frames[1:]:
+                viewer_context = deserialize_message(frames[0], data)
+                if dump_file:
+                    fp.write(json.dumps(viewer_context.serialize()))
+                    fp.write("\n")
+
+                print construct_color_msg(viewer_context, verbose_level)
+                print
         except KeyboardInterrupt:
             print ColorText("Closing Simple Viewer",
                             fg_color="blue",
@@ -266,10 +266,7 @@ class Formatter(object):
         if self._is_gzip(headers):
             body = ungzip(body)
 
-        if "content-type" in headers:
-            content_type = headers["content-type"]
-        else:
-            content_type = ""
+        content_type = headers.get("content-type", "")
         content_type = content_type.split(";")[0].strip()
 
         for formatter in self.formatters:
@@ -287,10 +284,8 @@ class Formatter(object):
         raise NotImplementedError
 
     def _is_gzip(self, headers):
-        for key, value in headers:
-            if key.lower() == "content-encoding":
-                return value == "gzip"
-        return False
+        encodings = headers.getlist("content-encoding")
+        return bool(encodings) and encodings[0] == "gzip"
 
 
 class TuiFormatter(Formatter):
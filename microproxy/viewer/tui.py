@@ -1,4 +1,5 @@
 import zmq
+from functools import partial
 from zmq.eventloop import ioloop, zmqstream
 import urwid
 import json
@@ -6,9 +7,10 @@ from backports.shutil_get_terminal_size import get_terminal_size
 
 import gviewer
 
-from microproxy.context import ViewerContext, Event
+from microproxy.context import Event
 from microproxy.event import EventClient, REPLAY
 from microproxy.viewer.formatter import TuiFormatter
+from microproxy.viewer.utils import deserialize_message
 
 
 class Tui(gviewer.BaseDisplayer):
@@ -18,13 +20,22 @@ class Tui(gviewer.BaseDisplayer):
         ("indicator", "yellow", "black", "bold")
     ]
     DEFAULT_EXPORT_REPLAY_FILE = "replay.script"
+    TIMING_PHASES = [
+        ("accept", "Accept"),
+        ("connect", "Server Connect"),
+        ("dest_tls", "Server TLS Handshake"),
+        ("src_tls", "Client TLS Handshake"),
+        ("request", "Request Complete"),
+        ("response_start", "First Response Byte"),
+        ("response", "Response Complete")
+    ]
 
     def __init__(self, config, stream=None, event_loop=None):
         stream = (
             stream or
             create_msg_channel(config["viewer_channel"], "message")
         )
-        data_store = MessageAsyncDataStore(stream.on_recv)
+        data_store = MessageAsyncDataStore(partial(on_recv_messages, stream))
 
         context = gviewer.DisplayerContext(
             data_store, self, actions=gviewer.Actions([
@@ -102,8 +113,11 @@ class Tui(gviewer.BaseDisplayer):
         if request.body:
             body_list = self.formatter.format_body(
                 request.body, request.headers)
-            groups.append(gviewer.Group(
-                "Request Body", body_list))
+            title = "Request Body"
+            if message.request_body_length > len(request.body):
+                title += " (truncated from {0} bytes)".format(
+                    message.request_body_length)
+            groups.append(gviewer.Group(title, body_list))
         return gviewer.View(groups)
 
     def response_view(self, message):
@@ -121,8 +135,11 @@ class Tui(gviewer.BaseDisplayer):
         if response.body:
             body_list = self.formatter.format_body(
                 response.body, response.headers)
-            groups.append(gviewer.Group(
-                "Response Body", body_list))
+            title = "Response Body"
+            if message.response_body_length > len(response.body):
+                title += " (truncated from {0} bytes)".format(
+                    message.response_body_length)
+            groups.append(gviewer.Group(title, body_list))
         return gviewer.View(groups)
 
     def detail_view(self, message):
@@ -156,6 +173,15 @@ class Tui(gviewer.BaseDisplayer):
                     gviewer.Prop("ALPN", message.server_tls.alpn),
                 ]
             ))
+        if message.timing:
+            groups.append(gviewer.PropsGroup(
+                "Timing",
+                [
+                    gviewer.Prop(name, "{0:.1f} ms".format(message.timing[phase]))
+                    for phase, name in self.TIMING_PHASES
+                    if phase in message.timing
+                ]
+            ))
         return gviewer.View(groups)
 
     def export_replay(self, parent, message, widget, *args, **kwargs):
@@ -181,7 +207,7 @@ class Tui(gviewer.BaseDisplayer):
 
 class MessageAsyncDataStore(gviewer.AsyncDataStore):  # pragma: no cover
     def transform(self, message):
-        context = ViewerContext.deserialize(json.loads(message[1]))
+        context = deserialize_message(message[0], message[1])
         return context
 
 
@@ -210,6 +236,14 @@ class LogDisplayer(gviewer.BaseDisplayer):
         return gviewer.View([gviewer.Group("", lines)])
 
 
+def on_recv_messages(stream, callback):
+    """Register callback for each message of the batches: [topic, msg, msg, ...]."""
+    def on_recv(frames):
+        for message in frames[1:]:
+            callback([frames[0], message])
+    stream.on_recv(on_recv)
+
+
 def create_msg_channel(channel, topic):  # pragma: no cover
     context = zmq.Context()
     socket = context.socket(zmq.SUB)
@@ -1,9 +1,18 @@
-import StringIO
-import gzip
+import json
+import zlib
+
+from microproxy.context import ViewerContext
+from microproxy.context.viewer import BINARY_TOPIC
 
 
 def ungzip(content):
-    fio = StringIO.StringIO(content)
-    with gzip.GzipFile(fileobj=fio) as f:
-        decompress_content = f.read()
-    return decompress_content
+    # NOTE: decompressobj returns what it could decompress of a truncated body
+    # instead of raising.
+    return zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(content)
+
+
+def deserialize_message(topic, data):
+    """Deserialize one published message according to its topic."""
+    if topic == BINARY_TOPIC:
+        return ViewerContext.deserialize_binary(data)
+    return ViewerContext.deserialize(json.loads(data))
@@ -0,0 +1,224 @@
+"""This module runs the proxy in several worker processes sharing one listening socket.
+
+The supervisor binds the listening sockets, then forks one aggregator and
+the workers, and restarts any of them which exits abnormally.
+The aggregator owns the public viewer and events channels,
+workers publish to it and receive events from it through ipc channels.
+Each event is handled by one of the workers, except BROADCAST_EVENTS,
+which are sent to every worker.
+"""
+import errno
+import json
+import os
+import shutil
+import signal
+import tempfile
+import threading
+
+import zmq
+from tornado.netutil import bind_sockets
+
+from microproxy.event import BROADCAST_EVENTS
+from microproxy.log import ProxyLogger
+logger = ProxyLogger.get_logger(__name__)
+
+AGGREGATOR = "aggregator"
+
+
+def internal_channels(ipc_dir):
+    return ("ipc://" + os.path.join(ipc_dir, "viewer"),
+            "ipc://" + os.path.join(ipc_dir, "events"),
+            "ipc://" + os.path.join(ipc_dir, "broadcast"))
+
+
+def route_event(msg_parts, backend, broadcast):
+    try:
+        name = json.loads(msg_parts[0]).get("name")
+    except (ValueError, AttributeError):
+        # NOTE: let the worker report the wrong message.
+        name = None
+
+    if name in BROADCAST_EVENTS:
+        broadcast.send_multipart(msg_parts)
+    else:
+        backend.send_multipart(msg_parts)
+
+
+def route_events(frontend, backend, broadcast):  # pragma: no cover
+    try:
+        while True:
+            route_event(frontend.recv_multipart(), backend, broadcast)
+    except zmq.ContextTerminated:
+        pass
+
+
+def run_aggregator(config, ipc_dir):  # pragma: no cover
+    viewer_channel, events_channel, broadcast_channel = internal_channels(ipc_dir)
+    context = zmq.Context()
+
+    # NOTE: viewers subscribe to the aggregator, workers publish to it.
+    frontend = context.socket(zmq.XPUB)
+    frontend.bind(config["viewer_channel"])
+    backend = context.socket(zmq.XSUB)
+    backend.bind(viewer_channel)
+
+    # NOTE: an event is pushed to only one of the workers, or published to all of them.
+    event_frontend = context.socket(zmq.PULL)
+    event_frontend.bind(config["events_channel"])
+    event_backend = context.socket(zmq.PUSH)
+    event_backend.bind(events_channel)
+    event_broadcast = context.socket(zmq.PUB)
+    event_broadcast.bind(broadcast_channel)
+
+    event_thread = threading.Thread(
+        target=route_events, args=(event_frontend, event_backend, event_broadcast))
+    event_thread.daemon = True
+    event_thread.start()
+
+    logger.info("aggregator is publishing at {0}".format(config["viewer_channel"]))
+    try:
+        zmq.proxy(backend, frontend)
+    except (KeyboardInterrupt, zmq.ContextTerminated):
+        pass
+
+
+def run_worker(config, ipc_dir, sockets, worker_id=0):  # pragma: no cover
+    from microproxy.admin import start_admin_server
+    from microproxy.lag_monitor import start_lag_monitor
+    from microproxy.proxy import start_tcp_server
+    from microproxy.event import start_events_server
+    from microproxy.interceptor.plugin_manager import start_plugin_processes
+    from microproxy.utils import (
+        curr_loop, create_publish_channel, create_event_channel,
+        create_broadcast_channel)
+    from microproxy.server_state import init_server_state
+
+    start_plugin_processes(config, sockets)
+
+    viewer_channel, events_channel, broadcast_channel = internal_channels(ipc_dir)
+    publish_socket = create_publish_channel(viewer_channel, connect=True)
+    event_socket = create_event_channel(events_channel, connect=True)
+    broadcast_socket = create_broadcast_channel(broadcast_channel)
+
+    ProxyLogger.register_zmq_handler(publish_socket)
+
+    _server_state = init_server_state(config, publish_socket)
+
+    start_events_server(_server_state, event_socket, broadcast_socket)
+    start_tcp_server(_server_state, sockets=sockets)
+    start_admin_server(config, worker_id)
+    start_lag_monitor(config)
+
+    try:
+        curr_loop().start()
+    except KeyboardInterrupt:
+        pass
+
+
+class WorkerSupervisor(object):
+    def __init__(self, config, max_restarts=100):
+        self.config = config
+        self.workers = config["workers"]
+        self.max_restarts = max_restarts
+        self.restarts = 0
+        self.children = dict()
+        self.ipc_dir = None
+        self.sockets = None
+
+    def start(self):
+        self.ipc_dir = tempfile.mkdtemp(prefix="microproxy-")
+        if not self.config["cert_cache_dir"]:
+            # NOTE: share signed certificates between workers.
+            self.config["cert_cache_dir"] = os.path.join(self.ipc_dir, "certs")
+
+        self.sockets = bind_sockets(self.config["port"], self.config["host"])
+        logger.info("proxy server is listening at {0}:{1} with {2} workers".format(
+            self.config["host"], self.config["port"], self.workers))
+
+        signal.signal(signal.SIGTERM, self._on_sigterm)
+        try:
+            self.spawn(AGGREGATOR)
+            for worker_id in range(self.workers):
+                self.spawn(worker_id)
+            self.supervise()
+        except KeyboardInterrupt:
+            logger.info("bye")
+        finally:
+            self.stop()
+
+    def spawn(self, worker_id):
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover
+            # NOTE: never return into the supervisor code in the child.
+            exit_code = 1
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                exit_code = self.run_child(worker_id)
+            finally:
+                os._exit(exit_code)
+
+        logger.debug("start {0} with pid {1}".format(worker_id, pid))
+        self.children[pid] = worker_id
+
+    def run_child(self, worker_id):  # pragma: no cover
+        try:
+            if worker_id == AGGREGATOR:
+                run_aggregator(self.config, self.ipc_dir)
+            else:
+                run_worker(self.config, self.ipc_dir, self.sockets, worker_id)
+        except KeyboardInterrupt:
+            pass
+        except Exception as e:
+            logger.exception("{0} failed with {1}".format(worker_id, e))
+            return 1
+        return 0
+
+    def supervise(self):
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+
+            worker_id = self.children.pop(pid, None)
+            if worker_id is None:
+                continue
+
+            if os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0:
+                logger.info("{0} exited".format(worker_id))
+                continue
+
+            if self.restarts >= self.max_restarts:
+                raise RuntimeError("Too many worker restarts")
+
+            logger.warning("{0} died with status {1}, restarting".format(
+                worker_id, status))
+            self.restarts += 1
+            self.spawn(worker_id)
+
+    def _on_sigterm(self, signum, frame):
+        raise KeyboardInterrupt()
+
+    def stop(self):
+        children, self.children = self.children, dict()
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+
+        for sock in self.sockets or []:
+            sock.close()
+        if self.ipc_dir:
+            shutil.rmtree(self.ipc_dir, ignore_errors=True)
+
+
+def run_workers(config):  # pragma: no cover
+    WorkerSupervisor(config).start()
@@ -56,6 +56,7 @@ setup(
     },
     install_requires=[
         "tornado==4.3",
+        "futures==3.0.5",
         "pyzmq==15.4.0",
         "watchdog==0.8.3",
         "pyOpenSSL==16.0.0",